@@ -0,0 +1,101 @@
+# api/executors.py
+import sys
+import time
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from fastapi import HTTPException, status
+from config.config import settings
+
+print("[WALKTHROUGH] api/executors.py: Loading...")
+sys.stdout.flush()
+
+
+class BoundedExecutor:
+    """
+    Runs blocking calls for one class of endpoints on its own thread pool, so the event
+    loop never blocks and a slow dependency (Gemini, PlantUML, matplotlib) can only tie
+    up its own pool. At most `max_concurrency` calls run at once; callers that cannot
+    start within `queue_timeout` seconds get a 503 instead of piling up.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix=f"api-{name}")
+        # asyncio semaphores belong to one event loop; keep one per loop
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """ Runs func(*args, **kwargs) on this executor's pool and awaits the result. """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        with self._lock:
+            self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail=f"Server busy ({self.name}), please retry shortly.")
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        started_at = time.monotonic()
+        with self._lock:
+            self.running += 1
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            semaphore.release()
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.total_seconds += time.monotonic() - started_at
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "running": self.running,
+                "waiting": self.waiting,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_seconds": round(self.total_seconds / self.completed, 3) if self.completed else None,
+            }
+
+
+# One pool per class of blocking work
+db_executor = BoundedExecutor(
+    "db", settings.API_DB_CONCURRENCY, settings.API_QUEUE_TIMEOUT_SECONDS)
+llm_executor = BoundedExecutor(
+    "llm", settings.API_LLM_CONCURRENCY, settings.API_QUEUE_TIMEOUT_SECONDS)
+# matplotlib's pyplot state is global, so rendering defaults to a single thread
+render_executor = BoundedExecutor(
+    "render", settings.API_RENDER_CONCURRENCY, settings.API_QUEUE_TIMEOUT_SECONDS)
+http_executor = BoundedExecutor(
+    "http", settings.API_HTTP_CONCURRENCY, settings.API_QUEUE_TIMEOUT_SECONDS)
+
+
+def get_metrics() -> Dict[str, Any]:
+    return {executor.name: executor.get_metrics()
+            for executor in (db_executor, llm_executor, render_executor, http_executor)}
+
+
+print("[WALKTHROUGH] api/executors.py: Finished loading.")
+sys.stdout.flush()
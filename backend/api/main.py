@@ -1,5 +1,5 @@
 # api/main.py
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Query, status
 from pydantic import BaseModel  # Import BaseModel directly
 # Import the Celery app instance from the root level
 from worker.celery_app import celery
@@ -7,16 +7,27 @@ from worker.celery_app import celery
 from worker.analysis_task import run_codelore_analysis
 # Import supabase client function for polling results
 import supabase_client
+from config.config import settings
 # Import helpers from services
 from services import github_api, llm_handler, code_parser
 from services import graph_generator  # Add import for graph generator service
 from services import uml_generator  # Add import for UML generator service
+from services import result_artifacts, pubsub, derived_artifacts, plantuml_renderer, llm_cache, llm_gateway, llm_backend, worker_metrics
+# Blocking calls (Supabase, Gemini, matplotlib, HTTP) run on bounded pools, never on the event loop
+from api.executors import db_executor, llm_executor, render_executor, http_executor
+from api import executors
 
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response, StreamingResponse
 import sys
+import json
+import contextlib
+import re
+import time
+import asyncio
+import base64
 import logging
-from typing import Optional
+from typing import Optional, List, Tuple
 import os
 import requests
 
@@ -54,6 +65,17 @@ class UmlRequest(BaseModel):
     repo_url: str
     task_id: str
 
+
+class ComponentRef(BaseModel):
+    component_name: str
+    component_type: str  # 'class' or 'function'
+
+
+class ComponentBatchRequest(BaseModel):
+    repo_url: str
+    components: List[ComponentRef]
+    context: dict = {}  # Shared by all components (imports, detected_frameworks)
+
 # Add new model for GitHub OAuth
 
 
@@ -66,12 +88,20 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+@contextlib.asynccontextmanager
+async def lifespan(current_app: FastAPI):
+    # Workers publish their GitHub rate limit and HTTP cache metrics; see services/worker_metrics.py
+    worker_metrics.metrics_collector.start()
+    yield
+
+
 def create_app() -> FastAPI:
     """ Create and configure the FastAPI application. """
     print("[WALKTHROUGH] api/main.py: Creating FastAPI app...")
     sys.stdout.flush()
     current_app = FastAPI(
-        title="CodeLore API", description="API for analyzing Git repos (via API) and generating narratives.")
+        title="CodeLore API", description="API for analyzing Git repos (via API) and generating narratives.",
+        lifespan=lifespan)
 
     current_app.add_middleware(
         CORSMiddleware,
@@ -99,6 +129,26 @@ async def read_root():
     return {"message": "CodeLore Backend Running (Modular API Version)"}
 
 
+@app.get("/metrics", tags=["General"])
+async def get_metrics():
+    """
+    Runtime metrics for this API process, plus the GitHub rate limit budget and HTTP
+    cache counts last reported by the worker processes.
+    """
+    workers = worker_metrics.metrics_collector.get_metrics()
+    return {
+        "github_rate_limit": workers["github_rate_limit"],
+        "github_http_cache": workers["github_http_cache"],
+        "reporting_workers": workers["reporting_processes"],
+        "api_executors": executors.get_metrics(),
+        "derived_artifacts": derived_artifacts.get_metrics(),
+        "plantuml_renderer": plantuml_renderer.get_renderer().get_metrics(),
+        "llm_cache": llm_cache.get_metrics(),
+        "llm_gateway": llm_gateway.llm_gateway.get_metrics(),
+        "llm_backend": llm_backend.get_backend().get_metrics(),
+    }
+
+
 @app.post("/analyze", status_code=status.HTTP_202_ACCEPTED, tags=["Analysis"])
 async def submit_analysis(request: RepoInput):
     """ Endpoint to submit a Git repository URL for analysis. """
@@ -116,7 +166,8 @@ async def submit_analysis(request: RepoInput):
             f"[WALKTHROUGH] api/main.py: Sending task for {repo_url} to Celery...")
         sys.stdout.flush()
         # Use apply_async for more control or delay as shortcut
-        task = run_codelore_analysis.apply_async(args=[repo_url, user_token])
+        task = await db_executor.run(
+            run_codelore_analysis.apply_async, args=[repo_url, user_token])
 
         print("taskid: ", task.id)
 
@@ -127,7 +178,7 @@ async def submit_analysis(request: RepoInput):
 
         # --- Save initial PENDING state to Supabase ---
         # This allows polling immediately even before the worker picks up the task
-        supabase_client.save_analysis_to_supabase({
+        await db_executor.run(supabase_client.save_analysis_to_supabase, {
             "task_id": task_id,
             "repo_url": repo_url,
             "status": "PENDING",  # Or "STARTED" if task_track_started=True
@@ -142,6 +193,8 @@ async def submit_analysis(request: RepoInput):
             content={"message": "Analysis task submitted.",
                      "task_id": task_id, "status": "PENDING"},
         )
+    except HTTPException as e:
+        raise e
     except Exception as e:
         # Handle potential errors during task submission (e.g., broker down)
         print(
@@ -152,20 +205,90 @@ async def submit_analysis(request: RepoInput):
                             detail="Failed to submit analysis task to the queue.")
 
 
-# Uncommented and adapted for Supabase polling
+# Row columns that can be requested with ?fields=; any other name is a result sub-field
+RESULT_ROW_COLUMNS = ("task_id", "repo_url", "status", "state", "progress", "error", "result")
+FIELD_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+# Lists that can be paged with GET /result/{task_id}/items/{list_name}
+PAGINATED_RESULT_LISTS = {
+    "repo_tree": ("repo_tree",),
+    "analyzed_files_list": ("analysis_details", "code_analysis", "analyzed_files_list"),
+}
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+def _parse_result_fields(fields: str) -> Tuple[List[str], List[Tuple[str, ...]]]:
+    """
+    Splits ?fields= into row columns and result paths. "narrative", "result.narrative"
+    and "analysis_details.latest_commit" all address parts of the stored result.
+    """
+    columns, result_paths = [], []
+    for field in (part.strip() for part in fields.split(",")):
+        if not field:
+            continue
+        if not FIELD_NAME_PATTERN.match(field):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Invalid field name: {field}")
+        if field in RESULT_ROW_COLUMNS:
+            columns.append(field)
+            continue
+        path = tuple(field.split("."))
+        if path[0] == "result":
+            path = path[1:]
+        result_paths.append(path)
+    if "result" in columns:
+        result_paths = []  # The whole result was asked for
+    return columns, result_paths
+
+
+def _encode_cursor(list_name: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{list_name}:{offset}".encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(list_name: str, cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    try:
+        name, offset = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit(":", 1)
+        if name == list_name and int(offset) >= 0:
+            return int(offset)
+    except Exception:
+        pass
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+
+
 @app.get("/result/{task_id}", tags=["Analysis"])
-async def get_analysis_result(task_id: str):
+async def get_analysis_result(task_id: str, fields: Optional[str] = None):
     """
     Poll this endpoint to get the status and result of an analysis task
     by querying the Supabase database.
+
+    `fields` limits the response to the given columns and result sub-fields, e.g.
+    `fields=status,progress,state` while polling or `fields=status,narrative,title`.
+    The selection is pushed down to Supabase, so unrequested parts are never read.
     """
-    print(f"[WALKTHROUGH] api/main.py: GET /result/{task_id} called.")
+    print(f"[WALKTHROUGH] api/main.py: GET /result/{task_id} called (fields={fields}).")
     sys.stdout.flush()
 
-    # Query Supabase for the task record
-    db_record = supabase_client.get_analysis_from_supabase(task_id)[0]
+    if fields:
+        columns, result_paths = _parse_result_fields(fields)
+        if not columns and not result_paths:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="No fields requested.")
+        response_data = await db_executor.run(
+            result_artifacts.load_result_fields, task_id, [column for column in columns if column != "result"], result_paths)
+        if not response_data:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f"Analysis task with ID {task_id} not found.")
+        if "result" in columns:
+            row = await db_executor.run(supabase_client.get_analysis_columns, task_id, "result") or {}
+            response_data["result"] = await db_executor.run(
+                result_artifacts.load_result_artifacts, row.get("result"))
+        return JSONResponse(content=response_data)
 
-    print(f"[WALKTHROUGH] api/main.py: Supabase query result: {db_record}")
+    # Query Supabase for the task record
+    db_records = await db_executor.run(supabase_client.get_analysis_from_supabase, task_id)
+    db_record = db_records[0] if db_records else None
 
     if not db_record:
         print(
@@ -180,7 +303,9 @@ async def get_analysis_result(task_id: str):
 
     task_status = db_record.get("status")
     # This holds the payload or error info
-    task_result_data = db_record.get("result")
+    # Heavy parts (repo tree, full repo info, code lists) are stored out of line
+    task_result_data = await db_executor.run(
+        result_artifacts.load_result_artifacts, db_record.get("result"))
 
     response_data = {
         "task_id": task_id,
@@ -196,6 +321,118 @@ async def get_analysis_result(task_id: str):
     return JSONResponse(content=response_data)
 
 
+@app.get("/result/{task_id}/items/{list_name}", tags=["Analysis"])
+async def get_analysis_result_items(task_id: str, list_name: str, cursor: Optional[str] = None,
+                                    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    """
+    Pages through a large list of a finished analysis (`repo_tree` or `analyzed_files_list`).
+    Pass the returned `next_cursor` to get the following page; it is null on the last page.
+    """
+    print(
+        f"[WALKTHROUGH] api/main.py: GET /result/{task_id}/items/{list_name} called.")
+    sys.stdout.flush()
+
+    path = PAGINATED_RESULT_LISTS.get(list_name)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Unknown list '{list_name}'. Available: {', '.join(PAGINATED_RESULT_LISTS)}")
+    offset = _decode_cursor(list_name, cursor)
+    response_data = await db_executor.run(
+        result_artifacts.load_result_fields, task_id, ["status"], [path])
+    if not response_data:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Analysis task with ID {task_id} not found.")
+
+    items = response_data.get("result") or {}
+    for key in path:
+        items = items.get(key) if isinstance(items, dict) else None
+    items = items or []
+    page = items[offset:offset + limit]
+    next_offset = offset + len(page)
+    return JSONResponse(content={
+        "task_id": task_id,
+        "status": response_data.get("status"),
+        "list": list_name,
+        "total": len(items),
+        "items": page,
+        "next_cursor": _encode_cursor(list_name, next_offset) if next_offset < len(items) else None,
+    })
+
+
+PROGRESS_COLUMNS = "task_id,status,state,progress,error"
+
+
+def _progress_event(row: dict) -> dict:
+    event = {column: row.get(column) for column in ("task_id", "status", "state", "progress", "error")}
+    event["done"] = event["status"] in ("SUCCESS", "FAILURE")
+    return event
+
+
+@app.get("/result/{task_id}/stream", tags=["Analysis"])
+async def stream_analysis_progress(task_id: str):
+    """
+    Server-Sent Events stream of an analysis task's progress, replacing polling.
+    Sends the current state first, then every status/state/progress change published
+    by the worker, and ends after SUCCESS or FAILURE. Fetch the result afterwards.
+    While the narrative is generated, "narrative" events carry its text so far.
+    """
+    print(f"[WALKTHROUGH] api/main.py: GET /result/{task_id}/stream called.")
+    sys.stdout.flush()
+
+    broker = pubsub.get_broker()
+    # Subscribe before reading the row so no transition falls in between
+    subscription = broker.subscribe(pubsub.progress_channel(task_id)) if broker else None
+    try:
+        row = await db_executor.run(supabase_client.get_analysis_columns, task_id, PROGRESS_COLUMNS)
+    except HTTPException:
+        if subscription:
+            subscription.close()
+        raise
+    except Exception:
+        row = None
+    if not row:
+        if subscription:
+            subscription.close()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Analysis task with ID {task_id} not found.")
+
+    async def events():
+        try:
+            event = _progress_event(row)
+            yield pubsub.format_sse(event, "progress")
+            quiet_since = time.monotonic()
+            while not event["done"]:
+                if subscription:
+                    message = await subscription.get_async(1.0)
+                else:
+                    message = None
+                    await asyncio.sleep(1.0)
+                if message and message.get("type") == "narrative":
+                    yield pubsub.format_sse(message, "narrative")
+                    quiet_since = time.monotonic()
+                elif message:
+                    event = message
+                    yield pubsub.format_sse(event, "progress")
+                    quiet_since = time.monotonic()
+                elif time.monotonic() - quiet_since >= settings.PROGRESS_STREAM_HEARTBEAT_SECONDS:
+                    # Nothing heard for a while: re-read the row in case events were missed
+                    latest = await db_executor.run(
+                        supabase_client.get_analysis_columns, task_id, PROGRESS_COLUMNS)
+                    latest_event = _progress_event(latest or {})
+                    if latest and latest_event != event:
+                        event = latest_event
+                        yield pubsub.format_sse(event, "progress")
+                    else:
+                        yield ": keep-alive\n\n"
+                    quiet_since = time.monotonic()
+        finally:
+            if subscription:
+                subscription.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.post("/component-details", tags=["Analysis"])
 async def get_component_details(request: CodeComponentRequest):
     """
@@ -210,7 +447,8 @@ async def get_component_details(request: CodeComponentRequest):
         # Import the LLM handler function here to avoid circular imports
         from services.llm_handler import generate_component_description
 
-        result = generate_component_description(
+        result = await llm_executor.run(
+            generate_component_description,
             component_name=request.component_name,
             component_type=request.component_type,
             repo_url=request.repo_url,
@@ -223,6 +461,8 @@ async def get_component_details(request: CodeComponentRequest):
             content=result
         )
 
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(
             f"[WALKTHROUGH] api/main.py: ERROR generating component details: {e}")
@@ -235,6 +475,29 @@ async def get_component_details(request: CodeComponentRequest):
         )
 
 
+async def _load_render_input(task_id: str) -> dict:
+    """ Loads the analysis result that graphs and UML diagrams are rendered from. """
+    # Get the stored analysis data from Supabase
+    response = await db_executor.run(supabase_client.get_analysis_data, task_id)
+    if not response or not response.data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Analysis data not found for task ID: {task_id}"
+        )
+
+    # Graphs and UML only need the code analysis lists, not the tree or repo info
+    analysis_data = await db_executor.run(
+        result_artifacts.load_result_artifacts, response.data[0].get('result', {}),
+        derived_artifacts.REQUIRED_RESULT_ARTIFACTS)
+
+    if not analysis_data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No analysis results found for task ID: {task_id}"
+        )
+    return analysis_data
+
+
 @app.post("/repo-graphs", tags=["Analysis"])
 async def get_repository_graphs(request: GraphRequest):
     """
@@ -245,30 +508,18 @@ async def get_repository_graphs(request: GraphRequest):
     sys.stdout.flush()
 
     try:
-        # Get the stored analysis data from Supabase
-        response = supabase_client.get_analysis_data(request.task_id)
-        if not response or not response.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Analysis data not found for task ID: {request.task_id}"
-            )
-
-        # Get the analysis results from the response
-        analysis_data = response.data[0].get('result', {})
-
-        if not analysis_data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"No analysis results found for task ID: {request.task_id}"
-            )
+        analysis_data = await _load_render_input(request.task_id)
 
-        # Generate all graphs
-        graph_data = graph_generator.generate_all_graphs(analysis_data)
+        # Serve the graphs rendered by the worker, or render them once now
+        graph_json = await db_executor.run(derived_artifacts.load_stored, "graphs", analysis_data)
+        if graph_json is None:
+            graph_json = await render_executor.run(derived_artifacts.get_or_generate, "graphs", analysis_data)
 
-        # Return the graph data
-        return JSONResponse(
+        # Return the stored JSON as is
+        return Response(
             status_code=status.HTTP_200_OK,
-            content=graph_data
+            content=graph_json,
+            media_type="application/json"
         )
 
     except HTTPException as e:
@@ -296,30 +547,18 @@ async def get_repository_uml(request: UmlRequest):
     sys.stdout.flush()
 
     try:
-        # Get the stored analysis data from Supabase
-        response = supabase_client.get_analysis_data(request.task_id)
-        if not response or not response.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Analysis data not found for task ID: {request.task_id}"
-            )
+        analysis_data = await _load_render_input(request.task_id)
 
-        # Get the analysis results from the response
-        analysis_data = response.data[0].get('result', {})
+        # Serve the diagrams generated by the worker, or generate them once now
+        uml_json = await db_executor.run(derived_artifacts.load_stored, "uml", analysis_data)
+        if uml_json is None:
+            uml_json = await llm_executor.run(derived_artifacts.get_or_generate, "uml", analysis_data)
 
-        if not analysis_data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"No analysis results found for task ID: {request.task_id}"
-            )
-
-        # Generate UML diagrams
-        uml_data = uml_generator.generate_all_uml_diagrams(analysis_data)
-
-        # Return the UML diagram data
-        return JSONResponse(
+        # Return the stored JSON as is
+        return Response(
             status_code=status.HTTP_200_OK,
-            content=uml_data
+            content=uml_json,
+            media_type="application/json"
         )
 
     except HTTPException as e:
@@ -335,6 +574,109 @@ async def get_repository_uml(request: UmlRequest):
         )
 
 
+@app.post("/component-details/batch", tags=["Analysis"])
+async def get_component_details_batch(request: ComponentBatchRequest):
+    """
+    Server-Sent Events variant of /component-details for many components: cached
+    descriptions are sent first, the rest are packed into as few Gemini calls as the
+    token budgets allow and sent as each call completes. Each description is a
+    `component` event ({"component_name", "component_type", "result", "cached"}), followed
+    by a `done` event.
+    """
+    print(
+        f"[WALKTHROUGH] api/main.py: POST /component-details/batch called for {len(request.components)} components")
+    sys.stdout.flush()
+
+    components, seen = [], set()
+    for component in request.components:
+        identity = (component.component_type.lower(), component.component_name)
+        if identity not in seen:
+            seen.add(identity)
+            components.append({"component_name": component.component_name,
+                               "component_type": component.component_type})
+    if len(components) > settings.COMPONENT_BATCH_MAX_COMPONENTS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"At most {settings.COMPONENT_BATCH_MAX_COMPONENTS} components per request.")
+
+    cached = await db_executor.run(llm_handler.lookup_component_descriptions, request.repo_url, components)
+    pending = [component for position, component in enumerate(components) if position not in cached]
+    batches = llm_handler.plan_component_batches(pending, request.repo_url, request.context)
+
+    async def describe(batch):
+        try:
+            return await llm_executor.run(
+                llm_handler.describe_component_batch, batch, request.repo_url, request.context)
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else e
+            return [(component, llm_handler.component_error(
+                component["component_type"], component["component_name"], detail)) for component in batch]
+
+    def component_event(component, result, from_cache):
+        return pubsub.format_sse(dict(component, result=result, cached=from_cache), "component")
+
+    async def events():
+        for position, result in sorted(cached.items()):
+            yield component_event(components[position], result, True)
+        tasks = [asyncio.ensure_future(describe(batch)) for batch in batches]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                for component, result in await finished:
+                    yield component_event(component, result, False)
+        finally:
+            for task in tasks:
+                task.cancel()
+        yield pubsub.format_sse({"done": True, "components": len(components), "cached": len(cached),
+                                 "batches": len(batches)}, "done")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/repo-uml/stream", tags=["Analysis"])
+async def stream_repository_uml(request: UmlRequest):
+    """
+    Server-Sent Events variant of /repo-uml: sends each diagram as a `diagram` event
+    ({"name", "diagram"}) as soon as it is ready, then a `done` event.
+    """
+    print(
+        f"[WALKTHROUGH] api/main.py: POST /repo-uml/stream called for task_id: {request.task_id}")
+    sys.stdout.flush()
+
+    analysis_data = await _load_render_input(request.task_id)
+    stored = await db_executor.run(derived_artifacts.load_stored, "uml", analysis_data)
+
+    async def events():
+        if stored is not None:
+            for name, diagram in json.loads(stored).items():
+                yield pubsub.format_sse({"name": name, "diagram": diagram}, "diagram")
+            yield pubsub.format_sse({"done": True}, "done")
+            return
+        # Concurrent streams of the same inputs share one generation, which also stores the output
+        reader = derived_artifacts.stream_parts("uml", analysis_data)
+        try:
+            while True:
+                # Each step only waits for the next diagram; the work runs on the generation's threads
+                item = await llm_executor.run(reader.next_part)
+                if item is None:
+                    break
+                name, diagram = item
+                yield pubsub.format_sse({"name": name, "diagram": diagram}, "diagram")
+        except HTTPException as e:
+            yield pubsub.format_sse({"error": e.detail}, "error")
+            return
+        except Exception as e:
+            logger.error(f"Failed to stream UML diagrams: {e}", exc_info=True)
+            yield pubsub.format_sse({"error": str(e)}, "error")
+            return
+        finally:
+            # Also runs when the client disconnects; frees a pool thread blocked on the next diagram
+            reader.close()
+        yield pubsub.format_sse({"done": True}, "done")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.post("/auth/github", tags=["Authentication"])
 async def github_oauth(request: GitHubOAuthRequest):
     """
@@ -355,14 +697,16 @@ async def github_oauth(request: GitHubOAuthRequest):
 
         # Exchange code for token
         token_url = "https://github.com/login/oauth/access_token"
-        response = requests.post(
+        response = await http_executor.run(
+            requests.post,
             token_url,
             headers={"Accept": "application/json"},
             data={
                 "client_id": github_client_id,
                 "client_secret": github_client_secret,
                 "code": request.code
-            }
+            },
+            timeout=15
         )
 
         response.raise_for_status()
@@ -0,0 +1,138 @@
+# benchmarks/api_load_test.py
+"""
+Mixed-traffic load test for the API: many cheap polls of GET /result/{task_id} while
+slow LLM and rendering endpoints are being hit. Reports poll latency percentiles
+with and without the slow traffic; they should stay close if nothing blocks the event loop.
+
+By default the app runs in-process with simulated dependencies (Supabase, Gemini and
+matplotlib replaced by sleeps), so no credentials are needed. Pass --url to load a real
+server instead (with a real --task-id).
+
+Usage (from backend/):
+    python -m benchmarks.api_load_test [--polls 400] [--slow 40] [--concurrency 50]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "load-test")
+os.environ.setdefault("DERIVED_ARTIFACTS_ENABLED", "false")  # Render on every request
+
+import httpx
+
+DB_SECONDS = 0.02
+LLM_SECONDS = 2.0
+RENDER_SECONDS = 0.5
+
+
+def _simulate_dependencies() -> None:
+    """ Replaces external calls with sleeps of realistic duration. """
+    import supabase_client
+    from services import llm_handler, graph_generator
+
+    row = {"task_id": "load-test", "status": "SUCCESS", "progress": 100, "state": "done", "error": None,
+           "result": {"title": "repo", "narrative": "...", "file_type_distribution": {"py": 1},
+                      "analysis_details": {"code_analysis": {"unique_classes": [], "unique_functions": [],
+                                                             "unique_imports": []}}}}
+
+    class Response:
+        data = [row]
+
+    def get_analysis_from_supabase(task_id):
+        time.sleep(DB_SECONDS)
+        return [row]
+
+    def get_analysis_data(task_id):
+        time.sleep(DB_SECONDS)
+        return Response()
+
+    def generate_component_description(**kwargs):
+        time.sleep(LLM_SECONDS)
+        return {"description": "simulated"}
+
+    def generate_all_graphs(analysis_data):
+        time.sleep(RENDER_SECONDS)
+        return {}
+
+    supabase_client.get_analysis_from_supabase = get_analysis_from_supabase
+    supabase_client.get_analysis_data = get_analysis_data
+    llm_handler.generate_component_description = generate_component_description
+    graph_generator.generate_all_graphs = generate_all_graphs
+
+
+async def _timed(client: httpx.AsyncClient, method: str, url: str, **kwargs):
+    started_at = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    return time.perf_counter() - started_at, response.status_code
+
+
+async def _poll_latencies(client: httpx.AsyncClient, task_id: str, polls: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def poll():
+        async with semaphore:
+            return await _timed(client, "GET", f"/result/{task_id}")
+
+    results = await asyncio.gather(*(poll() for _ in range(polls)))
+    return [latency for latency, _ in results], [code for _, code in results]
+
+
+async def _slow_requests(client: httpx.AsyncClient, task_id: str, count: int):
+    requests = []
+    for index in range(count):
+        if index % 2:
+            requests.append(_timed(client, "POST", "/component-details", json={
+                "component_name": "Foo", "component_type": "class",
+                "repo_url": "https://github.com/o/r", "context": {}}))
+        else:
+            requests.append(_timed(client, "POST", "/repo-graphs", json={
+                "repo_url": "https://github.com/o/r", "task_id": task_id}))
+    return await asyncio.gather(*requests)
+
+
+def _report(label: str, latencies, codes) -> None:
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000
+    errors = sum(1 for code in codes if code >= 400)
+    print(f"{label:<28} n={len(ordered):<5} p50={pick(0.50):7.1f}ms  p95={pick(0.95):7.1f}ms  "
+          f"p99={pick(0.99):7.1f}ms  max={ordered[-1] * 1000:7.1f}ms  mean={statistics.mean(ordered) * 1000:7.1f}ms  errors={errors}")
+
+
+async def main_async(args) -> None:
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=120)
+    else:
+        _simulate_dependencies()
+        from api.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                   base_url="http://load-test", timeout=120)
+    async with client:
+        latencies, codes = await _poll_latencies(client, args.task_id, args.polls, args.concurrency)
+        _report("polls only", latencies, codes)
+
+        slow = asyncio.ensure_future(_slow_requests(client, args.task_id, args.slow))
+        await asyncio.sleep(0.1)  # Let the slow requests occupy their pools first
+        latencies, codes = await _poll_latencies(client, args.task_id, args.polls, args.concurrency)
+        _report("polls + slow LLM/render", latencies, codes)
+        slow_results = await slow
+        _report("slow requests", [latency for latency, _ in slow_results],
+                [code for _, code in slow_results])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="Base URL of a running API (default: in-process with simulated dependencies)")
+    parser.add_argument("--task-id", default="load-test")
+    parser.add_argument("--polls", type=int, default=400)
+    parser.add_argument("--slow", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# benchmarks/llm_pipeline_benchmark.py
+"""
+Offline benchmark of the LLM-bound pipeline on the fake LLM backend (LLM_BACKEND=fake,
+see services/llm_backend.py): no network, API key or Supabase needed.
+
+- Tasks: the worker's LLM stages per analysis (streamed narrative, then the UML
+  diagrams) on synthetic, distinct repositories, run by --workers threads like Celery
+  worker slots. Reports task throughput and latency.
+- API: POST /component-details requests for distinct components through the in-process
+  app. Reports latency percentiles.
+Both run alone, then together; worker and API share one process here, so they share
+one LLM gateway and interactive requests should overtake queued task calls.
+The LLM cache is disabled so every call reaches the backend.
+
+Usage (from backend/):
+    python -m benchmarks.llm_pipeline_benchmark [--tasks 20] [--workers 4] [--requests 40]
+        [--concurrency 8] [--latency 0.5] [--tokens-per-second 200]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "load-test")
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ.setdefault("PUBSUB_BACKEND", "memory")
+
+import httpx
+
+from benchmarks.api_load_test import _report, _timed
+
+
+def _analysis_data(index: int) -> dict:
+    functions = [f"handle_{index}_{i}" for i in range(30)]
+    classes = [f"Service{index}x{i}" for i in range(10)]
+    imports = ["os", "json", "requests", f"pkg{index}.models"]
+    return {
+        "owner": "bench", "repo_name": f"repo{index}",
+        "latest_commit": {"author": "bench", "date": "2024-01-01", "message": f"Commit {index}"},
+        "detected_frameworks": ["FastAPI"],
+        "code_analysis": {"unique_functions": functions, "unique_classes": classes, "unique_imports": imports,
+                          "files_analyzed_count": 40, "lines_analyzed_count": 4000},
+        "analysis_details": {"code_analysis": {"unique_functions": functions, "unique_classes": classes,
+                                               "unique_imports": imports}},
+        "file_type_distribution": {"py": 40},
+    }
+
+
+def _run_task(index: int) -> float:
+    """ The LLM stages of one analysis; returns its duration. """
+    from services import llm_handler, uml_generator
+
+    started_at = time.perf_counter()
+    data = _analysis_data(index)
+    llm_handler.generate_narrative(data, f"https://github.com/bench/repo{index}", on_chunk=lambda text: None)
+    diagrams = uml_generator.generate_all_uml_diagrams(data)
+    if diagrams.get("error"):
+        raise RuntimeError(diagrams["error"])
+    return time.perf_counter() - started_at
+
+
+def _run_tasks(count: int, workers: int, offset: int):
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        durations = list(pool.map(_run_task, range(offset, offset + count)))
+    return durations, time.perf_counter() - started_at
+
+
+async def _api_requests(client: httpx.AsyncClient, count: int, concurrency: int, offset: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(index: int):
+        async with semaphore:
+            return await _timed(client, "POST", "/component-details", json={
+                "component_name": f"Component{index}", "component_type": "class" if index % 2 else "function",
+                "repo_url": "https://github.com/bench/api", "context": {"imports": ["os", "json"]}})
+
+    return await asyncio.gather(*(request(index) for index in range(offset, offset + count)))
+
+
+def _report_tasks(label: str, durations, elapsed: float) -> None:
+    print(f"{label:<28} throughput={len(durations) / elapsed:6.2f} tasks/s  wall={elapsed:6.1f}s")
+    _report(f"{label} (latency)", durations, [200] * len(durations))
+
+
+async def main_async(args) -> None:
+    from api.main import app
+    from services import llm_gateway, llm_backend, plantuml_renderer
+
+    class _NoRender(plantuml_renderer.PlantUMLRenderer):
+        def render(self, uml_code: str, fmt: str = "png") -> bytes:
+            return b"\x89PNG"
+
+    plantuml_renderer.set_renderer(_NoRender())
+    loop = asyncio.get_running_loop()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300)
+    async with client:
+        durations, elapsed = await loop.run_in_executor(None, _run_tasks, args.tasks, args.workers, 0)
+        _report_tasks("tasks only", durations, elapsed)
+
+        results = await _api_requests(client, args.requests, args.concurrency, 0)
+        _report("api only", [latency for latency, _ in results], [code for _, code in results])
+
+        tasks = loop.run_in_executor(None, _run_tasks, args.tasks, args.workers, args.tasks)
+        await asyncio.sleep(args.latency)  # Let the tasks fill the gateway first
+        results = await _api_requests(client, args.requests, args.concurrency, args.requests)
+        durations, elapsed = await tasks
+        _report("api + tasks", [latency for latency, _ in results], [code for _, code in results])
+        _report_tasks("tasks + api", durations, elapsed)
+
+    gateway = llm_gateway.llm_gateway.get_metrics()
+    print(f"gateway waits: {gateway['waits']}  retries={gateway['retries']}")
+    print(f"backend: {llm_backend.get_backend().get_metrics()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent tasks, like Celery worker slots")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent API clients")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake LLM seconds until the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="Fake LLM output speed")
+    args = parser.parse_args()
+    # Read by config.config when the services are first imported
+    os.environ["FAKE_LLM_LATENCY_SECONDS"] = str(args.latency)
+    os.environ["FAKE_LLM_TOKENS_PER_SECOND"] = str(args.tokens_per_second)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
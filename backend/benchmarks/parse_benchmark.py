@@ -0,0 +1,79 @@
+# benchmarks/parse_benchmark.py
+"""
+Measures code_parser.analyze_files_batch throughput on synthetic Python and Java files
+for an increasing number of parse processes.
+
+Usage (from backend/):
+    python -m benchmarks.parse_benchmark [--files 2000] [--max-workers N]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import settings
+from services import code_parser
+
+
+def _python_source(index: int, functions: int = 40) -> str:
+    lines = ["import os", "import json", "from typing import Dict, List", ""]
+    lines.append(f"class Model{index}:")
+    for i in range(functions):
+        lines += [f"    def method_{i}(self, value: int) -> Dict[str, int]:",
+                  f"        result = {{'value': value * {i}}}",
+                  "        for key in list(result):",
+                  "            result[key] += len(json.dumps(result))",
+                  "        return result", ""]
+    return "\n".join(lines)
+
+
+def _java_source(index: int, methods: int = 40) -> str:
+    lines = ["package com.example.bench;", "", "import java.util.List;",
+             "import org.springframework.stereotype.Service;", "", "@Service",
+             f"public class Service{index} {{"]
+    for i in range(methods):
+        lines += [f"    /* method {i} */", f"    public int method{i}(int value) throws Exception {{",
+                  f"        return value * {i}; // multiply", "    }", ""]
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def build_files(count: int):
+    return [(f"pkg/module_{i}.py", "python", _python_source(i)) if i % 2 == 0
+            else (f"src/Service{i}.java", "java", _java_source(i)) for i in range(count)]
+
+
+def run(files, workers: int) -> float:
+    settings.PARSE_WORKERS = workers
+    code_parser._discard_parse_pool()
+    # Warm up the pool so process start-up is not part of the measurement
+    code_parser.analyze_files_batch(files[:settings.PARSE_POOL_MIN_BATCH])
+    started_at = time.perf_counter()
+    results = code_parser.analyze_files_batch(files)
+    elapsed = time.perf_counter() - started_at
+    assert len(results) == len(files) and all(results.values())
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    files = build_files(args.files)
+    total_mb = sum(len(content) for _, _, content in files) / (1024 * 1024)
+    print(f"{len(files)} files, {total_mb:.1f} MB, {os.cpu_count()} CPUs")
+    worker_counts = sorted({1, *(2 ** i for i in range(1, 8) if 2 ** i <= args.max_workers), args.max_workers})
+    baseline = None
+    for workers in worker_counts:
+        elapsed = run(files, workers)
+        baseline = baseline or elapsed
+        print(f"workers={workers:<3} {elapsed:7.2f}s  {len(files) / elapsed:8.1f} files/s  speedup x{baseline / elapsed:.2f}")
+    code_parser._discard_parse_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,6 +15,117 @@ class Settings:
     RABBITMQ_BROKER_URL = os.getenv("RABBITMQ_BROKER_URL")
     CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
     SUPABASE_ANALYSIS_TABLE = "repo_analysis"
+    # Heavy result parts (repo tree, full repo info, code analysis lists) are stored here
+    SUPABASE_ARTIFACTS_TABLE = os.getenv("SUPABASE_ARTIFACTS_TABLE", "repo_analysis_artifacts")
+    RESULT_ARTIFACTS_ENABLED = os.getenv("RESULT_ARTIFACTS_ENABLED", "true").lower() == "true"
+    ARTIFACT_CACHE_ENTRIES = int(os.getenv("ARTIFACT_CACHE_ENTRIES", "32"))  # Decoded artifacts kept per API process
+    # Graphs and UML rendered from a result, stored by content hash (see services/derived_artifacts.py)
+    DERIVED_ARTIFACTS_ENABLED = os.getenv("DERIVED_ARTIFACTS_ENABLED", "true").lower() == "true"
+    # Kinds the worker renders right after an analysis succeeds; empty leaves it to the first request
+    PRECOMPUTE_ARTIFACTS = [kind.strip() for kind in os.getenv("PRECOMPUTE_ARTIFACTS", "graphs,uml").split(",") if kind.strip()]
     CELERY_RESULT_BACKEND = 'rpc://'
+    # PlantUML rendering (see services/plantuml_renderer.py): "server" calls PLANTUML_SERVER_URL
+    # (the public server by default, or a local container); "pipe" runs local plantuml.jar processes
+    PLANTUML_RENDERER = os.getenv("PLANTUML_RENDERER", "server").lower()
+    PLANTUML_SERVER_URL = os.getenv("PLANTUML_SERVER_URL", "http://www.plantuml.com/plantuml")
+    PLANTUML_JAR_PATH = os.getenv("PLANTUML_JAR_PATH", "plantuml.jar")
+    PLANTUML_JAVA = os.getenv("PLANTUML_JAVA", "java")
+    PLANTUML_PIPE_PROCESSES = int(os.getenv("PLANTUML_PIPE_PROCESSES", "2"))
+    PLANTUML_TIMEOUT_SECONDS = float(os.getenv("PLANTUML_TIMEOUT_SECONDS", "30"))
+    PLANTUML_FORMAT = os.getenv("PLANTUML_FORMAT", "png").lower()  # png | svg
+    # Shared time budget for the three UML diagrams, which are generated concurrently
+    UML_GENERATION_TIMEOUT_SECONDS = float(os.getenv("UML_GENERATION_TIMEOUT_SECONDS", "60"))
+    # Class diagrams are built from parsed class models; big repos are split into package clusters
+    UML_CLASS_DIAGRAM_MAX_CLASSES = int(os.getenv("UML_CLASS_DIAGRAM_MAX_CLASSES", "40"))
+    UML_CLASS_DIAGRAM_MAX_DIAGRAMS = int(os.getenv("UML_CLASS_DIAGRAM_MAX_DIAGRAMS", "12"))
+    # Let Gemini annotate the generated class diagram (adds a Gemini call)
+    UML_CLASS_DIAGRAM_LLM_ENRICH = os.getenv("UML_CLASS_DIAGRAM_LLM_ENRICH", "false").lower() == "true"
+    # Cache of Gemini results keyed by model + normalized prompt + generation config (see services/llm_cache.py):
+    # an in-process LRU in front of LLM_CACHE_BACKEND (none | memory | directory | sqlite)
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "sqlite").lower()
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(tempfile.gettempdir(), "codelore-llm-cache"))
+    LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    LLM_CACHE_MEMORY_MAX_BYTES = int(os.getenv("LLM_CACHE_MEMORY_MAX_BYTES", str(8 * 1024 * 1024)))
+    LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    # Estimated prompt tokens for the narrative; the most salient symbols that fit are listed
+    NARRATIVE_PROMPT_TOKEN_BUDGET = int(os.getenv("NARRATIVE_PROMPT_TOKEN_BUDGET", "4000"))
+    # LLM behind every generation (see services/llm_backend.py): "gemini", or "fake" for a local
+    # deterministic stand-in (no network or API key) used for load tests and benchmarks
+    LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+    GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash-latest")
+    FAKE_LLM_LATENCY_SECONDS = float(os.getenv("FAKE_LLM_LATENCY_SECONDS", "0.5"))  # Until the first token
+    FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "200"))  # Output speed; 0 for instant
+    # Admission control for every Gemini call (see services/llm_gateway.py). The concurrency and
+    # token budgets are global: each process gets 1/LLM_GATEWAY_PROCESSES of them, so set it to
+    # the number of API workers plus Celery worker processes. Quota pauses are shared over pub/sub.
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))  # Estimated prompt + output tokens
+    LLM_GATEWAY_PROCESSES = int(os.getenv("LLM_GATEWAY_PROCESSES", "1"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+    LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+    LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "30"))
+    # Deadline per call (queueing, attempts and backoff) for interactive and background calls
+    LLM_INTERACTIVE_DEADLINE_SECONDS = float(os.getenv("LLM_INTERACTIVE_DEADLINE_SECONDS", "45"))
+    LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "180"))
+    # POST /component-details/batch packs components into Gemini calls within these budgets
+    COMPONENT_BATCH_PROMPT_TOKEN_BUDGET = int(os.getenv("COMPONENT_BATCH_PROMPT_TOKEN_BUDGET", "4000"))
+    COMPONENT_BATCH_MAX_OUTPUT_TOKENS = int(os.getenv("COMPONENT_BATCH_MAX_OUTPUT_TOKENS", "8192"))
+    COMPONENT_BATCH_OUTPUT_TOKENS_PER_COMPONENT = int(os.getenv("COMPONENT_BATCH_OUTPUT_TOKENS_PER_COMPONENT", "400"))
+    COMPONENT_BATCH_MAX_COMPONENTS = int(os.getenv("COMPONENT_BATCH_MAX_COMPONENTS", "200"))
+    # Max concurrent GitHub content requests per analysis task
+    FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+    # Keep-alive connection pool for GitHub calls; should be >= FETCH_CONCURRENCY
+    GITHUB_POOL_CONNECTIONS = int(os.getenv("GITHUB_POOL_CONNECTIONS", "4"))
+    GITHUB_POOL_MAXSIZE = int(os.getenv("GITHUB_POOL_MAXSIZE", "32"))
+    # Client-side GitHub request scheduling (see services/rate_limiter.py)
+    GITHUB_MAX_REQUESTS_PER_SECOND = float(os.getenv("GITHUB_MAX_REQUESTS_PER_SECOND", "20"))
+    GITHUB_BURST_REQUESTS = float(os.getenv("GITHUB_BURST_REQUESTS", "20"))
+    GITHUB_RATE_LIMIT_RESERVE = int(os.getenv("GITHUB_RATE_LIMIT_RESERVE", "20"))
+    GITHUB_MAX_RETRIES = int(os.getenv("GITHUB_MAX_RETRIES", "3"))
+    GITHUB_MAX_RETRY_WAIT_SECONDS = float(os.getenv("GITHUB_MAX_RETRY_WAIT_SECONDS", "120"))
+    GITHUB_MAX_QUEUE_WAIT_SECONDS = float(os.getenv("GITHUB_MAX_QUEUE_WAIT_SECONDS", "300"))
+    # Workers publish their GitHub metrics over pub/sub this often, for GET /metrics on the API
+    WORKER_METRICS_PUBLISH_SECONDS = float(os.getenv("WORKER_METRICS_PUBLISH_SECONDS", "10"))
+    # ETag/Last-Modified cache for GitHub metadata endpoints (see services/http_cache.py)
+    HTTP_CACHE_BACKEND = os.getenv("HTTP_CACHE_BACKEND", "sqlite")  # none | memory | directory | sqlite
+    HTTP_CACHE_PATH = os.getenv("HTTP_CACHE_PATH", os.path.join(tempfile.gettempdir(), "codelore-http-cache"))
+    HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+    # Reuse results for an already analysed (owner, repo, commit) and coalesce identical runs
+    ANALYSIS_DEDUP_ENABLED = os.getenv("ANALYSIS_DEDUP_ENABLED", "true").lower() == "true"
+    # A task finding the commit already being analysed requeues itself every POLL seconds (Celery
+    # retry, so it frees its worker slot) and runs the analysis itself after WAIT seconds
+    ANALYSIS_DEDUP_WAIT_SECONDS = float(os.getenv("ANALYSIS_DEDUP_WAIT_SECONDS", "600"))
+    ANALYSIS_DEDUP_POLL_SECONDS = float(os.getenv("ANALYSIS_DEDUP_POLL_SECONDS", "10"))
+    # A running analysis refreshes result.heartbeat_at this often; waiting tasks ignore it once the
+    # heartbeat is older than ANALYSIS_DEDUP_STALE_SECONDS (its worker presumably died)
+    ANALYSIS_DEDUP_HEARTBEAT_SECONDS = float(os.getenv("ANALYSIS_DEDUP_HEARTBEAT_SECONDS", "15"))
+    ANALYSIS_DEDUP_STALE_SECONDS = float(os.getenv("ANALYSIS_DEDUP_STALE_SECONDS", "60"))
+    # Progress updates are coalesced into at most one Supabase write per interval
+    PROGRESS_WRITE_INTERVAL_SECONDS = float(os.getenv("PROGRESS_WRITE_INTERVAL_SECONDS", "2"))
+    # Live progress events for GET /result/{task_id}/stream: "broker" (Celery broker), "memory" or "none"
+    PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "broker").lower()
+    PROGRESS_PUBLISH_INTERVAL_SECONDS = float(os.getenv("PROGRESS_PUBLISH_INTERVAL_SECONDS", "0.25"))
+    PROGRESS_STREAM_HEARTBEAT_SECONDS = float(os.getenv("PROGRESS_STREAM_HEARTBEAT_SECONDS", "15"))
+    # Publish the narrative on the same channel while Gemini streams it ("narrative" SSE events)
+    NARRATIVE_STREAMING_ENABLED = os.getenv("NARRATIVE_STREAMING_ENABLED", "true").lower() == "true"
+    # Per-endpoint-class limits for blocking work run off the API event loop (see api/executors.py)
+    API_DB_CONCURRENCY = int(os.getenv("API_DB_CONCURRENCY", "16"))
+    API_LLM_CONCURRENCY = int(os.getenv("API_LLM_CONCURRENCY", "4"))
+    API_RENDER_CONCURRENCY = int(os.getenv("API_RENDER_CONCURRENCY", "1"))
+    API_HTTP_CONCURRENCY = int(os.getenv("API_HTTP_CONCURRENCY", "8"))
+    API_QUEUE_TIMEOUT_SECONDS = float(os.getenv("API_QUEUE_TIMEOUT_SECONDS", "30"))
+    # "contents" fetches the tree then one file per request; "archive" streams a single tarball
+    INGESTION_MODE = os.getenv("INGESTION_MODE", "contents").lower()
+    # Process pool for CPU-bound parsing; batches smaller than PARSE_POOL_MIN_BATCH parse in-process
+    PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+    PARSE_POOL_MIN_BATCH = int(os.getenv("PARSE_POOL_MIN_BATCH", "16"))
+    PARSE_BATCH_SIZE = int(os.getenv("PARSE_BATCH_SIZE", "64"))
+    # Batches parsed on the pool while fetching continues; the fetch loop waits beyond this
+    PARSE_MAX_PENDING_BATCHES = int(os.getenv("PARSE_MAX_PENDING_BATCHES", "2"))
+    # Content-addressed cache of file contents and parse results keyed by git blob SHA
+    BLOB_CACHE_BACKEND = os.getenv("BLOB_CACHE_BACKEND", "directory")  # none | memory | directory | sqlite
+    BLOB_CACHE_PATH = os.getenv("BLOB_CACHE_PATH", os.path.join(tempfile.gettempdir(), "codelore-blob-cache"))
+    BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
 
 settings = Settings()
\ No newline at end of file
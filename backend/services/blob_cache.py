@@ -0,0 +1,331 @@
+# services/blob_cache.py
+import os
+import sys
+import json
+import zlib
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from config.config import settings
+
+print("[WALKTHROUGH] blob_cache.py: Loading...")
+sys.stdout.flush()
+
+
+class CacheBackend:
+    """
+    Minimal bytes key/value store with size-bounded LRU eviction.
+    Implementations must be safe to call from multiple threads.
+    """
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """ In-process LRU store, bounded by total value size. """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+
+
+class DirectoryCacheBackend(CacheBackend):
+    """
+    One file per key under a directory (sharded by key hash). Recency is tracked with
+    file mtimes so several worker processes can share the same directory; eviction
+    removes the least recently used files once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._size = self._scan_size()
+
+    def _file_for(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, digest[:2], digest[2:])
+
+    def _scan_size(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def get(self, key: str) -> Optional[bytes]:
+        file_path = self._file_for(key)
+        try:
+            with open(file_path, "rb") as f:
+                value = f.read()
+            os.utime(file_path, None)  # Mark as recently used
+            return value
+        except OSError:
+            return None
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        file_path = self._file_for(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # Write to a temp file and rename so readers never see partial values
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            previous_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+            os.replace(tmp_path, file_path)
+        except OSError as e:
+            print(f"[WALKTHROUGH] blob_cache.py: ERROR writing cache file: {e}")
+            sys.stdout.flush()
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._size += len(value) - previous_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def delete(self, key: str) -> None:
+        file_path = self._file_for(key)
+        try:
+            size = os.path.getsize(file_path)
+            os.unlink(file_path)
+            with self._lock:
+                self._size -= size
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        """ Removes least recently used files until the directory is under 90% of max_bytes. """
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                file_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_path)
+                    entries.append((stat.st_mtime, stat.st_size, file_path))
+                except OSError:
+                    pass
+        entries.sort()
+        # Other processes may have written to the directory too; resync the total
+        self._size = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, file_path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.unlink(file_path)
+                self._size -= size
+            except OSError:
+                pass
+
+
+class SqliteCacheBackend(CacheBackend):
+    """ Single-file SQLite store with an access-time column for LRU eviction. """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS cache_entries_accessed_at ON cache_entries (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache_entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, size, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), len(value), time.time()))
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(total)
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _evict(self, total: int) -> None:
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, size FROM cache_entries ORDER BY accessed_at ASC").fetchall()
+        stale_keys = []
+        for key, size in rows:
+            if total <= target:
+                break
+            stale_keys.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM cache_entries WHERE key = ?", stale_keys)
+
+
+def create_backend(kind: str, path: str, max_bytes: int) -> Optional[CacheBackend]:
+    """
+    Builds a cache backend by name ("memory", "directory", "sqlite"); "none" disables caching.
+    `path` is a directory for both on-disk backends; SQLite keeps a single file inside it.
+    """
+    kind = (kind or "none").lower()
+    if kind == "memory":
+        return MemoryCacheBackend(max_bytes)
+    if kind == "directory":
+        return DirectoryCacheBackend(path, max_bytes)
+    if kind == "sqlite":
+        return SqliteCacheBackend(os.path.join(path, "cache.sqlite3"), max_bytes)
+    if kind != "none":
+        print(f"[WALKTHROUGH] blob_cache.py: Unknown cache backend '{kind}', caching disabled.")
+        sys.stdout.flush()
+    return None
+
+
+def git_blob_sha(data: bytes) -> str:
+    """ Computes the git blob SHA-1 for raw file bytes (same id the trees API reports). """
+    header = f"blob {len(data)}\0".encode("utf-8")
+    return hashlib.sha1(header + data).hexdigest()
+
+
+class BlobCache:
+    """
+    Content-addressed cache keyed by git blob SHA. Stores both the decoded file content
+    and the code_parser output per blob, so an unchanged file skips the download and the parse.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key: str) -> Optional[bytes]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"[WALKTHROUGH] blob_cache.py: ERROR reading cache: {e}")
+            sys.stdout.flush()
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return zlib.decompress(value)
+
+    def _set(self, key: str, value: bytes) -> None:
+        try:
+            self.backend.set(key, zlib.compress(value))
+        except Exception as e:
+            print(f"[WALKTHROUGH] blob_cache.py: ERROR writing cache: {e}")
+            sys.stdout.flush()
+
+    def get_content(self, sha: str) -> Optional[str]:
+        value = self._get(f"blob:{sha}")
+        return value.decode("utf-8") if value is not None else None
+
+    def set_content(self, sha: str, content: str) -> None:
+        self._set(f"blob:{sha}", content.encode("utf-8"))
+
+    def get_parse_result(self, sha: str, language: str, parser_version: int) -> Optional[Dict[str, Any]]:
+        value = self._get(f"parse:{language}:v{parser_version}:{sha}")
+        if value is None:
+            return None
+        result = json.loads(value)
+        result["imports"] = set(result.get("imports", []))
+        return result
+
+    def set_parse_result(self, sha: str, language: str, parser_version: int, result: Dict[str, Any]) -> None:
+        serializable = dict(result)
+        serializable["imports"] = sorted(serializable.get("imports", []))
+        self._set(f"parse:{language}:v{parser_version}:{sha}",
+                  json.dumps(serializable).encode("utf-8"))
+
+
+_blob_cache: Optional[BlobCache] = None
+_blob_cache_initialized = False
+_blob_cache_lock = threading.Lock()
+
+
+def get_blob_cache() -> Optional[BlobCache]:
+    """ Returns the process-wide blob cache configured in settings, or None if disabled. """
+    global _blob_cache, _blob_cache_initialized
+    with _blob_cache_lock:
+        if not _blob_cache_initialized:
+            _blob_cache_initialized = True
+            try:
+                backend = create_backend(
+                    settings.BLOB_CACHE_BACKEND, settings.BLOB_CACHE_PATH, settings.BLOB_CACHE_MAX_BYTES)
+                _blob_cache = BlobCache(backend) if backend else None
+            except Exception as e:
+                print(f"[WALKTHROUGH] blob_cache.py: ERROR initializing blob cache, caching disabled: {e}")
+                sys.stdout.flush()
+                _blob_cache = None
+        return _blob_cache
+
+
+print("[WALKTHROUGH] blob_cache.py: Finished loading.")
+sys.stdout.flush()
@@ -1,17 +1,157 @@
 # tasks/code_parser.py
 import ast
 import sys
-from typing import Dict, Any, List, Set, Optional
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Set, Optional, Tuple
 import re
 
+from config.config import settings
+
 print("[WALKTHROUGH] code_parser.py: Loading...")
 sys.stdout.flush()
 
+# Bump whenever the shape or content of analyze_*_content results changes,
+# so cached parse results (see services/blob_cache.py) are not reused.
+PARSER_VERSION = 3
+
+# Class models (see _python_class_model / _java_class_models) keep at most this many
+# methods and attributes per class, so huge generated classes do not bloat the records
+MAX_CLASS_MEMBERS = 40
+_PYTHON_ENUM_BASES = {"Enum", "IntEnum", "StrEnum", "Flag", "IntFlag"}
+_PYTHON_INTERFACE_BASES = {"Protocol"}
+_PYTHON_ABSTRACT_BASES = {"ABC", "ABCMeta"}
+# typing constructs wrap the interesting types rather than being relationships themselves
+_PYTHON_TYPING_NAMES = {
+    "Optional", "Union", "List", "Dict", "Set", "FrozenSet", "Tuple", "Type", "Any", "Callable",
+    "Iterable", "Iterator", "Sequence", "Mapping", "MutableMapping", "ClassVar", "Final", "Literal",
+    "Annotated", "Awaitable", "Coroutine", "Generator", "AsyncIterator", "Generic", "TypeVar",
+}
+
+
+def _python_visibility(name: str) -> str:
+    """ PlantUML visibility marker following Python naming conventions. """
+    if name.startswith("__") and not name.endswith("__"):
+        return "-"
+    if name.startswith("_") and not name.startswith("__"):
+        return "#"
+    return "+"
+
+
+def _dotted_name(node: ast.AST) -> Optional[str]:
+    """ "a.b.C" for Name/Attribute nodes, the generic base for Subscript (List[C] -> List). """
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        parent = _dotted_name(node.value)
+        return f"{parent}.{node.attr}" if parent else None
+    if isinstance(node, ast.Subscript):
+        return _dotted_name(node.value)
+    return None
+
+
+def _annotation_types(node: Optional[ast.AST]) -> List[str]:
+    """ Class-like names referenced by an annotation: Optional[List["Foo"]] -> ["Foo"]. """
+    if node is None:
+        return []
+    names = []
+    for child in ast.walk(node):
+        if isinstance(child, ast.Constant) and isinstance(child.value, str):
+            try:
+                names.extend(_annotation_types(ast.parse(child.value, mode="eval").body))
+            except SyntaxError:
+                pass
+            continue
+        name = _dotted_name(child) if isinstance(child, (ast.Name, ast.Attribute)) else None
+        # Only capitalized names look like classes; skips builtins such as int or str
+        if name and name.split(".")[-1][:1].isupper() and name.split(".")[-1] not in _PYTHON_TYPING_NAMES:
+            names.append(name.split(".")[-1])
+    return names
+
+
+def _python_class_model(node: ast.ClassDef) -> Dict[str, Any]:
+    """
+    Members, bases and relationship hints of one class, as used for UML class diagrams:
+    attributes come from class-level assignments and self.x assignments in methods;
+    "composes" lists classes instantiated into attributes, "uses" classes named in
+    attribute annotations.
+    """
+    bases = [name for name in (_dotted_name(base) for base in node.bases) if name]
+    base_names = {base.split(".")[-1] for base in bases}
+    methods, attributes = {}, {}
+    composes, uses = set(), set()
+    abstract = bool(base_names & _PYTHON_ABSTRACT_BASES) or any(
+        _dotted_name(keyword.value) in ("ABCMeta", "abc.ABCMeta") for keyword in node.keywords)
+
+    def add_attribute(name: str, annotation: Optional[ast.AST], value: Optional[ast.AST]) -> None:
+        if name not in attributes or (annotation is not None and attributes[name]["type"] is None):
+            type_text = ast.unparse(annotation) if annotation is not None else None
+            attributes[name] = {"name": name, "type": type_text and type_text.strip("'\""),
+                                "visibility": _python_visibility(name)}
+        uses.update(_annotation_types(annotation))
+        if isinstance(value, ast.Call):
+            called = _dotted_name(value.func)
+            if called and called.split(".")[-1][:1].isupper():
+                composes.add(called.split(".")[-1])
+
+    for statement in node.body:
+        if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            decorators = {_dotted_name(decorator) for decorator in statement.decorator_list}
+            if decorators & {"abstractmethod", "abc.abstractmethod"}:
+                abstract = True
+            if decorators & {"property", "cached_property", "functools.cached_property"}:
+                add_attribute(statement.name, statement.returns, None)
+                continue
+            methods[statement.name] = {
+                "name": statement.name, "visibility": _python_visibility(statement.name),
+                "static": bool(decorators & {"staticmethod", "classmethod"})}
+            # self.repo = repo takes the annotation of the `repo` parameter
+            parameters = {arg.arg: arg.annotation for arg in statement.args.args + statement.args.kwonlyargs
+                          if arg.annotation is not None}
+            for child in ast.walk(statement):
+                if isinstance(child, ast.Assign):
+                    targets, value = child.targets, child.value
+                    annotation = parameters.get(value.id) if isinstance(value, ast.Name) else None
+                elif isinstance(child, ast.AnnAssign):
+                    targets, annotation, value = [child.target], child.annotation, child.value
+                else:
+                    continue
+                for target in targets:
+                    if (isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name)
+                            and target.value.id == "self"):
+                        add_attribute(target.attr, annotation, value)
+        elif isinstance(statement, ast.AnnAssign) and isinstance(statement.target, ast.Name):
+            add_attribute(statement.target.id, statement.annotation, statement.value)
+        elif isinstance(statement, ast.Assign):
+            for target in statement.targets:
+                if isinstance(target, ast.Name):
+                    add_attribute(target.id, None, statement.value)
+
+    if base_names & _PYTHON_ENUM_BASES:
+        kind = "enum"
+    elif base_names & _PYTHON_INTERFACE_BASES:
+        kind = "interface"
+    else:
+        kind = "abstract" if abstract else "class"
+    return {
+        "name": node.name,
+        "kind": kind,
+        "bases": [base for base in bases if base.split(".")[-1] not in _PYTHON_ABSTRACT_BASES | {"object"}],
+        "methods": list(methods.values())[:MAX_CLASS_MEMBERS],
+        "attributes": list(attributes.values())[:MAX_CLASS_MEMBERS],
+        "composes": sorted(composes - {node.name}),
+        "uses": sorted(uses - composes - {node.name}),
+    }
+
+
 class PythonCodeVisitor(ast.NodeVisitor):
     """ Visits AST nodes to extract basic code structure info. """
     def __init__(self):
         self.functions: List[str] = []
         self.classes: List[str] = []
+        self.class_models: List[Dict[str, Any]] = []
         self.imports: Set[str] = set()
 
     def visit_FunctionDef(self, node: ast.FunctionDef):
@@ -24,6 +164,7 @@ class PythonCodeVisitor(ast.NodeVisitor):
 
     def visit_ClassDef(self, node: ast.ClassDef):
         self.classes.append(node.name)
+        self.class_models.append(_python_class_model(node))
         self.generic_visit(node)
 
     def visit_Import(self, node: ast.Import):
@@ -51,6 +192,7 @@ def analyze_python_content(content: str, filename: str = "<string>") -> Optional
         return {
             "functions": visitor.functions,
             "classes": visitor.classes,
+            "class_models": visitor.class_models,
             "imports": visitor.imports,
             "line_count": len(content.splitlines())
         }
@@ -63,6 +205,130 @@ def analyze_python_content(content: str, filename: str = "<string>") -> Optional
         sys.stdout.flush()
         raise # Re-raise unexpected errors to be caught by the task
 
+_JAVA_TYPE_DECLARATION = re.compile(
+    r'(?P<modifiers>(?:\b(?:public|private|protected|static|final|abstract|sealed|non-sealed|strictfp)\s+)*)'
+    r'(?P<kind>@interface|\b(?:class|interface|enum|record))\s+(?P<name>\w+)\s*(?:<[^{;]*?>)?'
+    r'\s*(?:\((?P<components>[^)]*)\))?'
+    r'\s*(?:\bextends\s+(?P<extends>[\w.<>,?\s]+?))?'
+    r'\s*(?:\bimplements\s+(?P<implements>[\w.<>,?\s]+?))?'
+    r'\s*(?:\bpermits\s+[\w.,\s]+?)?\s*\{')
+_JAVA_TYPE = r'[\w.$]+(?:\s*<[^;(){}=]*>)?(?:\s*\[\s*\])*'
+_JAVA_FIELD = re.compile(
+    r'(?P<modifiers>(?:\b(?:public|private|protected|static|final|transient|volatile)\s+)*)'
+    rf'(?P<type>{_JAVA_TYPE})\s+(?P<name>\w+)\s*(?:=(?P<value>[^;]*))?;')
+_JAVA_METHOD = re.compile(
+    r'(?P<modifiers>(?:\b(?:public|private|protected|static|final|abstract|synchronized|native|default)\s+)*)'
+    rf'(?:<[^>]*>\s*)?(?P<type>{_JAVA_TYPE})\s+(?P<name>\w+)\s*\([^)]*\)\s*(?:throws\s+[\w.,\s]+?)?\s*(?:\{{\}}|;)')
+_JAVA_VISIBILITY = {"public": "+", "private": "-", "protected": "#"}
+_JAVA_NOT_A_TYPE = {"return", "new", "throw", "else", "package", "import"}
+# Library types that say nothing about a class' relationships within the repository
+_JAVA_COMMON_TYPES = {
+    "String", "Object", "Integer", "Long", "Short", "Byte", "Boolean", "Double", "Float", "Character",
+    "BigDecimal", "BigInteger", "Number", "Void", "Class", "List", "ArrayList", "LinkedList", "Map",
+    "HashMap", "LinkedHashMap", "TreeMap", "Set", "HashSet", "LinkedHashSet", "TreeSet", "Collection",
+    "Iterable", "Optional", "Date", "LocalDate", "LocalDateTime", "Instant", "UUID", "Logger",
+}
+
+
+def _java_type_names(type_text: Optional[str]) -> List[str]:
+    """ Capitalized repository-looking type names in a Java type: Map<String, Foo[]> -> ["Foo"]. """
+    names = re.findall(r'[\w$]+(?:\.[\w$]+)*', type_text or "")
+    return [name.split(".")[-1] for name in names
+            if name.split(".")[-1][:1].isupper() and name.split(".")[-1] not in _JAVA_COMMON_TYPES]
+
+
+def _java_body_outline(content: str, open_brace: int) -> Tuple[str, int]:
+    """
+    Returns the text of the body starting at `open_brace` with every nested block
+    collapsed to "{}" (so only member declarations remain), and the index of the
+    closing brace.
+    """
+    outline = []
+    depth = 0
+    for index in range(open_brace + 1, len(content)):
+        char = content[index]
+        if char == "{":
+            if depth == 0:
+                outline.append("{")
+            depth += 1
+        elif char == "}":
+            if depth == 0:
+                return "".join(outline), index
+            depth -= 1
+            if depth == 0:
+                outline.append("}")
+        elif depth == 0:
+            outline.append(char)
+    return "".join(outline), len(content)
+
+
+def _java_class_models(content: str) -> List[Dict[str, Any]]:
+    """
+    Class models (see _python_class_model) for the type declarations in Java source that
+    has comments removed. Regex based, like the rest of the Java analysis.
+    """
+    # Braces and keywords inside string or char literals must not count
+    content = re.sub(r'"(?:\\.|[^"\\\n])*"', '""', content)
+    content = re.sub(r"'(?:\\.|[^'\\\n])+'", "''", content)
+    models = []
+    for declaration in _JAVA_TYPE_DECLARATION.finditer(content):
+        declared_kind = declaration.group("kind")
+        if declared_kind == "@interface":
+            continue
+        modifiers = declaration.group("modifiers").split()
+        outline, _ = _java_body_outline(content, declaration.end() - 1)
+        interface = declared_kind == "interface"
+        methods, attributes = {}, {}
+        composes, uses = set(), set()
+        for component in filter(None, (part.strip() for part in (declaration.group("components") or "").split(","))):
+            component_type, _, component_name = component.rpartition(" ")
+            if component_name:
+                attributes[component_name] = {"name": component_name, "type": (_java_type_names(component_type) or [component_type.strip()])[0], "visibility": "-"}
+                uses.update(_java_type_names(component_type))
+        for field in _JAVA_FIELD.finditer(outline):
+            if field.group("type") in _JAVA_NOT_A_TYPE:
+                continue
+            field_modifiers = field.group("modifiers").split()
+            visibility = "+" if interface else next(
+                (_JAVA_VISIBILITY[modifier] for modifier in field_modifiers if modifier in _JAVA_VISIBILITY), "~")
+            attributes.setdefault(field.group("name"), {
+                "name": field.group("name"), "type": field.group("type").strip(), "visibility": visibility})
+            created = re.match(r'\s*new\s+([\w.$]+)', field.group("value") or "")
+            if created and created.group(1).split(".")[-1] not in _JAVA_COMMON_TYPES:
+                composes.add(created.group(1).split(".")[-1])
+            uses.update(_java_type_names(field.group("type")))
+        for method in _JAVA_METHOD.finditer(outline):
+            # Constructors parse as a method whose type is a modifier; they are not listed
+            if (method.group("type") in _JAVA_NOT_A_TYPE or method.group("type") in _JAVA_VISIBILITY
+                    or method.group("name") in ("if", "for", "while", "switch", "catch")):
+                continue
+            method_modifiers = method.group("modifiers").split()
+            visibility = "+" if interface else next(
+                (_JAVA_VISIBILITY[modifier] for modifier in method_modifiers if modifier in _JAVA_VISIBILITY), "~")
+            methods.setdefault(method.group("name"), {
+                "name": method.group("name"), "visibility": visibility, "static": "static" in method_modifiers})
+        bases = []
+        for group in ("extends", "implements"):
+            # Drop generic arguments before splitting the list on commas
+            text = re.sub(r'<[^<>]*>', '', re.sub(r'<[^<>]*>', '', declaration.group(group) or ""))
+            bases.extend(base.strip() for base in text.split(",") if base.strip())
+        if declared_kind in ("enum", "interface"):
+            kind = declared_kind
+        else:
+            kind = "abstract" if "abstract" in modifiers else "class"
+        name = declaration.group("name")
+        models.append({
+            "name": name,
+            "kind": kind,
+            "bases": bases,
+            "methods": list(methods.values())[:MAX_CLASS_MEMBERS],
+            "attributes": list(attributes.values())[:MAX_CLASS_MEMBERS],
+            "composes": sorted(composes - {name}),
+            "uses": sorted(uses - composes - {name}),
+        })
+    return models
+
+
 def analyze_java_content(content: str, filename: str = "<string>") -> Optional[Dict[str, Any]]:
     """
     Parses Java code content using regex pattern matching.
@@ -108,6 +374,7 @@ def analyze_java_content(content: str, filename: str = "<string>") -> Optional[D
         
         return {
             "classes": classes,
+            "class_models": _java_class_models(content),
             "functions": methods,  # Use "functions" to maintain same structure as Python analysis
             "imports": imports,
             "line_count": len(content.splitlines()),
@@ -118,131 +385,279 @@ def analyze_java_content(content: str, filename: str = "<string>") -> Optional[D
         sys.stdout.flush()
         return None  # Skip files with parsing errors
 
-def detect_frameworks_from_files(file_contents: dict) -> dict:
-    """
-    Given a dict of {filename: content}, returns a set of detected frameworks/libraries.
-    """
-    frameworks = set()
-
-    # Python requirements.txt or Pipfile
-    reqs = file_contents.get("requirements.txt", "") + "\n" + file_contents.get("Pipfile", "")
-    if reqs:
-        if re.search(r"\bflask\b", reqs, re.I):
-            frameworks.add("Flask")
-        if re.search(r"\bdjango\b", reqs, re.I):
-            frameworks.add("Django")
-        if re.search(r"\bfastapi\b", reqs, re.I):
-            frameworks.add("FastAPI")
-        if re.search(r"\bcelery\b", reqs, re.I):
-            frameworks.add("Celery")
-        if re.search(r"\bnumpy\b", reqs, re.I):
-            frameworks.add("NumPy")
-        if re.search(r"\bpandas\b", reqs, re.I):
-            frameworks.add("Pandas")
-        if re.search(r"\bscikit-learn\b", reqs, re.I):
-            frameworks.add("scikit-learn")
-        if re.search(r"\btorch\b", reqs, re.I):
-            frameworks.add("PyTorch")
-        if re.search(r"\btensorflow\b", reqs, re.I):
-            frameworks.add("TensorFlow")
+def _python_module(file_path: str) -> str:
+    """ "src/app/models.py" -> "src.app.models"; a package's __init__.py is the package. """
+    module = file_path[:-3] if file_path.endswith(".py") else file_path
+    parts = [part for part in module.replace("\\", "/").split("/") if part]
+    if parts and parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+
+def analyze_file(file_path: str, language: str, content: str) -> Optional[Dict[str, Any]]:
+    """
+    Parses one Python or Java file into a compact, JSON-serializable record:
+    package, functions, classes, class models, sorted imports, line count and (Java only)
+    detected frameworks.
+    Returns None if the file could not be parsed.
+    """
+    if language == 'python':
+        analysis_result = analyze_python_content(content, filename=file_path)
+    else:
+        analysis_result = analyze_java_content(content, filename=file_path)
+    if not analysis_result:
+        return None
+    return {
+        "language": language,
+        # Namespace used to group classes in UML diagrams: the Java package or the Python module
+        "package": analysis_result.get("package") if language == 'java' else _python_module(file_path),
+        "functions": analysis_result["functions"],
+        "classes": analysis_result["classes"],
+        "class_models": analysis_result["class_models"],
+        "imports": sorted(analysis_result["imports"]),
+        "line_count": analysis_result["line_count"],
+        # Java sources also feed framework detection; keep only the verdict, not the source
+        "frameworks": detect_frameworks_from_files({file_path: content}) if language == 'java' else [],
+    }
+
+
+def _analyze_chunk(files: List[Tuple[str, str, str]]) -> List[Optional[Dict[str, Any]]]:
+    """ Pool worker entry point: parses a chunk of (path, language, content) tuples. """
+    return [analyze_file(file_path, language, content) for file_path, language, content in files]
+
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+# The pool is created mid-task while fetch and progress threads hold locks (stdout, HTTP
+# pools, the rate limiter); forked children could inherit one held and deadlock on it.
+# Workers therefore start from a clean forkserver process (spawn where that is missing).
+_PARSE_POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _get_parse_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Returns the process-wide parse pool, created on first use and kept for reuse.
+    Returns None when parallel parsing is disabled or not possible here (daemonic
+    processes, such as multiprocessing pool children, cannot start workers).
+    """
+    global _parse_pool
+    if settings.PARSE_WORKERS <= 1 or multiprocessing.current_process().daemon:
+        return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=settings.PARSE_WORKERS,
+                mp_context=multiprocessing.get_context(_PARSE_POOL_START_METHOD))
+            print(f"[WALKTHROUGH] code_parser.py: Started parse pool with {settings.PARSE_WORKERS} processes.")
+            sys.stdout.flush()
+        return _parse_pool
+
+
+def _discard_parse_pool() -> None:
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=False, cancel_futures=True)
+            _parse_pool = None
+
 
+def _analyze_in_process(files: List[Tuple[str, str, str]]) -> Dict[str, Optional[Dict[str, Any]]]:
+    return {file_path: analyze_file(file_path, language, content)
+            for file_path, language, content in files}
+
+
+class ParseBatch:
+    """
+    A batch handed to submit_files_batch(). done() tells whether result() would block;
+    result() returns {path: analyze_file(...)}, parsing in-process if the pool broke.
+    """
+
+    def __init__(self, files: List[Tuple[str, str, str]], chunks: Optional[List[List[Tuple[str, str, str]]]] = None,
+                 futures: Optional[list] = None, results: Optional[Dict[str, Optional[Dict[str, Any]]]] = None):
+        self.files = files
+        self._chunks = chunks or []
+        self._futures = futures or []
+        self._results = results
+
+    def done(self) -> bool:
+        return self._results is not None or all(future.done() for future in self._futures)
+
+    def result(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        if self._results is None:
+            try:
+                chunk_results = [future.result() for future in self._futures]
+            except (BrokenProcessPool, OSError, RuntimeError) as e:
+                print(f"[WALKTHROUGH] code_parser.py: Parse pool unavailable ({e}), parsing in-process.")
+                sys.stdout.flush()
+                _discard_parse_pool()
+                self._results = _analyze_in_process(self.files)
+            else:
+                self._results = {}
+                for chunk, records in zip(self._chunks, chunk_results):
+                    for (file_path, _, _), record in zip(chunk, records):
+                        self._results[file_path] = record
+        return self._results
+
+
+def submit_files_batch(files: List[Tuple[str, str, str]]) -> ParseBatch:
+    """
+    Starts parsing a batch of (path, language, content) tuples and returns without
+    waiting. Batches of at least PARSE_POOL_MIN_BATCH files are split into chunks and
+    parsed on a process pool, so ast.parse and the Java regexes use every core; smaller
+    batches, or environments where the pool cannot run, are parsed in-process right away.
+    Unexpected parser errors are re-raised by result(), as with analyze_python_content.
+    """
+    pool = _get_parse_pool() if len(files) >= settings.PARSE_POOL_MIN_BATCH else None
+    if pool is None:
+        return ParseBatch(files, results=_analyze_in_process(files))
+
+    # A few chunks per worker balances uneven file sizes without per-file IPC overhead
+    chunk_size = max(1, len(files) // (settings.PARSE_WORKERS * 4))
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    try:
+        futures = [pool.submit(_analyze_chunk, chunk) for chunk in chunks]
+    except (BrokenProcessPool, OSError, RuntimeError) as e:
+        print(f"[WALKTHROUGH] code_parser.py: Parse pool unavailable ({e}), parsing in-process.")
+        sys.stdout.flush()
+        _discard_parse_pool()
+        return ParseBatch(files, results=_analyze_in_process(files))
+    return ParseBatch(files, chunks, futures)
+
+
+def analyze_files_batch(files: List[Tuple[str, str, str]]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """ Parses a batch and waits for it: submit_files_batch(files).result(). """
+    return submit_files_batch(files).result()
+
+
+# Declarative framework rules: source -> [(pattern, frameworks)].
+# Each source is scanned in a single pass with one compiled alternation, so a new
+# framework is one more row, not one more scan. Alternatives are tried in order at each
+# position, so when one pattern is a prefix of another (e.g. "import javax.persistence"
+# vs "import javax."), list the longer one first and give it the union of frameworks.
+FRAMEWORK_RULES: Dict[str, List[Tuple[str, Tuple[str, ...]]]] = {
+    # Python requirements.txt / Pipfile
+    "python_deps": [
+        (r"\bflask\b", ("Flask",)),
+        (r"\bdjango\b", ("Django",)),
+        (r"\bfastapi\b", ("FastAPI",)),
+        (r"\bcelery\b", ("Celery",)),
+        (r"\bnumpy\b", ("NumPy",)),
+        (r"\bpandas\b", ("Pandas",)),
+        (r"\bscikit-learn\b", ("scikit-learn",)),
+        (r"\btorch\b", ("PyTorch",)),
+        (r"\btensorflow\b", ("TensorFlow",)),
+    ],
     # Node.js package.json
-    package_json = file_contents.get("package.json", "")
-    if package_json:
-        if re.search(r"react", package_json, re.I):
-            frameworks.add("React")
-        if re.search(r"next", package_json, re.I):
-            frameworks.add("Next.js")
-        if re.search(r"express", package_json, re.I):
-            frameworks.add("Express")
-        if re.search(r"vue", package_json, re.I):
-            frameworks.add("Vue.js")
-        if re.search(r"angular", package_json, re.I):
-            frameworks.add("Angular")
-
-    # Java frameworks detection from dependency files
-    pom_xml = file_contents.get("pom.xml", "")
-    build_gradle = file_contents.get("build.gradle", "")
-    java_deps = pom_xml + "\n" + build_gradle
-    
-    if java_deps:
-        if re.search(r"spring-boot|spring-web|spring-context", java_deps, re.I):
-            frameworks.add("Spring")
-        if re.search(r"hibernate|jpa", java_deps, re.I):
-            frameworks.add("Hibernate")
-        if re.search(r"junit", java_deps, re.I):
-            frameworks.add("JUnit")
-        if re.search(r"jakarta.ee|javax.ee|javaee", java_deps, re.I):
-            frameworks.add("Jakarta EE")
-        if re.search(r"micronaut", java_deps, re.I):
-            frameworks.add("Micronaut")
-        if re.search(r"quarkus", java_deps, re.I):
-            frameworks.add("Quarkus")
-    
-    # Detect Java frameworks from Java file contents
-    java_files_content = ""
+    "node_deps": [
+        (r"react", ("React",)),
+        (r"next", ("Next.js",)),
+        (r"express", ("Express",)),
+        (r"vue", ("Vue.js",)),
+        (r"angular", ("Angular",)),
+    ],
+    # Java pom.xml / build.gradle
+    "java_deps": [
+        (r"spring-boot|spring-web|spring-context", ("Spring",)),
+        (r"hibernate|jpa", ("Hibernate",)),
+        (r"junit", ("JUnit",)),
+        (r"jakarta.ee|javax.ee|javaee", ("Jakarta EE",)),
+        (r"micronaut", ("Micronaut",)),
+        (r"quarkus", ("Quarkus",)),
+    ],
+    # Java source files (case-sensitive)
+    "java_source": [
+        (r"import\s+org\.springframework|@RestController|@Service|@Repository|@Component|@Autowired", ("Spring",)),
+        (r"@Controller", ("Spring", "Micronaut")),
+        (r"import\s+(?:javax|jakarta)\.persistence", ("Hibernate", "Jakarta EE")),
+        (r"import\s+org\.hibernate|@Entity|@Table|@Column|@Id|EntityManager", ("Hibernate",)),
+        (r"import\s+org\.junit|@Test|@Before|@After|Assert\.|@RunWith", ("JUnit",)),
+        (r"import\s+javax\.|import\s+jakarta\.|@EJB|@Stateless|@Stateful|@MessageDriven|@WebServlet", ("Jakarta EE",)),
+        (r"import\s+android\.|extends\s+Activity|extends\s+AppCompatActivity|R\.layout|findViewById|setContentView", ("Android",)),
+        (r"import\s+javafx\.|extends\s+Application|@FXML", ("JavaFX",)),
+        (r"import\s+io\.micronaut\.", ("Micronaut",)),
+        (r"@Inject", ("Micronaut", "Guice")),
+        (r"import\s+io\.quarkus\.|@QuarkusTest", ("Quarkus",)),
+        (r"import\s+org\.apache\.struts|extends\s+Action", ("Struts",)),
+        (r"import\s+com\.google\.inject|@Singleton", ("Guice",)),
+        (r"import\s+com\.google\.gwt|extends\s+RemoteServiceServlet|implements\s+EntryPoint", ("GWT",)),
+    ],
+}
+FRAMEWORK_RULE_FLAGS = {"python_deps": re.I, "node_deps": re.I, "java_deps": re.I, "java_source": 0}
+# Files detected by presence alone (non-empty content)
+FRAMEWORK_MARKER_FILES = {"tsconfig.json": "TypeScript", "Dockerfile": "Docker"}
+_DEPENDENCY_FILE_SOURCES = {
+    "requirements.txt": "python_deps",
+    "Pipfile": "python_deps",
+    "package.json": "node_deps",
+    "pom.xml": "java_deps",
+    "build.gradle": "java_deps",
+}
+
+
+def _compile_rules(rules: List[Tuple[str, Tuple[str, ...]]], flags: int):
+    """ Compiles one source's rules into a single alternation of named groups. """
+    pattern = "|".join(f"(?P<r{index}>{rule_pattern})"
+                       for index, (rule_pattern, _) in enumerate(rules))
+    frameworks_by_group = {f"r{index}": frameworks
+                           for index, (_, frameworks) in enumerate(rules)}
+    return re.compile(pattern, flags), frameworks_by_group
+
+
+_COMPILED_FRAMEWORK_RULES = {source: _compile_rules(rules, FRAMEWORK_RULE_FLAGS[source])
+                             for source, rules in FRAMEWORK_RULES.items()}
+_FRAMEWORKS_BY_SOURCE = {source: {name for _, frameworks in rules for name in frameworks}
+                         for source, rules in FRAMEWORK_RULES.items()}
+
+
+def _framework_source(filename: str) -> Optional[str]:
+    if filename.endswith(".java"):
+        return "java_source"
+    return _DEPENDENCY_FILE_SOURCES.get(filename)
+
+
+class FrameworkDetector:
+    """
+    Streaming framework detector: feed() files one at a time, read `frameworks` at the end.
+    Each file is scanned once with its source's compiled pattern, and scanning stops as
+    soon as every framework that source can report has been found.
+    """
+
+    def __init__(self):
+        self.found: Set[str] = set()
+
+    def feed(self, filename: str, content: str) -> None:
+        if filename.endswith(".ipynb"):
+            self.found.add("Jupyter Notebook")
+        if not content:
+            return
+        marker = FRAMEWORK_MARKER_FILES.get(filename)
+        if marker:
+            self.found.add(marker)
+        source = _framework_source(filename)
+        if source is None:
+            return
+        candidates = _FRAMEWORKS_BY_SOURCE[source]
+        if candidates <= self.found:
+            return
+        pattern, frameworks_by_group = _COMPILED_FRAMEWORK_RULES[source]
+        for match in pattern.finditer(content):
+            self.found.update(frameworks_by_group[match.lastgroup])
+            if candidates <= self.found:
+                break
+
+    @property
+    def frameworks(self) -> List[str]:
+        return sorted(self.found)
+
+
+def detect_frameworks_from_files(file_contents: dict) -> List[str]:
+    """
+    Given a dict of {filename: content}, returns a sorted list of detected frameworks/libraries.
+    """
+    detector = FrameworkDetector()
     for filename, content in file_contents.items():
-        if filename.endswith(".java"):
-            java_files_content += content + "\n"
-    
-    if java_files_content:
-        # Spring Framework detection from imports or annotations
-        if re.search(r'import\s+org\.springframework|@Controller|@Service|@Repository|@Component|@RestController|@Autowired', java_files_content):
-            frameworks.add("Spring")
-        
-        # Hibernate/JPA detection
-        if re.search(r'import\s+javax\.persistence|import\s+jakarta\.persistence|import\s+org\.hibernate|@Entity|@Table|@Column|@Id|EntityManager', java_files_content):
-            frameworks.add("Hibernate")
-        
-        # JUnit detection
-        if re.search(r'import\s+org\.junit|@Test|@Before|@After|Assert\.|@RunWith', java_files_content):
-            frameworks.add("JUnit")
-        
-        # Jakarta EE / Java EE
-        if re.search(r'import\s+javax\.|import\s+jakarta\.|@EJB|@Stateless|@Stateful|@MessageDriven|@WebServlet', java_files_content):
-            frameworks.add("Jakarta EE")
-        
-        # Android detection
-        if re.search(r'import\s+android\.|extends\s+Activity|extends\s+AppCompatActivity|R\.layout|findViewById|setContentView', java_files_content):
-            frameworks.add("Android")
-        
-        # Java FX
-        if re.search(r'import\s+javafx\.|extends\s+Application|@FXML', java_files_content):
-            frameworks.add("JavaFX")
-        
-        # Micronaut
-        if re.search(r'import\s+io\.micronaut\.|@Controller|@Inject', java_files_content):
-            frameworks.add("Micronaut")
-        
-        # Quarkus
-        if re.search(r'import\s+io\.quarkus\.|@QuarkusTest', java_files_content):
-            frameworks.add("Quarkus")
-            
-        # Struts
-        if re.search(r'import\s+org\.apache\.struts|extends\s+Action|extends\s+ActionSupport', java_files_content):
-            frameworks.add("Struts")
-            
-        # Guice
-        if re.search(r'import\s+com\.google\.inject|@Inject|@Singleton', java_files_content):
-            frameworks.add("Guice")
-            
-        # GWT
-        if re.search(r'import\s+com\.google\.gwt|extends\s+RemoteServiceServlet|implements\s+EntryPoint', java_files_content):
-            frameworks.add("GWT")
-
-    # JavaScript/TypeScript
-    if file_contents.get("tsconfig.json"):
-        frameworks.add("TypeScript")
-
-    # Docker
-    if file_contents.get("Dockerfile"):
-        frameworks.add("Docker")
-
-    # Jupyter
-    if any(fname.endswith(".ipynb") for fname in file_contents):
-        frameworks.add("Jupyter Notebook")
-
-    return sorted(frameworks)
+        detector.feed(filename, content)
+    return detector.frameworks
 
 print("[WALKTHROUGH] code_parser.py: Finished loading.")
 sys.stdout.flush()
\ No newline at end of file
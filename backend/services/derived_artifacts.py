@@ -0,0 +1,271 @@
+# services/derived_artifacts.py
+import sys
+import json
+import hashlib
+import threading
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from config.config import settings
+from services import result_artifacts, llm_backend
+from services.single_flight import SingleFlight
+
+print("[WALKTHROUGH] derived_artifacts.py: Loading...")
+sys.stdout.flush()
+
+# Outputs rendered from a finished analysis (graphs, UML). Bump a version when its
+# generator changes so previously stored outputs are no longer served.
+GENERATOR_VERSIONS = {"graphs": 1, "uml": 3}
+
+# The parts of the analysis the generators read; the content hash covers exactly these
+INPUT_PATHS = (
+    ("analysis_details", "code_analysis", "unique_imports"),
+    ("analysis_details", "code_analysis", "unique_classes"),
+    ("analysis_details", "code_analysis", "unique_functions"),
+    ("analysis_details", "code_analysis", "class_models"),
+    ("file_type_distribution",),
+)
+
+# The analysis result artifacts the generators need hydrated
+REQUIRED_RESULT_ARTIFACTS = ["code_analysis"]
+
+_flights = SingleFlight()
+_metrics_lock = threading.Lock()
+_metrics = {"stored_hits": 0, "generated": 0, "stored": 0, "not_stored": 0, "store_errors": 0,
+            "stream_generations": 0, "stream_readers": 0}
+
+
+def _count(metric: str) -> None:
+    with _metrics_lock:
+        _metrics[metric] += 1
+
+
+def _generator(kind: str):
+    # Imported lazily: matplotlib and the Gemini client are heavy and only needed here
+    if kind == "graphs":
+        from services import graph_generator
+        return graph_generator.generate_all_graphs
+    if kind == "uml":
+        from services import uml_generator
+        return uml_generator.generate_all_uml_diagrams
+    raise ValueError(f"Unknown derived artifact kind: {kind}")
+
+
+def _part_generator(kind: str):
+    """ The generator yielding (name, part) pairs for `kind`, and the order of the stored parts. """
+    if kind == "uml":
+        from services import uml_generator
+        return uml_generator.iter_uml_diagrams, uml_generator.UML_DIAGRAM_NAMES
+    raise ValueError(f"No streamed generator for derived artifact kind: {kind}")
+
+
+def content_hash(kind: str, analysis_data: Dict[str, Any]) -> str:
+    """
+    Hash of the generator version, the analysis fields it reads and its output options
+    (for UML, also the LLM model that writes the sequence and activity diagrams).
+    """
+    inputs = []
+    for path in INPUT_PATHS:
+        value = analysis_data
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        inputs.append(value)
+    if kind == "uml":
+        inputs.append([settings.PLANTUML_FORMAT, settings.UML_CLASS_DIAGRAM_MAX_CLASSES,
+                       settings.UML_CLASS_DIAGRAM_MAX_DIAGRAMS, settings.UML_CLASS_DIAGRAM_LLM_ENRICH,
+                       llm_backend.get_backend().model_name])
+    payload = json.dumps({"kind": kind, "version": GENERATOR_VERSIONS[kind], "inputs": inputs},
+                         sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _owner(digest: str) -> str:
+    # Stored in the artifacts table under a content key rather than a task id, so every
+    # analysis with the same inputs (re-runs, reused commits) shares one stored output
+    return f"content:{digest}"
+
+
+def _has_errors(value: Any) -> bool:
+    """ Generators report failures inside their output; those outputs are not stored. """
+    if not isinstance(value, dict) or value.get("error"):
+        return True
+    for part in value.values():
+        if not isinstance(part, dict):
+            continue
+        if part.get("error") or part.get("image") == "":
+            return True
+        if any(diagram.get("image") == "" for diagram in part.get("diagrams", [])):
+            return True
+    return False
+
+
+def load_stored(kind: str, analysis_data: Dict[str, Any]) -> Optional[bytes]:
+    """ Returns the stored JSON output for these inputs, or None. """
+    if not settings.DERIVED_ARTIFACTS_ENABLED:
+        return None
+    try:
+        raw = result_artifacts.load_artifact_bytes(_owner(content_hash(kind, analysis_data)), kind)
+    except Exception as e:
+        print(f"[WALKTHROUGH] derived_artifacts.py: WARNING: Could not read stored {kind}: {e}")
+        sys.stdout.flush()
+        return None
+    if raw is not None:
+        _count("stored_hits")
+    return raw
+
+
+def get_or_generate(kind: str, analysis_data: Dict[str, Any]) -> bytes:
+    """
+    Returns the JSON output for `kind`, serving the stored copy when there is one and
+    generating (then storing) it otherwise. Concurrent requests for the same inputs in
+    this process share a single generation. Blocking; run it off the event loop.
+    """
+    raw = load_stored(kind, analysis_data)
+    if raw is not None:
+        return raw
+    digest = content_hash(kind, analysis_data)
+    return _flights.do((kind, digest), lambda: _generate(kind, digest, analysis_data))
+
+
+def _generate(kind: str, digest: str, analysis_data: Dict[str, Any]) -> bytes:
+    # A previous leader (or the worker) may have stored it since our lookup
+    raw = load_stored(kind, analysis_data)
+    if raw is not None:
+        return raw
+    value = _generator(kind)(analysis_data)
+    _count("generated")
+    return store_output(kind, analysis_data, value, digest)
+
+
+def store_output(kind: str, analysis_data: Dict[str, Any], value: Any, digest: Optional[str] = None) -> bytes:
+    """
+    Stores an output generated outside get_or_generate() (e.g. streamed to a client)
+    unless it reports errors. Returns its JSON. Never raises on storage errors.
+    """
+    raw = json.dumps(value).encode("utf-8")
+    if _has_errors(value):
+        _count("not_stored")
+        print(f"[WALKTHROUGH] derived_artifacts.py: Not storing {kind} output with errors.")
+        sys.stdout.flush()
+    elif settings.DERIVED_ARTIFACTS_ENABLED:
+        try:
+            result_artifacts.save_artifact_bytes(
+                _owner(digest or content_hash(kind, analysis_data)), kind, raw)
+            _count("stored")
+        except Exception as e:
+            _count("store_errors")
+            print(f"[WALKTHROUGH] derived_artifacts.py: WARNING: Could not store {kind}: {e}")
+            sys.stdout.flush()
+    return raw
+
+
+class _StreamedGeneration:
+    """ One generation in progress; the (name, part) pairs produced so far are kept for every reader. """
+
+    def __init__(self):
+        self.parts: List[Tuple[str, Any]] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.condition = threading.Condition()
+
+
+class PartsReader:
+    """ Reads a shared generation from its first part; see stream_parts(). """
+
+    def __init__(self, generation: _StreamedGeneration):
+        self._generation = generation
+        self._index = 0
+        self._closed = False
+
+    def next_part(self) -> Optional[Tuple[str, Any]]:
+        """
+        Blocks until the next (name, part) pair is ready. Returns None once the generation
+        finished or the reader was closed, and re-raises the generation's error.
+        """
+        generation = self._generation
+        with generation.condition:
+            while not self._closed and not generation.finished and self._index >= len(generation.parts):
+                generation.condition.wait()
+            if self._closed:
+                return None
+            if self._index < len(generation.parts):
+                self._index += 1
+                return generation.parts[self._index - 1]
+            if generation.error is not None:
+                raise generation.error
+            return None
+
+    def close(self) -> None:
+        """ Stops reading (the generation goes on for others); releases a blocked next_part(). """
+        with self._generation.condition:
+            self._closed = True
+            self._generation.condition.notify_all()
+
+
+_streams: Dict[Tuple[str, str], _StreamedGeneration] = {}
+_streams_lock = threading.Lock()
+
+
+def stream_parts(kind: str, analysis_data: Dict[str, Any]) -> PartsReader:
+    """
+    Returns a reader of the (name, part) pairs of `kind` as they are generated. Concurrent
+    readers for the same inputs in this process share one generation, which runs on its
+    own thread, goes on when readers leave and stores the complete output. Check
+    load_stored() first; only "uml" has a part-wise generator.
+    """
+    digest = content_hash(kind, analysis_data)
+    with _streams_lock:
+        generation = _streams.get((kind, digest))
+        if generation is None:
+            generation = _streams[(kind, digest)] = _StreamedGeneration()
+            _count("stream_generations")
+            threading.Thread(target=_generate_parts, args=(kind, digest, analysis_data, generation),
+                             name=f"{kind}-stream", daemon=True).start()
+    _count("stream_readers")
+    return PartsReader(generation)
+
+
+def _generate_parts(kind: str, digest: str, analysis_data: Dict[str, Any], generation: _StreamedGeneration) -> None:
+    iterate, names = _part_generator(kind)
+    try:
+        # A previous generation may have stored it since the caller's lookup
+        raw = load_stored(kind, analysis_data)
+        stored = json.loads(raw) if raw is not None else None
+        parts = {}
+        for name, part in (stored.items() if stored is not None else iterate(analysis_data)):
+            parts[name] = part
+            with generation.condition:
+                generation.parts.append((name, part))
+                generation.condition.notify_all()
+        if stored is None:
+            _count("generated")
+            store_output(kind, analysis_data, {name: parts[name] for name in names if name in parts}, digest)
+    except Exception as e:
+        print(f"[WALKTHROUGH] derived_artifacts.py: ERROR streaming {kind}: {e}")
+        sys.stdout.flush()
+        generation.error = e
+    finally:
+        with _streams_lock:
+            _streams.pop((kind, digest), None)
+        with generation.condition:
+            generation.finished = True
+            generation.condition.notify_all()
+
+
+def precompute(analysis_data: Dict[str, Any], kinds: Iterable[str]) -> Dict[str, bool]:
+    """ Generates and stores each kind not stored yet. Returns {kind: stored without errors}. """
+    outcome = {}
+    for kind in kinds:
+        raw = get_or_generate(kind, analysis_data)
+        outcome[kind] = not _has_errors(json.loads(raw))
+    return outcome
+
+
+def get_metrics() -> Dict[str, Any]:
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    metrics["single_flight"] = _flights.get_metrics()
+    return metrics
+
+
+print("[WALKTHROUGH] derived_artifacts.py: Finished loading.")
+sys.stdout.flush()
@@ -3,8 +3,17 @@ import os
 import requests
 import base64
 import sys
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from urllib.parse import urlparse
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Iterable, Iterator, Callable
+from requests.adapters import HTTPAdapter
+from services.blob_cache import git_blob_sha
+from services.rate_limiter import RateLimitWaitTimeout, github_rate_limiter, token_key_for
+from services.http_cache import get_http_cache
+from services.single_flight import SingleFlight
+from config.config import settings
 
 print("[WALKTHROUGH] github_api.py: Loading...")
 sys.stdout.flush()
@@ -12,6 +21,8 @@ sys.stdout.flush()
 GITHUB_API_BASE = "https://api.github.com"
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 DEFAULT_HEADERS = {"Accept": "application/vnd.github.v3+json"}
+# The Contents API refuses files above 1 MB; apply the same limit to archive members
+MAX_ARCHIVE_MEMBER_BYTES = 1024 * 1024
 if GITHUB_TOKEN:
     DEFAULT_HEADERS["Authorization"] = f"token {GITHUB_TOKEN}"
     print("[WALKTHROUGH] github_api.py: Using GitHub API Token.")
@@ -52,136 +63,359 @@ def get_owner_repo(repo_url: str) -> Optional[Tuple[str, str]]:
     return None
 
 
-def get_default_branch(owner: str, repo: str, user_token: Optional[str] = None) -> str:
-    """ Gets the default branch name via GitHub API. Raises ValueError on failure. """
-    print(
-        f"[WALKTHROUGH] github_api.py: Getting default branch for {owner}/{repo}...")
-    sys.stdout.flush()
-    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}"
-    try:
-        response = requests.get(
-            url, headers=get_headers(user_token), timeout=10)
-        # response.raise_for_status()
-        repo_info = response.json()
-        # print("repo_info: ", repo_info)
-        default_branch = repo_info.get('default_branch', 'main')
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the process-wide keep-alive session used for all GitHub calls.
+    Connection pools are sized so concurrent content fetches reuse TLS connections.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=settings.GITHUB_POOL_CONNECTIONS,
+                                  pool_maxsize=settings.GITHUB_POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+class GitHubClient:
+    """
+    GitHub API client for one analysis task (or request). All clients share the pooled
+    session; each carries the headers for its token and serves repeated GETs of
+    memoized endpoints (e.g. the repo metadata) from the first response.
+    """
+
+    def __init__(self, user_token: Optional[str] = None, fair_key: Optional[str] = None):
+        self.user_token = user_token
+        self.headers = get_headers(user_token)
+        self.session = get_session()
+        self.token_key = token_key_for(self.headers)
+        # Requests are scheduled fairly between keys sharing a token (one key per task)
+        self.fair_key = fair_key or f"client-{id(self)}"
+        self._memo: Dict[str, requests.Response] = {}
+        self._memo_lock = threading.Lock()
+        self._memo_flights = SingleFlight()
+
+    def get(self, url: str, timeout: Any, stream: bool = False, conditional: bool = False) -> requests.Response:
+        """
+        Sends a GET through the rate limiter. Responses rejected by a primary or secondary
+        rate limit are retried once the limiter allows it, up to GITHUB_MAX_RETRIES times.
+        With conditional=True the request carries stored ETag/Last-Modified validators and
+        a 304 is answered from the HTTP cache.
+        """
+        http_cache = get_http_cache() if conditional else None
+        headers = self.headers
+        if http_cache:
+            headers = {**self.headers, **http_cache.conditional_headers(self.token_key, url)}
+        attempt = 0
+        while True:
+            github_rate_limiter.acquire(self.token_key, self.fair_key)
+            response = self.session.get(
+                url, headers=headers, timeout=timeout, stream=stream)
+            retry_delay = github_rate_limiter.observe(self.token_key, response)
+            if retry_delay is None or attempt >= settings.GITHUB_MAX_RETRIES \
+                    or retry_delay > settings.GITHUB_MAX_RETRY_WAIT_SECONDS:
+                break
+            response.close()
+            attempt += 1
+        if http_cache:
+            response = http_cache.resolve(self.token_key, url, response)
+        return response
+
+    def get_memoized(self, url: str, timeout: Any) -> requests.Response:
+        """
+        GETs a metadata URL once per client; later calls reuse the response. The request is
+        conditional, so unchanged metadata costs no rate limit. Errors are not memoized.
+        """
+        with self._memo_lock:
+            response = self._memo.get(url)
+        if response is not None:
+            return response
+        # Concurrent first calls for the same URL share one request; other URLs are not held up
+        return self._memo_flights.do(url, lambda: self._fetch_memoized(url, timeout))
+
+    def _fetch_memoized(self, url: str, timeout: Any) -> requests.Response:
+        with self._memo_lock:
+            response = self._memo.get(url)
+        if response is not None:
+            return response
+        response = self.get(url, timeout=timeout, conditional=True)
+        if response.ok:
+            with self._memo_lock:
+                self._memo[url] = response
+        return response
+
+    def _repo_metadata(self, owner: str, repo: str) -> requests.Response:
+        # get_default_branch and get_repo_info both read /repos/{owner}/{repo}
+        return self.get_memoized(f"{GITHUB_API_BASE}/repos/{owner}/{repo}", timeout=10)
+
+    def get_default_branch(self, owner: str, repo: str) -> str:
+        """ Gets the default branch name via GitHub API. Raises ValueError on failure. """
         print(
-            f"[WALKTHROUGH] github_api.py: Default branch is '{default_branch}'.")
-        sys.stdout.flush()
-        return default_branch
-    except requests.exceptions.RequestException as e:
-        print(f"[WALKTHROUGH] github_api.py: ERROR fetching repo info: {e}")
+            f"[WALKTHROUGH] github_api.py: Getting default branch for {owner}/{repo}...")
         sys.stdout.flush()
-        raise ValueError(
-            f"Failed to fetch repo info for {owner}/{repo}. Is it public? Error: {e}") from e
+        try:
+            response = self._repo_metadata(owner, repo)
+            # response.raise_for_status()
+            repo_info = response.json()
+            # print("repo_info: ", repo_info)
+            default_branch = repo_info.get('default_branch', 'main')
+            print(
+                f"[WALKTHROUGH] github_api.py: Default branch is '{default_branch}'.")
+            sys.stdout.flush()
+            return default_branch
+        except requests.exceptions.RequestException as e:
+            print(f"[WALKTHROUGH] github_api.py: ERROR fetching repo info: {e}")
+            sys.stdout.flush()
+            raise ValueError(
+                f"Failed to fetch repo info for {owner}/{repo}. Is it public? Error: {e}") from e
 
+    def get_repo_tree(self, owner: str, repo: str, branch: str) -> List[Dict[str, Any]]:
+        """ Gets the recursive file tree via GitHub API. Raises ValueError on failure. """
+        print(
+            f"[WALKTHROUGH] github_api.py: Getting file tree for {owner}/{repo} (branch: {branch})...")
+        sys.stdout.flush()
+        url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/git/trees/{branch}?recursive=1"
+        try:
+            response = self.get(url, timeout=30, conditional=True)
+            response.raise_for_status()
+            tree_data = response.json()
+            if tree_data.get("truncated"):
+                print(
+                    f"[WALKTHROUGH] github_api.py: WARNING - File tree was truncated by API.")
+                sys.stdout.flush()
+            file_list = tree_data.get("tree", [])
+            print(
+                f"[WALKTHROUGH] github_api.py: Found {len(file_list)} items in tree.")
+            sys.stdout.flush()
+            return file_list
+        except requests.exceptions.RequestException as e:
+            print(f"[WALKTHROUGH] github_api.py: ERROR fetching file tree: {e}")
+            sys.stdout.flush()
+            raise ValueError(
+                f"Failed to fetch file tree for {owner}/{repo}. Error: {e}") from e
 
-def get_repo_tree(owner: str, repo: str, branch: str, user_token: Optional[str] = None) -> List[Dict[str, Any]]:
-    """ Gets the recursive file tree via GitHub API. Raises ValueError on failure. """
-    print(
-        f"[WALKTHROUGH] github_api.py: Getting file tree for {owner}/{repo} (branch: {branch})...")
-    sys.stdout.flush()
-    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/git/trees/{branch}?recursive=1"
-    try:
-        response = requests.get(
-            url, headers=get_headers(user_token), timeout=30)
-        response.raise_for_status()
-        tree_data = response.json()
-        if tree_data.get("truncated"):
+    def get_file_content(self, owner: str, repo: str, file_path: str, branch: str) -> Optional[str]:
+        """
+        Gets file content via GitHub API (decodes Base64). Returns None on failure, but
+        raises RateLimitWaitTimeout when no rate limit budget became available in time.
+        """
+        # print(f"[WALKTHROUGH] github_api.py: Getting content for {file_path}...") # Verbose
+        url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/contents/{file_path}?ref={branch}"
+        try:
+            response = self.get(url, timeout=15)
+            response.raise_for_status()
+            file_info = response.json()
+            content_b64 = file_info.get('content')
+            if content_b64:
+                decoded_bytes = base64.b64decode(content_b64)
+                return decoded_bytes.decode('utf-8', errors='ignore')
+            return None  # No content field
+        except RateLimitWaitTimeout:
+            raise  # No budget left: fail the analysis rather than silently drop files
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code != 404:  # Log errors other than Not Found
+                print(
+                    f"[WALKTHROUGH] github_api.py: ERROR fetching content for {file_path} (Status {e.response.status_code}): {e}")
+                sys.stdout.flush()
+            # else: print(f"[WALKTHROUGH] github_api.py: File not found: {file_path}") # Verbose
+            return None
+        except Exception as e:  # Catch other errors like decoding
             print(
-                f"[WALKTHROUGH] github_api.py: WARNING - File tree was truncated by API.")
+                f"[WALKTHROUGH] github_api.py: ERROR processing content for {file_path}: {e}")
             sys.stdout.flush()
-        file_list = tree_data.get("tree", [])
+            return None
+
+    def iter_file_contents(self, owner: str, repo: str, file_paths: Iterable[str], branch: str, max_workers: int = 8) -> Iterator[Tuple[str, Optional[str]]]:
+        """
+        Fetches file contents concurrently, yielding (path, content) as each request completes.
+        At most max_workers requests are in flight; paths are consumed lazily, so closing
+        the generator early (e.g. once a file cap is reached) stops further fetches.
+        Content is None for files that could not be fetched, as with get_file_content;
+        RateLimitWaitTimeout is raised to the caller.
+        """
+        paths = iter(file_paths)
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="github-fetch") as executor:
+            def submit_next() -> bool:
+                file_path = next(paths, None)
+                if file_path is None:
+                    return False
+                future = executor.submit(
+                    self.get_file_content, owner, repo, file_path, branch)
+                in_flight[future] = file_path
+                return True
+
+            for _ in range(max(1, max_workers)):
+                if not submit_next():
+                    break
+            try:
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        file_path = in_flight.pop(future)
+                        submit_next()
+                        try:
+                            content = future.result()
+                        except RateLimitWaitTimeout:
+                            raise
+                        except Exception as e:  # get_file_content swallows other errors, but be safe
+                            print(
+                                f"[WALKTHROUGH] github_api.py: ERROR fetching content for {file_path}: {e}")
+                            sys.stdout.flush()
+                            content = None
+                        yield file_path, content
+            finally:
+                # Drop queued work if the consumer stopped early
+                for future in in_flight:
+                    future.cancel()
+
+    def iter_repo_archive(self, owner: str, repo: str, branch: str, wanted: Optional[Callable[[str], bool]] = None) -> Iterator[Tuple[Dict[str, Any], Optional[str]]]:
+        """
+        Downloads the tarball for a branch in a single request and streams it through tarfile
+        without extracting to disk. Yields (tree_item, content) for every file and directory,
+        where tree_item mirrors the entries returned by get_repo_tree (path, mode, type, size).
+        Content is only read for files accepted by `wanted`; it is None otherwise. Files that
+        are read also get their git blob "sha", computed locally from the archive bytes.
+        Raises ValueError if the archive cannot be downloaded or read.
+        """
         print(
-            f"[WALKTHROUGH] github_api.py: Found {len(file_list)} items in tree.")
+            f"[WALKTHROUGH] github_api.py: Streaming archive for {owner}/{repo} (branch: {branch})...")
         sys.stdout.flush()
-        return file_list
-    except requests.exceptions.RequestException as e:
-        print(f"[WALKTHROUGH] github_api.py: ERROR fetching file tree: {e}")
-        sys.stdout.flush()
-        raise ValueError(
-            f"Failed to fetch file tree for {owner}/{repo}. Error: {e}") from e
+        url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/tarball/{branch}"
+        item_count = 0
+        try:
+            with self.get(url, timeout=(10, 60), stream=True) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                with tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+                    for member in archive:
+                        # Members are prefixed with a single "<owner>-<repo>-<sha>/" directory
+                        parts = member.name.split("/", 1)
+                        if len(parts) < 2 or not parts[1].strip("/"):
+                            continue
+                        path = parts[1].rstrip("/")
+                        item = {
+                            "path": path,
+                            "mode": _archive_member_mode(member),
+                            "type": "tree" if member.isdir() else "blob",
+                        }
+                        content = None
+                        if member.isfile():
+                            item["size"] = member.size
+                            if member.size <= MAX_ARCHIVE_MEMBER_BYTES and (wanted is None or wanted(path)):
+                                file_obj = archive.extractfile(member)
+                                if file_obj is not None:
+                                    raw_bytes = file_obj.read()
+                                    item["sha"] = git_blob_sha(raw_bytes)
+                                    content = raw_bytes.decode('utf-8', errors='ignore')
+                        elif not member.isdir() and not member.issym():
+                            continue  # Skip special entries (e.g. pax headers)
+                        item_count += 1
+                        yield item, content
+        except (requests.exceptions.RequestException, tarfile.TarError) as e:
+            print(f"[WALKTHROUGH] github_api.py: ERROR streaming archive: {e}")
+            sys.stdout.flush()
+            raise ValueError(
+                f"Failed to download archive for {owner}/{repo}. Error: {e}") from e
 
+        print(
+            f"[WALKTHROUGH] github_api.py: Archive streamed, found {item_count} items.")
+        sys.stdout.flush()
 
-def get_file_content(owner: str, repo: str, file_path: str, branch: str, user_token: Optional[str] = None) -> Optional[str]:
-    """ Gets file content via GitHub API (decodes Base64). Returns None on failure. """
-    # print(f"[WALKTHROUGH] github_api.py: Getting content for {file_path}...") # Verbose
-    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/contents/{file_path}?ref={branch}"
-    try:
-        response = requests.get(
-            url, headers=get_headers(user_token), timeout=15)
-        response.raise_for_status()
-        file_info = response.json()
-        content_b64 = file_info.get('content')
-        if content_b64:
-            decoded_bytes = base64.b64decode(content_b64)
-            return decoded_bytes.decode('utf-8', errors='ignore')
-        return None  # No content field
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code != 404:  # Log errors other than Not Found
-            print(
-                f"[WALKTHROUGH] github_api.py: ERROR fetching content for {file_path} (Status {e.response.status_code}): {e}")
-            sys.stdout.flush()
-        # else: print(f"[WALKTHROUGH] github_api.py: File not found: {file_path}") # Verbose
-        return None
-    except Exception as e:  # Catch other errors like decoding
+    def get_latest_commit_info(self, owner: str, repo: str, branch: str) -> Dict[str, Any]:
+        """ Gets info for the latest commit on a branch via GitHub API. """
         print(
-            f"[WALKTHROUGH] github_api.py: ERROR processing content for {file_path}: {e}")
+            f"[WALKTHROUGH] github_api.py: Getting latest commit for {owner}/{repo} (branch: {branch})...")
         sys.stdout.flush()
-        return None
+        url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/commits?sha={branch}&per_page=1"
+        commit_info = {"sha": None, "date": "N/A",
+                       "message": "Could not fetch commit info", "author": "N/A"}
+        try:
+            response = self.get_memoized(url, timeout=10)
+            response.raise_for_status()
+            commits_data = response.json()
+            if commits_data:
+                latest = commits_data[0]
+                commit_info["sha"] = latest.get("sha")
+                commit_info["date"] = latest.get("commit", {}).get(
+                    "author", {}).get("date", "N/A")
+                commit_info["message"] = latest.get("commit", {}).get(
+                    "message", "N/A").strip().splitlines()[0][:150]
+                commit_info["author"] = latest.get("commit", {}).get(
+                    "author", {}).get("name", "N/A")
+            else:
+                commit_info["message"] = "No commits found for the branch via API"
+        except requests.exceptions.RequestException as e:
+            print(f"[WALKTHROUGH] github_api.py: ERROR fetching commit info: {e}")
+            sys.stdout.flush()
+            # Keep default error message
 
+        print(f"[WALKTHROUGH] github_api.py: Latest commit info retrieved.")
+        sys.stdout.flush()
+        return commit_info
 
-def get_latest_commit_info(owner: str, repo: str, branch: str, user_token: Optional[str] = None) -> Dict[str, Any]:
-    """ Gets info for the latest commit on a branch via GitHub API. """
-    print(
-        f"[WALKTHROUGH] github_api.py: Getting latest commit for {owner}/{repo} (branch: {branch})...")
-    sys.stdout.flush()
-    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/commits?sha={branch}&per_page=1"
-    commit_info = {"date": "N/A",
-                   "message": "Could not fetch commit info", "author": "N/A"}
-    try:
-        response = requests.get(
-            url, headers=get_headers(user_token), timeout=10)
-        response.raise_for_status()
-        commits_data = response.json()
-        if commits_data:
-            latest = commits_data[0]
-            commit_info["date"] = latest.get("commit", {}).get(
-                "author", {}).get("date", "N/A")
-            commit_info["message"] = latest.get("commit", {}).get(
-                "message", "N/A").strip().splitlines()[0][:150]
-            commit_info["author"] = latest.get("commit", {}).get(
-                "author", {}).get("name", "N/A")
-        else:
-            commit_info["message"] = "No commits found for the branch via API"
-    except requests.exceptions.RequestException as e:
-        print(f"[WALKTHROUGH] github_api.py: ERROR fetching commit info: {e}")
+    def get_repo_info(self, owner: str, repo: str) -> dict:
+        """Fetches the full repository info from the GitHub API."""
+        print(
+            f"[WALKTHROUGH] github_api.py: Fetching full repo info for {owner}/{repo}...")
         sys.stdout.flush()
-        # Keep default error message
+        try:
+            response = self._repo_metadata(owner, repo)
+            response.raise_for_status()
+            repo_info = response.json()
+            print(f"[WALKTHROUGH] github_api.py: Repo info fetched.")
+            sys.stdout.flush()
+            return repo_info
+        except Exception as e:
+            print(f"[WALKTHROUGH] github_api.py: ERROR fetching repo info: {e}")
+            sys.stdout.flush()
+            return {}
 
-    print(f"[WALKTHROUGH] github_api.py: Latest commit info retrieved.")
-    sys.stdout.flush()
-    return commit_info
+
+def _archive_member_mode(member: tarfile.TarInfo) -> str:
+    """ Maps a tar member to the git tree mode string the trees API would report. """
+    if member.isdir():
+        return "040000"
+    if member.issym():
+        return "120000"
+    return "100755" if member.mode & 0o111 else "100644"
+
+
+# --- Module-level helpers (one-off calls; tasks should share a GitHubClient) ---
+
+def get_default_branch(owner: str, repo: str, user_token: Optional[str] = None) -> str:
+    return GitHubClient(user_token).get_default_branch(owner, repo)
+
+
+def get_repo_tree(owner: str, repo: str, branch: str, user_token: Optional[str] = None) -> List[Dict[str, Any]]:
+    return GitHubClient(user_token).get_repo_tree(owner, repo, branch)
+
+
+def get_file_content(owner: str, repo: str, file_path: str, branch: str, user_token: Optional[str] = None) -> Optional[str]:
+    return GitHubClient(user_token).get_file_content(owner, repo, file_path, branch)
+
+
+def iter_file_contents(owner: str, repo: str, file_paths: Iterable[str], branch: str, user_token: Optional[str] = None, max_workers: int = 8) -> Iterator[Tuple[str, Optional[str]]]:
+    return GitHubClient(user_token).iter_file_contents(owner, repo, file_paths, branch, max_workers=max_workers)
+
+
+def iter_repo_archive(owner: str, repo: str, branch: str, user_token: Optional[str] = None, wanted: Optional[Callable[[str], bool]] = None) -> Iterator[Tuple[Dict[str, Any], Optional[str]]]:
+    return GitHubClient(user_token).iter_repo_archive(owner, repo, branch, wanted=wanted)
+
+
+def get_latest_commit_info(owner: str, repo: str, branch: str, user_token: Optional[str] = None) -> Dict[str, Any]:
+    return GitHubClient(user_token).get_latest_commit_info(owner, repo, branch)
 
 
 def get_repo_info(owner: str, repo: str, user_token: Optional[str] = None) -> dict:
-    """Fetches the full repository info from the GitHub API."""
-    print(
-        f"[WALKTHROUGH] github_api.py: Fetching full repo info for {owner}/{repo}...")
-    sys.stdout.flush()
-    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}"
-    try:
-        response = requests.get(
-            url, headers=get_headers(user_token), timeout=10)
-        response.raise_for_status()
-        repo_info = response.json()
-        print(f"[WALKTHROUGH] github_api.py: Repo info fetched.")
-        sys.stdout.flush()
-        return repo_info
-    except Exception as e:
-        print(f"[WALKTHROUGH] github_api.py: ERROR fetching repo info: {e}")
-        sys.stdout.flush()
-        return {}
+    return GitHubClient(user_token).get_repo_info(owner, repo)
 
 
 print("[WALKTHROUGH] github_api.py: Finished loading.")
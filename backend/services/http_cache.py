@@ -0,0 +1,123 @@
+# services/http_cache.py
+import sys
+import json
+import hashlib
+import threading
+from typing import Dict, Optional
+
+import requests
+from config.config import settings
+from services.blob_cache import CacheBackend, create_backend
+
+print("[WALKTHROUGH] http_cache.py: Loading...")
+sys.stdout.flush()
+
+
+class ConditionalRequestCache:
+    """
+    Stores ETag/Last-Modified validators and bodies per (token, URL). Callers send the
+    validators as If-None-Match/If-Modified-Since and, on a 304, get the stored body back
+    as a regular 200 response. GitHub does not count 304s against the rate limit.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @staticmethod
+    def _key(token_key: str, url: str) -> str:
+        return "http:" + hashlib.sha256(f"{token_key} {url}".encode("utf-8")).hexdigest()
+
+    def _load(self, token_key: str, url: str) -> Optional[Dict[str, str]]:
+        try:
+            value = self.backend.get(self._key(token_key, url))
+            return json.loads(value) if value is not None else None
+        except Exception as e:
+            print(f"[WALKTHROUGH] http_cache.py: ERROR reading cache: {e}")
+            sys.stdout.flush()
+            return None
+
+    def conditional_headers(self, token_key: str, url: str) -> Dict[str, str]:
+        """ Validator headers to add to a request for this URL (empty if nothing is stored). """
+        entry = self._load(token_key, url)
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def resolve(self, token_key: str, url: str, response: requests.Response) -> requests.Response:
+        """
+        Turns a 304 into the stored 200 response and stores new validators from a 200.
+        Other responses are returned unchanged; error responses are counted apart from
+        cache misses and never stored.
+        """
+        if response.status_code == 304:
+            entry = self._load(token_key, url)
+            if entry is not None:
+                self.hits += 1
+                cached = requests.Response()
+                cached.status_code = 200
+                cached.url = url
+                cached.encoding = "utf-8"
+                cached._content = entry["body"].encode("utf-8")
+                cached.headers.update(response.headers)
+                cached.headers["Content-Type"] = entry.get("content_type", "application/json")
+                return cached
+            return response
+
+        if response.status_code >= 400:
+            self.errors += 1
+            return response
+
+        self.misses += 1
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code == 200 and (etag or last_modified):
+            entry = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "content_type": response.headers.get("Content-Type", "application/json"),
+                "body": response.text,
+            }
+            try:
+                self.backend.set(self._key(token_key, url), json.dumps(entry).encode("utf-8"))
+            except Exception as e:
+                print(f"[WALKTHROUGH] http_cache.py: ERROR writing cache: {e}")
+                sys.stdout.flush()
+        return response
+
+    def get_metrics(self) -> Dict[str, int]:
+        lookups = self.hits + self.misses
+        return {"not_modified_hits": self.hits, "full_responses": self.misses, "error_responses": self.errors,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None}
+
+
+_http_cache: Optional[ConditionalRequestCache] = None
+_http_cache_initialized = False
+_http_cache_lock = threading.Lock()
+
+
+def get_http_cache() -> Optional[ConditionalRequestCache]:
+    """ Returns the process-wide conditional request cache, or None if disabled. """
+    global _http_cache, _http_cache_initialized
+    with _http_cache_lock:
+        if not _http_cache_initialized:
+            _http_cache_initialized = True
+            try:
+                backend = create_backend(
+                    settings.HTTP_CACHE_BACKEND, settings.HTTP_CACHE_PATH, settings.HTTP_CACHE_MAX_BYTES)
+                _http_cache = ConditionalRequestCache(backend) if backend else None
+            except Exception as e:
+                print(f"[WALKTHROUGH] http_cache.py: ERROR initializing HTTP cache, caching disabled: {e}")
+                sys.stdout.flush()
+                _http_cache = None
+        return _http_cache
+
+
+print("[WALKTHROUGH] http_cache.py: Finished loading.")
+sys.stdout.flush()
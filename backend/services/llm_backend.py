@@ -0,0 +1,283 @@
+# services/llm_backend.py
+import re
+import abc
+import sys
+import json
+import time
+import random
+import hashlib
+import threading
+from typing import Dict, Any, Iterator, List, Optional
+
+from config.config import settings
+from services.prompt_builder import CHARS_PER_TOKEN, estimate_tokens
+
+print("[WALKTHROUGH] llm_backend.py: Loading...")
+sys.stdout.flush()
+
+
+class LLMBlockedError(ValueError):
+    """ The model answered without content (blocked prompt or empty candidates). """
+
+
+class LLMBackend(abc.ABC):
+    """
+    Text generation for llm_handler and uml_generator. `generation` holds the generation
+    config as plain values (max_output_tokens, temperature, response_mime_type, ...).
+    """
+
+    model_name = ""
+
+    def available(self) -> bool:
+        return True
+
+    @abc.abstractmethod
+    def generate(self, prompt: str, generation: Dict[str, Any],
+                 safety_settings: Optional[List[Dict[str, str]]] = None) -> str:
+        """ Returns the whole answer to `prompt`. """
+
+    def stream(self, prompt: str, generation: Dict[str, Any],
+               safety_settings: Optional[List[Dict[str, str]]] = None) -> Iterator[str]:
+        """ Yields the answer in pieces as they are generated. """
+        yield self.generate(prompt, generation, safety_settings)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {}
+
+
+def _candidate_text(response: Any) -> str:
+    return "".join(part.text for candidate in response.candidates[:1] for part in candidate.content.parts)
+
+
+class GeminiBackend(LLMBackend):
+    """ Google Gemini through google-generativeai, configured on first use. """
+
+    def __init__(self, api_key: Optional[str], model_name: str):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+        self._genai = None
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                if not self.api_key:
+                    raise RuntimeError("Gemini API key not configured or model initialization failed.")
+                import google.generativeai as genai
+                print("[WALKTHROUGH] llm_backend.py: Configuring Gemini API...")
+                sys.stdout.flush()
+                genai.configure(api_key=self.api_key)
+                self._genai = genai
+                self._model = genai.GenerativeModel(self.model_name)
+            self.calls += 1
+            return self._model
+
+    def _request(self, prompt: str, generation: Dict[str, Any],
+                 safety_settings: Optional[List[Dict[str, str]]], stream: bool) -> Any:
+        model = self._get_model()
+        return model.generate_content(
+            prompt, generation_config=self._genai.types.GenerationConfig(**generation),
+            safety_settings=safety_settings, stream=stream)
+
+    def generate(self, prompt: str, generation: Dict[str, Any],
+                 safety_settings: Optional[List[Dict[str, str]]] = None) -> str:
+        response = self._request(prompt, generation, safety_settings, stream=False)
+        if not response.candidates or not response.candidates[0].content.parts:
+            raise LLMBlockedError(
+                f"Gemini response was empty or blocked. Feedback: {getattr(response, 'prompt_feedback', 'N/A')}")
+        return _candidate_text(response)
+
+    def stream(self, prompt: str, generation: Dict[str, Any],
+               safety_settings: Optional[List[Dict[str, str]]] = None) -> Iterator[str]:
+        response = self._request(prompt, generation, safety_settings, stream=True)
+        for chunk in response:
+            text = _candidate_text(chunk)
+            if text:
+                yield text
+        if not response.candidates:
+            raise LLMBlockedError(
+                f"Gemini response was empty or blocked. Feedback: {getattr(response, 'prompt_feedback', 'N/A')}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {"backend": "gemini", "model": self.model_name, "configured": self.available(), "calls": self.calls}
+
+
+_BATCH_COMPONENT = re.compile(r"^\s*(\d+): (class|function) (\S+)\s*$", re.MULTILINE)
+_SINGLE_COMPONENT = re.compile(r"^\s*(Class|Function) Name: (.+?)\s*$", re.MULTILINE)
+_DIAGRAM = re.compile(r"^\s*@startuml\s*$.*?^\s*@enduml\s*$", re.MULTILINE | re.DOTALL)
+_LISTED_NAME = re.compile(r"^\s*- (\S+)\s*$", re.MULTILINE)
+_SUBJECT = re.compile(r"The repository '(.+?)' by '(.+?)'")
+_KEY_LINE = re.compile(r"Key (Functions|Classes): (.+)")
+_PHRASES = ("neatly layered", "pragmatic", "compact", "well-organised", "ambitious", "steadily evolving")
+
+
+class FakeBackend(LLMBackend):
+    """
+    Local stand-in for Gemini: no network, no API key, and the same answer for the same
+    prompt. It recognises the prompts this codebase sends and returns matching canned
+    structured output (component JSON, batched component JSON keyed by id, PlantUML,
+    narrative prose with the styling spans). Timing is simulated: `latency_seconds`
+    before the first token, then `tokens_per_second` of estimated output tokens
+    (0 answers instantly); streams arrive in ~`chunk_tokens` pieces.
+    """
+
+    model_name = "fake-llm"
+
+    def __init__(self, latency_seconds: float = 0.5, tokens_per_second: float = 200.0, chunk_tokens: int = 20):
+        self.latency_seconds = latency_seconds
+        self.tokens_per_second = tokens_per_second
+        self.chunk_tokens = max(1, chunk_tokens)
+        self._lock = threading.Lock()
+        self._metrics = {"calls": 0, "output_tokens": 0, "simulated_seconds": 0.0}
+
+    def _sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds)
+            with self._lock:
+                self._metrics["simulated_seconds"] += seconds
+
+    def _output_seconds(self, text: str) -> float:
+        return estimate_tokens(text) / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _count(self, text: str) -> None:
+        with self._lock:
+            self._metrics["calls"] += 1
+            self._metrics["output_tokens"] += estimate_tokens(text)
+
+    def generate(self, prompt: str, generation: Dict[str, Any],
+                 safety_settings: Optional[List[Dict[str, str]]] = None) -> str:
+        text = self.respond(prompt, generation)
+        self._count(text)
+        self._sleep(self.latency_seconds + self._output_seconds(text))
+        return text
+
+    def stream(self, prompt: str, generation: Dict[str, Any],
+               safety_settings: Optional[List[Dict[str, str]]] = None) -> Iterator[str]:
+        text = self.respond(prompt, generation)
+        self._count(text)
+        self._sleep(self.latency_seconds)
+        size = int(self.chunk_tokens * CHARS_PER_TOKEN)
+        for start in range(0, len(text), size):
+            chunk = text[start:start + size]
+            self._sleep(self._output_seconds(chunk))
+            yield chunk
+
+    def respond(self, prompt: str, generation: Dict[str, Any]) -> str:
+        """ The canned answer to `prompt`, without simulated timing. """
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        batch = _BATCH_COMPONENT.findall(prompt)
+        if batch and generation.get("response_mime_type") == "application/json":
+            return json.dumps({position: self._component(kind, name, rng) for position, kind, name in batch})
+        single = _SINGLE_COMPONENT.search(prompt)
+        if single:
+            return json.dumps(self._component(single.group(1).lower(), single.group(2), rng))
+        diagram = _DIAGRAM.search(prompt)
+        if diagram:
+            return self._annotated_diagram(diagram.group(0))
+        if "PlantUML" in prompt:
+            return self._diagram(prompt)
+        return self._narrative(prompt, rng)
+
+    @staticmethod
+    def _component(kind: str, name: str, rng: random.Random) -> Dict[str, Any]:
+        level = rng.choice(["low", "medium", "high"])
+        entry = {
+            "description": f'The <span class="font-medium text-teal-700">{name}</span> {kind} is a '
+                           f'<span class="font-semibold text-blue-600">{rng.choice(_PHRASES)}</span> building block '
+                           f'of this codebase (simulated analysis).',
+            "usages": [f"Used where the codebase needs {name}.", f"Referenced by code around {name}."],
+            "purpose": f"Encapsulates the behaviour named by {name}.",
+            "related_components": [],
+            "complexity": {"level": level, "explanation": f"Simulated {level} complexity."},
+            "best_practices": {"rating": rng.randint(3, 5), "suggestions": ["Add docstrings."]},
+        }
+        if kind == "function":
+            entry["parameters"] = []
+            entry["return_value"] = {"type": "Any", "description": f"Result of {name}."}
+        return entry
+
+    @staticmethod
+    def _annotated_diagram(diagram: str) -> str:
+        """ Class diagram enrichment: the given diagram with one note added. """
+        lines = [line.strip() for line in diagram.strip().splitlines()]
+        return "\n".join(lines[:-1] + ['note "Annotated by the fake LLM backend" as N_fake', "@enduml"])
+
+    @staticmethod
+    def _diagram(prompt: str) -> str:
+        names = [re.sub(r"\W", "_", name) for name in _LISTED_NAME.findall(prompt)][:8] or ["Main"]
+        if "sequence diagram" in prompt:
+            lines = [f"participant {name}" for name in names]
+            lines += [f"{source} -> {target} : call" for source, target in zip(names, names[1:])]
+        elif "activity diagram" in prompt:
+            lines = ["start"] + [f":{name};" for name in names] + ["stop"]
+        else:
+            lines = [f"class {name}" for name in names]
+            lines += [f"{source} --> {target}" for source, target in zip(names, names[1:])]
+        return "\n".join(["@startuml"] + lines + ["@enduml"])
+
+    @staticmethod
+    def _narrative(prompt: str, rng: random.Random) -> str:
+        subject = _SUBJECT.search(prompt)
+        repo_name = subject.group(1) if subject else "this repository"
+        keys = {kind: [name for name in listing.split(", ") if name != "None detected" and "(+" not in name][:3]
+                for kind, listing in _KEY_LINE.findall(prompt)}
+        functions = ", ".join(f'<span class="font-mono text-sm text-purple-700 dark:text-purple-300 bg-purple-100 '
+                              f'dark:bg-purple-900 px-1 rounded">{name}()</span>' for name in keys.get("Functions", []))
+        classes = ", ".join(f'<span class="font-medium text-teal-700 dark:text-teal-300">{name}</span>'
+                            for name in keys.get("Classes", []))
+        sentences = [
+            f'<span class="font-bold text-gray-800 dark:text-gray-200">{repo_name} is a {rng.choice(_PHRASES)} '
+            f'project</span> whose story is told here by a simulated storyteller.',
+            f"Its logic gathers around {classes or 'a handful of modules'}, "
+            f"with {functions or 'small helper functions'} doing much of the work.",
+        ]
+        sentences += [f"Chapter {chapter} of the tale follows the code a little further, as every "
+                      f"{rng.choice(_PHRASES)} codebase deserves." for chapter in range(1, 9)]
+        return " ".join(sentences)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["simulated_seconds"] = round(metrics["simulated_seconds"], 3)
+        return dict(metrics, backend="fake", model=self.model_name,
+                    latency_seconds=self.latency_seconds, tokens_per_second=self.tokens_per_second)
+
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(kind: str) -> LLMBackend:
+    """ Builds a backend by name: "gemini" (GEMINI_API_KEY, GEMINI_MODEL_NAME) or "fake". """
+    kind = (kind or "gemini").lower()
+    if kind == "fake":
+        return FakeBackend(settings.FAKE_LLM_LATENCY_SECONDS, settings.FAKE_LLM_TOKENS_PER_SECOND)
+    if kind != "gemini":
+        print(f"[WALKTHROUGH] llm_backend.py: Unknown LLM backend '{kind}', using Gemini.")
+        sys.stdout.flush()
+    return GeminiBackend(settings.GEMINI_API_KEY, settings.GEMINI_MODEL_NAME)
+
+
+def get_backend() -> LLMBackend:
+    """ Returns the process-wide backend configured in settings (LLM_BACKEND). """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend(settings.LLM_BACKEND)
+        return _backend
+
+
+def set_backend(backend: Optional[LLMBackend]) -> None:
+    """ Replaces the process-wide backend (None recreates it from settings on next use). """
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+print("[WALKTHROUGH] llm_backend.py: Finished loading.")
+sys.stdout.flush()
@@ -0,0 +1,190 @@
+# services/llm_cache.py
+import sys
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Any, Callable, Optional
+
+from config.config import settings
+from services.blob_cache import CacheBackend, MemoryCacheBackend, create_backend
+from services.single_flight import SingleFlight
+
+print("[WALKTHROUGH] llm_cache.py: Loading...")
+sys.stdout.flush()
+
+
+def normalize_prompt(prompt: str) -> str:
+    """ Drops the indentation and trailing spaces the f-string prompts carry, which Gemini ignores. """
+    return "\n".join(line.strip() for line in prompt.strip().splitlines())
+
+
+def make_key(model_name: str, prompt: str, config: Dict[str, Any]) -> str:
+    """ Cache key for one LLM call: model + normalized prompt + generation config (incl. safety settings). """
+    payload = json.dumps({"model": model_name, "prompt": normalize_prompt(prompt), "config": config},
+                         sort_keys=True, separators=(",", ":"), default=str)
+    return "llm:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier cache of LLM results: an in-process LRU in front of an optional persistent
+    backend (any blob_cache.CacheBackend, SQLite by default) shared by API and worker
+    processes. Entries expire after `ttl_seconds`; both tiers also evict least recently
+    used entries by size. Identical concurrent calls in a process share one LLM call.
+    Failed calls (an exception or a None result) are not stored and are retried next time.
+    """
+
+    def __init__(self, memory_max_bytes: int, backend: Optional[CacheBackend], ttl_seconds: float):
+        self.memory = MemoryCacheBackend(memory_max_bytes)
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._metrics = {"memory_hits": 0, "persistent_hits": 0, "misses": 0,
+                         "expired": 0, "stores": 0, "errors": 0}
+
+    def _count(self, metric: str) -> None:
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def _decode(self, key: str, raw: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        if entry["expires_at"] <= time.time():
+            self._count("expired")
+            self.memory.delete(key)
+            if self.backend is not None:
+                self.backend.delete(key)
+            return None
+        return entry
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """ Returns {"value": ...} for a live entry, or None. """
+        try:
+            entry = self._decode(key, self.memory.get(key))
+            if entry is not None:
+                self._count("memory_hits")
+                return entry
+            if self.backend is not None:
+                raw = self.backend.get(key)
+                entry = self._decode(key, raw)
+                if entry is not None:
+                    self.memory.set(key, raw)
+                    self._count("persistent_hits")
+                    return entry
+        except Exception as e:
+            self._count("errors")
+            print(f"[WALKTHROUGH] llm_cache.py: ERROR reading cache: {e}")
+            sys.stdout.flush()
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        raw = json.dumps({"expires_at": time.time() + self.ttl_seconds, "value": value}).encode("utf-8")
+        try:
+            self.memory.set(key, raw)
+            if self.backend is not None:
+                self.backend.set(key, raw)
+            self._count("stores")
+        except Exception as e:
+            self._count("errors")
+            print(f"[WALKTHROUGH] llm_cache.py: ERROR writing cache: {e}")
+            sys.stdout.flush()
+
+    def get_or_generate(self, model_name: str, prompt: str, config: Dict[str, Any],
+                        generate: Callable[[], Any]) -> Any:
+        """
+        Returns the cached result for this call or runs `generate` (which must return a
+        JSON-serializable value, or None for a result not worth caching) and caches it.
+        """
+        return self.get_or_generate_key(make_key(model_name, prompt, config), generate)
+
+    def get_or_generate_key(self, key: str, generate: Callable[[], Any]) -> Any:
+        """ get_or_generate() for callers that key results themselves (e.g. per repository and component). """
+        entry = self.get(key)
+        if entry is not None:
+            return entry["value"]
+        return self._flights.do(key, lambda: self._generate(key, generate))
+
+    def _generate(self, key: str, generate: Callable[[], Any]) -> Any:
+        # Another process may have stored it since our lookup
+        entry = self.get(key)
+        if entry is not None:
+            return entry["value"]
+        self._count("misses")
+        value = generate()
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        lookups = metrics["memory_hits"] + metrics["persistent_hits"] + metrics["misses"]
+        metrics["hit_rate"] = round((lookups - metrics["misses"]) / lookups, 3) if lookups else None
+        metrics["single_flight"] = self._flights.get_metrics()
+        return metrics
+
+
+_llm_cache: Optional[LLMCache] = None
+_llm_cache_initialized = False
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """ Returns the process-wide LLM cache configured in settings, or None if disabled. """
+    global _llm_cache, _llm_cache_initialized
+    with _llm_cache_lock:
+        if not _llm_cache_initialized:
+            _llm_cache_initialized = True
+            if settings.LLM_CACHE_ENABLED:
+                try:
+                    # "memory" is the in-process tier alone
+                    backend = None if settings.LLM_CACHE_BACKEND == "memory" else create_backend(
+                        settings.LLM_CACHE_BACKEND, settings.LLM_CACHE_PATH, settings.LLM_CACHE_MAX_BYTES)
+                    _llm_cache = LLMCache(settings.LLM_CACHE_MEMORY_MAX_BYTES, backend,
+                                          settings.LLM_CACHE_TTL_SECONDS)
+                except Exception as e:
+                    print(f"[WALKTHROUGH] llm_cache.py: ERROR initializing LLM cache, caching disabled: {e}")
+                    sys.stdout.flush()
+                    _llm_cache = None
+        return _llm_cache
+
+
+def cached_generate(model_name: str, prompt: str, config: Dict[str, Any], generate: Callable[[], Any]) -> Any:
+    """ get_or_generate() on the process-wide cache; calls `generate` directly when caching is disabled. """
+    cache = get_llm_cache()
+    if cache is None:
+        return generate()
+    return cache.get_or_generate(model_name, prompt, config, generate)
+
+
+def cached_value(key: str, generate: Callable[[], Any]) -> Any:
+    """ cached_generate() under a caller-chosen key. """
+    cache = get_llm_cache()
+    if cache is None:
+        return generate()
+    return cache.get_or_generate_key(key, generate)
+
+
+def lookup(key: str) -> Optional[Any]:
+    """ The cached value under a caller-chosen key, or None. """
+    cache = get_llm_cache()
+    entry = cache.get(key) if cache is not None else None
+    return entry["value"] if entry is not None else None
+
+
+def store(key: str, value: Any) -> None:
+    cache = get_llm_cache()
+    if cache is not None and value is not None:
+        cache.set(key, value)
+
+
+def get_metrics() -> Dict[str, Any]:
+    cache = get_llm_cache()
+    return cache.get_metrics() if cache is not None else {"enabled": False}
+
+
+print("[WALKTHROUGH] llm_cache.py: Finished loading.")
+sys.stdout.flush()
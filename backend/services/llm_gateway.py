@@ -0,0 +1,272 @@
+# services/llm_gateway.py
+import os
+import sys
+import time
+import heapq
+import socket
+import random
+import threading
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from config.config import settings
+from services import pubsub
+from services.rate_limiter import TokenBucket
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:  # google-generativeai not installed; nothing to classify
+    google_exceptions = None
+
+print("[WALKTHROUGH] llm_gateway.py: Loading...")
+sys.stdout.flush()
+
+# Priority classes, lowest value served first
+INTERACTIVE = 0  # A user is waiting on the answer (component details)
+BACKGROUND = 1  # Worker-side generation (narratives, UML)
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Quota pauses are broadcast here so every API and worker process holds back, not just the one hit
+QUOTA_CHANNEL = "llm.quota"
+
+
+class LLMGatewayTimeout(TimeoutError):
+    """ Raised when a call could not be started (or retried) before its deadline. """
+
+
+def _is_quota_error(error: Exception) -> bool:
+    if google_exceptions is not None and isinstance(
+            error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        return True
+    return getattr(error, "code", None) == 429
+
+
+def _is_retryable(error: Exception) -> bool:
+    """ Quota errors, server-side failures and timeouts; not bad requests or blocked prompts. """
+    if _is_quota_error(error) or isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if google_exceptions is not None:
+        return isinstance(error, (google_exceptions.ServiceUnavailable, google_exceptions.InternalServerError,
+                                  google_exceptions.DeadlineExceeded, google_exceptions.GatewayTimeout))
+    return getattr(error, "code", None) in (500, 502, 503, 504)
+
+
+class LLMGateway:
+    """
+    Admission control in front of every Gemini call in this process.
+
+    - At most `max_concurrency` calls run at once.
+    - A token bucket refilled at `tokens_per_minute` caps estimated prompt + output tokens.
+    - Waiting calls are admitted by priority class, FIFO within a class, so interactive
+      requests overtake queued background generation.
+    - Quota, server and timeout errors are retried with full-jitter exponential backoff;
+      a quota error also pauses admission for the backoff delay, in this process and,
+      through a pub/sub message on QUOTA_CHANNEL, in every other API and worker process.
+    - Every call has a deadline covering queueing, attempts and backoff.
+
+    The concurrency cap and token bucket are per process: the process-wide gateway gets
+    the configured budget divided by LLM_GATEWAY_PROCESSES (see create_gateway()).
+    """
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: float, max_retries: int = 4,
+                 retry_base_seconds: float = 1.0, retry_max_seconds: float = 30.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._bucket = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self._condition = threading.Condition()
+        self._queue: List[Tuple[int, int]] = []  # Heap of (priority, sequence) tickets
+        self._sequence = 0
+        self._active = 0
+        self._blocked_until = 0.0
+        self._metrics = {"calls": 0, "succeeded": 0, "failed": 0, "retries": 0,
+                         "quota_errors": 0, "deadline_exceeded": 0, "remote_quota_pauses": 0}
+        self._listener: Optional[threading.Thread] = None
+        self._waits: Dict[int, Dict[str, float]] = {
+            priority: {"admitted": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for priority in PRIORITY_NAMES}
+
+    def _admit(self, priority: int, tokens: float, deadline: float) -> None:
+        """ Blocks until this call may start. Raises LLMGatewayTimeout at `deadline`. """
+        tokens = min(tokens, self._bucket.capacity)
+        with self._condition:
+            self._sequence += 1
+            ticket = (priority, self._sequence)
+            heapq.heappush(self._queue, ticket)
+            enqueued_at = time.monotonic()
+            try:
+                while True:
+                    now = time.monotonic()
+                    if now >= deadline:
+                        self._metrics["deadline_exceeded"] += 1
+                        raise LLMGatewayTimeout(
+                            f"LLM call waited {now - enqueued_at:.1f}s without being admitted.")
+                    delay = 1.0
+                    if self._queue[0] == ticket and self._active < self.max_concurrency:
+                        delay = self._blocked_until - now
+                        if delay <= 0:
+                            delay = self._bucket.try_acquire(tokens)
+                            if delay == 0:
+                                self._active += 1
+                                waited = now - enqueued_at
+                                waits = self._waits[priority]
+                                waits["admitted"] += 1
+                                waits["total_wait_seconds"] += waited
+                                waits["max_wait_seconds"] = max(waits["max_wait_seconds"], waited)
+                                return
+                    self._condition.wait(timeout=max(min(delay, deadline - now, 1.0), 0.01))
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+
+    def _release(self) -> None:
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def call(self, func: Callable[[], Any], tokens: float, priority: int = BACKGROUND,
+             deadline_seconds: Optional[float] = None,
+             retry_if: Optional[Callable[[Exception], bool]] = None) -> Any:
+        """
+        Runs `func` (one Gemini request) once admitted, retrying retryable errors until
+        it succeeds, retries run out or the deadline passes. `tokens` is the estimated
+        prompt + output size. `retry_if` can veto retries (e.g. once streamed output was
+        already handed on).
+        """
+        if deadline_seconds is None:
+            deadline_seconds = (settings.LLM_INTERACTIVE_DEADLINE_SECONDS if priority == INTERACTIVE
+                                else settings.LLM_DEADLINE_SECONDS)
+        deadline = time.monotonic() + deadline_seconds
+        self._listen_for_quota_pauses()
+        with self._condition:
+            self._metrics["calls"] += 1
+        attempt = 0
+        while True:
+            self._admit(priority, tokens, deadline)
+            try:
+                result = func()
+            except Exception as e:
+                retry_delay = self._retry_delay(e, attempt, deadline, retry_if)
+                if retry_delay is None:
+                    with self._condition:
+                        self._metrics["failed"] += 1
+                    raise
+                wait = max(retry_delay, self._blocked_until - time.monotonic())
+                print(f"[WALKTHROUGH] llm_gateway.py: LLM call failed ({type(e).__name__}: {e}), "
+                      f"retry {attempt + 1}/{self.max_retries} in {wait:.1f}s.")
+                sys.stdout.flush()
+            else:
+                with self._condition:
+                    self._metrics["succeeded"] += 1
+                return result
+            finally:
+                self._release()
+            attempt += 1
+            time.sleep(retry_delay)
+
+    def _retry_delay(self, error: Exception, attempt: int, deadline: float,
+                     retry_if: Optional[Callable[[Exception], bool]]) -> Optional[float]:
+        """ Seconds to sleep before the next attempt, or None to give up. """
+        if not _is_retryable(error) or attempt >= self.max_retries or (retry_if and not retry_if(error)):
+            return None
+        delay = random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * (2 ** attempt)))
+        if time.monotonic() + delay >= deadline:
+            with self._condition:
+                self._metrics["deadline_exceeded"] += 1
+            return None
+        with self._condition:
+            self._metrics["retries"] += 1
+            if not _is_quota_error(error):
+                return delay
+            # The quota is shared: hold back every call, not just this one
+            self._metrics["quota_errors"] += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        pubsub.publish(QUOTA_CHANNEL, {"source": _process_id(), "blocked_until": time.time() + delay})
+        return 0.0
+
+    def _listen_for_quota_pauses(self) -> None:
+        """ Starts the thread applying other processes' quota pauses (once per process). """
+        with self._condition:
+            # A prefork child inherits the object but not the thread
+            if self._listener is not None and self._listener.is_alive():
+                return
+            broker = pubsub.get_broker()
+            if broker is None:
+                return
+            subscription = broker.subscribe(QUOTA_CHANNEL)
+            self._listener = threading.Thread(
+                target=self._apply_quota_pauses, args=(subscription,), name="llm-quota-listener", daemon=True)
+            self._listener.start()
+
+    def _apply_quota_pauses(self, subscription: pubsub.Subscription) -> None:
+        while True:
+            message = subscription.get(timeout=1.0)
+            if not message or message.get("source") == _process_id():
+                continue
+            delay = float(message.get("blocked_until", 0)) - time.time()
+            if delay <= 0:
+                continue
+            with self._condition:
+                if time.monotonic() + delay > self._blocked_until:
+                    self._blocked_until = time.monotonic() + delay
+                    self._metrics["remote_quota_pauses"] += 1
+                self._condition.notify_all()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._condition:
+            self._bucket._refill()
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._queue:
+                queued[PRIORITY_NAMES[priority]] += 1
+            waits = {}
+            for priority, stats in self._waits.items():
+                admitted = stats["admitted"]
+                waits[PRIORITY_NAMES[priority]] = {
+                    "admitted": admitted,
+                    "avg_wait_seconds": round(stats["total_wait_seconds"] / admitted, 3) if admitted else None,
+                    "max_wait_seconds": round(stats["max_wait_seconds"], 3),
+                }
+            return dict(
+                self._metrics,
+                active=self._active,
+                max_concurrency=self.max_concurrency,
+                queue_depth=len(self._queue),
+                queued=queued,
+                waits=waits,
+                available_tokens=int(self._bucket.tokens),
+                tokens_per_minute=int(self._bucket.capacity),
+                blocked_for_seconds=round(max(self._blocked_until - time.monotonic(), 0), 1),
+            )
+
+
+def _process_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def create_gateway() -> LLMGateway:
+    """
+    A gateway with this process's share of the global budget: LLM_MAX_CONCURRENCY and
+    LLM_TOKENS_PER_MINUTE divided by LLM_GATEWAY_PROCESSES (every API worker plus every
+    Celery worker process that calls Gemini).
+    """
+    processes = max(1, settings.LLM_GATEWAY_PROCESSES)
+    return LLMGateway(max(1, settings.LLM_MAX_CONCURRENCY // processes),
+                      settings.LLM_TOKENS_PER_MINUTE / processes,
+                      settings.LLM_MAX_RETRIES, settings.LLM_RETRY_BASE_SECONDS,
+                      settings.LLM_RETRY_MAX_SECONDS)
+
+
+# Shared by every Gemini call in this process (llm_handler, uml_generator)
+llm_gateway = create_gateway()
+
+
+def call(func: Callable[[], Any], tokens: float, priority: int = BACKGROUND,
+         deadline_seconds: Optional[float] = None,
+         retry_if: Optional[Callable[[Exception], bool]] = None) -> Any:
+    """ LLMGateway.call() on the process-wide gateway. """
+    return llm_gateway.call(func, tokens, priority, deadline_seconds, retry_if)
+
+
+print("[WALKTHROUGH] llm_gateway.py: Finished loading.")
+sys.stdout.flush()
@@ -1,119 +1,91 @@
 # tasks/llm_handler.py
-import os
 import sys
-import google.generativeai as genai
-from typing import Dict, Any
+import json
+import hashlib
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from dotenv import load_dotenv
 
+from config.config import settings
+from services import llm_backend, llm_cache, llm_gateway, prompt_builder
+
 load_dotenv()
 print("[WALKTHROUGH] llm_handler.py: Loading environment variables...")
 
 print("[WALKTHROUGH] llm_handler.py: Loading...")
 sys.stdout.flush()
 
-# Configure Gemini API
-gemini_model = None
-try:
-    print("[WALKTHROUGH] llm_handler.py: Configuring Gemini API...")
-    sys.stdout.flush()
-    # os.getenv("GEMINI_API_KEY")
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found in environment variables.")
-    genai.configure(api_key=api_key)
-    gemini_model = genai.GenerativeModel('gemini-1.5-flash-latest')
-    print("[WALKTHROUGH] llm_handler.py: Gemini API configured successfully.")
-    sys.stdout.flush()
-except Exception as e:
-    print(
-        f"[WALKTHROUGH] llm_handler.py: ERROR - Failed to configure Gemini API: {e}")
-    sys.stdout.flush()
-    # Let tasks fail if they try to use the None model
+# Generation goes through the backend configured in settings (LLM_BACKEND, see
+# services/llm_backend.py): Gemini, or a local deterministic stand-in
 
 
-def generate_narrative(analysis_data: Dict[str, Any], repo_url: str) -> str:
+def llm_available() -> bool:
+    """ Whether the configured LLM backend can be called (e.g. a Gemini API key is set). """
+    return llm_backend.get_backend().available()
+
+
+def generate_narrative(analysis_data: Dict[str, Any], repo_url: str,
+                       on_chunk: Optional[Callable[[str], None]] = None) -> str:
     """
-    Generate a narrative about the repository using Google Gemini.
-    analysis_data should contain keys like 'latest_commit', 'code_analysis', 'owner', 'repo_name'.
+    Generate a narrative about the repository with the configured LLM backend (Gemini by default).
+    analysis_data should contain keys like 'latest_commit', 'code_analysis', 'owner', 'repo_name',
+    and optionally 'symbol_counts' to rank symbols by (see prompt_builder.build_narrative_prompt).
+    The response is streamed: `on_chunk` receives each piece of text as it arrives, and the
+    full narrative is returned at the end.
     Raises exceptions on failure.
     """
     print("[WALKTHROUGH] llm_handler.py: Generating narrative...")
     sys.stdout.flush()
 
-    if not gemini_model:
+    backend = llm_backend.get_backend()
+    if not backend.available():
         print("[WALKTHROUGH] llm_handler.py: ERROR - Gemini model not configured.")
         sys.stdout.flush()
         raise RuntimeError(
             "Gemini API key not configured or model initialization failed.")
 
-    # Extract data
-    latest_commit = analysis_data.get('latest_commit', {})
-    code_analysis = analysis_data.get('code_analysis', {})
-    owner = analysis_data.get('owner', 'N/A')
-    repo_name = analysis_data.get('repo_name', 'N/A')
-    detected_frameworks = analysis_data.get('detected_frameworks', [])
-    MAX_ITEMS = 300000  # Consistent limit
-
-    # --- Construct the detailed prompt with styling instructions ---
-    prompt = f"""
-    You are 'CodeLore', a digital storyteller crafting an engaging narrative about a GitHub repository based on API data. Your output MUST be a single block of text containing embedded HTML `<span>` tags with Tailwind CSS classes for styling specific keywords.
-
-    **The Subject:** The repository '{repo_name}' by '{owner}' ({repo_url}).
-
-    **The Clues (API Snapshot):**
-    *   Latest Dispatch: Commit by '{latest_commit.get('author', 'N/A')}' on {latest_commit.get('date', 'N/A')} ("{latest_commit.get('message', 'N/A')}")
-    *   Tech Toolkit Hints: Frameworks/Libraries detected include: {', '.join(detected_frameworks) if detected_frameworks else 'None detected'}.
-    *   Code Blueprint (Python Sample):
-        - Analyzed {code_analysis.get('files_analyzed_count', 0)} files (~{code_analysis.get('lines_analyzed_count', 0)} lines).
-        - Key Functions (sample): {', '.join(code_analysis.get('unique_functions', [])[:MAX_ITEMS])}{'...' if len(code_analysis.get('unique_functions', [])) > MAX_ITEMS else ''}
-        - Key Classes (sample): {', '.join(code_analysis.get('unique_classes', [])[:MAX_ITEMS])}{'...' if len(code_analysis.get('unique_classes', [])) > MAX_ITEMS else ''}
-        - Notable Imports (sample): {', '.join(code_analysis.get('unique_imports', [])[:MAX_ITEMS])}{'...' if len(code_analysis.get('unique_imports', [])) > MAX_ITEMS else ''}
-
-    **Your Storytelling & Styling Task:**
-    Based *only* on these clues:
-    1.  **Infer Purpose:** Start with the project's likely mission.
-    2.  **Describe Tech:** Discuss the technical landscape suggested by imports/frameworks.
-    3.  **Reveal Logic:** Hint at the core logic using function/class names.
-    4.  **Show Status:** Mention the latest commit activity.
-    5.  **Weave Narrative:** Create a smooth, engaging story flow (150-250 words).
-
-    **Styling Rules (Apply within the narrative text):**
-    *   Wrap detected **frameworks/libraries** (from 'Tech Toolkit Hints') in: `<span class="font-semibold text-blue-600 dark:text-blue-400">FrameworkName</span>`
-    *   Wrap key **function names** (from 'Key Functions' sample) mentioned in the narrative in: `<span class="font-mono text-sm text-purple-700 dark:text-purple-300 bg-purple-100 dark:bg-purple-900 px-1 rounded">function_name()</span>` (add parentheses if appropriate)
-    *   Wrap key **class names** (from 'Key Classes' sample) mentioned in the narrative in: `<span class="font-medium text-teal-700 dark:text-teal-300">ClassName</span>`
-    *   Wrap the inferred **project purpose/domain** (first sentence or key phrase) in: `<span class="font-bold text-gray-800 dark:text-gray-200">Purpose Phrase</span>`
-    *   Wrap the **latest commit message snippet** if mentioned in: `<span class="italic text-gray-600 dark:text-gray-400">"Commit message..."</span>`
-
-    **Output Format:** A single block of narrative text containing the embedded HTML `<span>` tags as specified. Do NOT output markdown formatting like backticks or asterisks. Ensure HTML is valid.
-
-    **Keywords for Potential Styling:**
-    - Frameworks/Libraries: {detected_frameworks}
-    - Functions: {code_analysis.get('unique_functions', [])[:MAX_ITEMS]}
-    - Classes: {code_analysis.get('unique_classes', [])[:MAX_ITEMS]}
-    """
+    # Most salient symbols within the token budget, each listed once
+    prompt, prompt_report = prompt_builder.build_narrative_prompt(
+        analysis_data, repo_url, settings.NARRATIVE_PROMPT_TOKEN_BUDGET)
+    print(f"[WALKTHROUGH] llm_handler.py: Narrative prompt ~{prompt_report['prompt_tokens']} tokens "
+          f"(budget {prompt_report['budget']}): {prompt_report}")
+    sys.stdout.flush()
 
     print("[WALKTHROUGH] llm_handler.py: Sending prompt to Gemini...")
     sys.stdout.flush()
 
     safety_settings = [{"category": c, "threshold": "BLOCK_MEDIUM_AND_ABOVE"} for c in [
         "HARM_CATEGORY_HARASSMENT", "HARM_CATEGORY_HATE_SPEECH", "HARM_CATEGORY_SEXUALLY_EXPLICIT", "HARM_CATEGORY_DANGEROUS_CONTENT"]]
-    generation_config = genai.types.GenerationConfig(
-        max_output_tokens=600, temperature=0)
-
-    try:
-        response = gemini_model.generate_content(
-            prompt, generation_config=generation_config, safety_settings=safety_settings)
+    generation = {"max_output_tokens": 600, "temperature": 0}
+
+    generated = []
+
+    def stream() -> None:
+        # Streamed, so callers can show the text while the rest is still being generated
+        for text in backend.stream(prompt, generation, safety_settings):
+            generated.append(text)
+            if on_chunk:
+                on_chunk(text)
+
+    def generate() -> Optional[str]:
+        # Text already handed to on_chunk cannot be taken back, so only retry before the first chunk.
+        # An empty or blocked answer raises llm_backend.LLMBlockedError.
+        llm_gateway.call(
+            stream, prompt_builder.estimate_tokens(prompt) + generation["max_output_tokens"],
+            llm_gateway.BACKGROUND, retry_if=lambda error: not generated)
         print("[WALKTHROUGH] llm_handler.py: Received response from Gemini.")
         sys.stdout.flush()
 
-        # --- Robust Response Processing ---
-        if not response.candidates:
-            raise ValueError(
-                f"Gemini response was empty or blocked. Feedback: {getattr(response, 'prompt_feedback', 'N/A')}")
-        first_candidate = response.candidates[0]
+        # None (empty content) is not cached, so the next run asks again
+        return "".join(generated) if generated else None
 
-        narrative_result = first_candidate.content.parts[
-            0].text if first_candidate.content.parts else "Gemini returned empty content."
+    try:
+        narrative_result = llm_cache.cached_generate(
+            backend.model_name, prompt, {"generation": generation, "safety": safety_settings}, generate)
+        if narrative_result is None:
+            narrative_result = "Gemini returned empty content."
+        elif on_chunk and not generated:
+            # Served from the LLM cache: hand it over in one piece
+            on_chunk(narrative_result)
 
         print("[WALKTHROUGH] llm_handler.py: Narrative extracted successfully.")
         sys.stdout.flush()
@@ -148,7 +120,8 @@ def generate_component_description(component_name: str, component_type: str, rep
         f"[WALKTHROUGH] llm_handler.py: Generating structured description for {component_type} '{component_name}'...")
     sys.stdout.flush()
 
-    if not gemini_model:
+    backend = llm_backend.get_backend()
+    if not backend.available():
         print("[WALKTHROUGH] llm_handler.py: ERROR - Gemini model not configured.")
         sys.stdout.flush()
         raise RuntimeError(
@@ -229,30 +202,27 @@ def generate_component_description(component_name: str, component_type: str, rep
         {"category": c, "threshold": "BLOCK_MEDIUM_AND_ABOVE"}
         for c in ["HARM_CATEGORY_HARASSMENT", "HARM_CATEGORY_HATE_SPEECH", "HARM_CATEGORY_SEXUALLY_EXPLICIT", "HARM_CATEGORY_DANGEROUS_CONTENT"]
     ]
-    generation_config = genai.types.GenerationConfig(
-        max_output_tokens=800, temperature=0.2)
+    generation = {"max_output_tokens": 800, "temperature": 0.2}
 
-    try:
-        response = gemini_model.generate_content(
-            prompt, generation_config=generation_config, safety_settings=safety_settings)
+    def generate() -> Dict[str, Any]:
+        result_text = llm_gateway.call(
+            lambda: backend.generate(prompt, generation, safety_settings),
+            prompt_builder.estimate_tokens(prompt) + generation["max_output_tokens"], llm_gateway.INTERACTIVE)
         print(
             "[WALKTHROUGH] llm_handler.py: Received structured component analysis from Gemini.")
         sys.stdout.flush()
 
-        if not response.candidates:
-            raise ValueError(
-                f"Gemini response was empty or blocked. Feedback: {getattr(response, 'prompt_feedback', 'N/A')}")
-
-        first_candidate = response.candidates[0]
-        result_text = first_candidate.content.parts[0].text if first_candidate.content.parts else "{}"
-
         # Strip any markdown formatting if present
         result_text = result_text.strip('`').replace(
             'json\n', '').replace('```', '')
 
-        # Parse the JSON response
-        import json
-        result_json = json.loads(result_text)
+        # Parse the JSON response; only parsed results are cached
+        return json.loads(result_text)
+
+    try:
+        # Cached per repository and component, shared with describe_component_batch()
+        result_json = llm_cache.cached_value(
+            component_cache_key(repo_url, component_type, component_name), generate)
 
         print(
             "[WALKTHROUGH] llm_handler.py: Structured component analysis extracted successfully.")
@@ -266,14 +236,188 @@ def generate_component_description(component_name: str, component_type: str, rep
             f"[WALKTHROUGH] llm_handler.py: ERROR during structured component analysis: {e}")
         sys.stdout.flush()
         # Return a default structured response on error
-        return {
-            "description": f"Error analyzing {component_type} {component_name}: {str(e)}",
-            "usages": ["Could not determine usage patterns."],
-            "purpose": "Unable to determine purpose due to an error.",
-            "related_components": [],
-            "complexity": {"level": "unknown", "explanation": "Analysis failed."},
-            "best_practices": {"rating": 0, "suggestions": ["Unable to provide suggestions due to analysis error."]}
-        }
+        return component_error(component_type, component_name, e)
+
+
+def component_error(component_type: str, component_name: str, error: Any) -> Dict[str, Any]:
+    """ The structured response returned (and never cached) when a component could not be analysed. """
+    return {
+        "description": f"Error analyzing {component_type} {component_name}: {str(error)}",
+        "usages": ["Could not determine usage patterns."],
+        "purpose": "Unable to determine purpose due to an error.",
+        "related_components": [],
+        "complexity": {"level": "unknown", "explanation": "Analysis failed."},
+        "best_practices": {"rating": 0, "suggestions": ["Unable to provide suggestions due to analysis error."]}
+    }
+
+
+def _component_kind(component_type: str) -> str:
+    return 'class' if component_type.lower() == 'class' else 'function'
+
+
+def component_cache_key(repo_url: str, component_type: str, component_name: str) -> str:
+    """ LLM cache key of one component's description, per repository (see services/llm_cache.py). """
+    identity = json.dumps([llm_backend.get_backend().model_name, repo_url.strip().rstrip('/').lower(),
+                           _component_kind(component_type), component_name])
+    return "component:" + hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def lookup_component_descriptions(repo_url: str, components: List[Dict[str, str]]) -> Dict[int, Dict[str, Any]]:
+    """ Cached descriptions of `components` ({"component_name", "component_type"}), by list index. """
+    cached = {}
+    for position, component in enumerate(components):
+        value = llm_cache.lookup(component_cache_key(
+            repo_url, component["component_type"], component["component_name"]))
+        if value is not None:
+            cached[position] = value
+    return cached
+
+
+_BATCH_FIELDS = """
+        For a class, an object with these fields:
+        1. "description": A detailed HTML-formatted description of what this class likely does, its responsibilities, and its role in the system
+        2. "usages": An array of strings describing different ways this class is likely used in the codebase
+        3. "purpose": A concise statement of the primary purpose of this class (1-2 sentences)
+        4. "related_components": An array of likely related classes or functions based on naming conventions and common patterns
+        5. "complexity": An object with "level" (string: "low", "medium", or "high") and "explanation" (string explaining the reasoning)
+        6. "best_practices": An object with "rating" (1-5 scale) and "suggestions" (array of improvement suggestions if applicable)
+
+        For a function, an object with these fields:
+        1. "description": A detailed HTML-formatted description of what this function likely does, its parameters, return values, and overall purpose
+        2. "usages": An array of strings describing different ways this function is likely called and used in the codebase
+        3. "purpose": A concise statement of the primary purpose of this function (1-2 sentences)
+        4. "parameters": An array of likely parameters with their types and purposes (inferred from the name)
+        5. "return_value": An object with "type" (likely return type) and "description" (what the return value represents)
+        6. "complexity": An object with "level" (string: "low", "medium", or "high") and "explanation" (string explaining the reasoning)
+        7. "best_practices": An object with "rating" (1-5 scale) and "suggestions" (array of improvement suggestions if applicable)
+"""
+
+
+def _batch_prompt(components: List[Dict[str, str]], repo_url: str, context: Dict[str, Any]) -> str:
+    imports = context.get('imports') or []
+    frameworks = context.get('detected_frameworks') or []
+    listing = "\n".join(f"        {position}: {_component_kind(component['component_type'])} {component['component_name']}"
+                        for position, component in enumerate(components, start=1))
+    return f"""
+        You are a code analysis expert examining classes and functions from a codebase. Provide a detailed analysis of each component listed below.
+
+        Repository: {repo_url}
+
+        Available context information (shared by all components):
+        - Imports in the repository: {', '.join(imports[:20]) if imports else 'No import information available'}
+        - Detected frameworks: {', '.join(frameworks) if frameworks else 'None detected'}
+
+        Components (id: type name):
+{listing}
+
+        Return a JSON object with one entry per component, keyed by its id ("1", "2", ...).
+{_BATCH_FIELDS}
+        Make every entry concise and short.
+
+        Format the description fields with HTML styling to highlight important elements:
+        - Use <span class="font-medium text-teal-700">ClassName</span> for class names
+        - Use <span class="font-mono text-sm text-purple-700 bg-purple-100 px-1 rounded">functionName()</span> for functions and methods
+        - Use <span class="font-semibold text-blue-600">important concepts</span> for important terms
+
+        Based ONLY on the information provided, infer these details. If you're uncertain, make educated guesses but indicate when you're doing so.
+
+        Format your response as valid JSON only (no explanation text outside the JSON).
+        """
+
+
+def plan_component_batches(components: List[Dict[str, str]], repo_url: str,
+                           context: Dict[str, Any]) -> List[List[Dict[str, str]]]:
+    """
+    Packs components, in order, into as few Gemini calls as the budgets allow: each call's
+    prompt stays within COMPONENT_BATCH_PROMPT_TOKEN_BUDGET estimated tokens and its
+    answer within COMPONENT_BATCH_MAX_OUTPUT_TOKENS.
+    """
+    per_call = max(1, settings.COMPONENT_BATCH_MAX_OUTPUT_TOKENS // settings.COMPONENT_BATCH_OUTPUT_TOKENS_PER_COMPONENT)
+    shared = prompt_builder.estimate_tokens(_batch_prompt([], repo_url, context))
+    batches: List[List[Dict[str, str]]] = []
+    tokens = 0
+    for component in components:
+        cost = prompt_builder.estimate_tokens(
+            f"        99: {_component_kind(component['component_type'])} {component['component_name']}\n")
+        if (batches and len(batches[-1]) < per_call
+                and shared + tokens + cost <= settings.COMPONENT_BATCH_PROMPT_TOKEN_BUDGET):
+            batches[-1].append(component)
+            tokens += cost
+        else:
+            batches.append([component])
+            tokens = cost
+    return batches
+
+
+def describe_component_batch(components: List[Dict[str, str]], repo_url: str,
+                             context: Dict[str, Any]) -> List[Tuple[Dict[str, str], Dict[str, Any]]]:
+    """
+    Describes several components with one Gemini call (see plan_component_batches) and
+    caches each description per component. An answer that is malformed JSON or leaves
+    components out is retried on halves of the batch, down to single components; a call
+    that fails (timeout, quota, transport, blocked) fails every component at once.
+    Returns (component, description) pairs; failed components get component_error().
+    """
+    print(f"[WALKTHROUGH] llm_handler.py: Describing {len(components)} components in one Gemini call...")
+    sys.stdout.flush()
+    backend = llm_backend.get_backend()
+    if not backend.available():
+        error = RuntimeError("Gemini API key not configured or model initialization failed.")
+        return [(component, component_error(component["component_type"], component["component_name"], error))
+                for component in components]
+
+    prompt = _batch_prompt(components, repo_url, context)
+    max_output_tokens = min(settings.COMPONENT_BATCH_MAX_OUTPUT_TOKENS,
+                            settings.COMPONENT_BATCH_OUTPUT_TOKENS_PER_COMPONENT * len(components) + 200)
+    generation = {"max_output_tokens": max_output_tokens, "temperature": 0.2,
+                  "response_mime_type": "application/json"}
+    safety_settings = [
+        {"category": c, "threshold": "BLOCK_MEDIUM_AND_ABOVE"}
+        for c in ["HARM_CATEGORY_HARASSMENT", "HARM_CATEGORY_HATE_SPEECH", "HARM_CATEGORY_SEXUALLY_EXPLICIT", "HARM_CATEGORY_DANGEROUS_CONTENT"]
+    ]
+    try:
+        result_text = llm_gateway.call(
+            lambda: backend.generate(prompt, generation, safety_settings),
+            prompt_builder.estimate_tokens(prompt) + max_output_tokens, llm_gateway.INTERACTIVE)
+    except Exception as e:
+        # Smaller batches would hit the same failure, so don't split
+        print(f"[WALKTHROUGH] llm_handler.py: ERROR during batched component analysis: {e}")
+        sys.stdout.flush()
+        return [(component, component_error(component["component_type"], component["component_name"], e))
+                for component in components]
+    try:
+        result_text = result_text.strip().strip('`').replace(
+            'json\n', '').replace('```', '')
+        entries = json.loads(result_text)
+        if not isinstance(entries, dict):
+            raise ValueError("Gemini did not return a JSON object")
+    except ValueError as e:
+        print(f"[WALKTHROUGH] llm_handler.py: ERROR parsing batched component analysis: {e}")
+        sys.stdout.flush()
+        if len(components) == 1:
+            component = components[0]
+            return [(component, component_error(component["component_type"], component["component_name"], e))]
+        entries = {}
+
+    results, missing = [], []
+    for position, component in enumerate(components, start=1):
+        entry = entries.get(str(position))
+        if isinstance(entry, dict) and entry.get("description"):
+            llm_cache.store(component_cache_key(
+                repo_url, component["component_type"], component["component_name"]), entry)
+            results.append((component, entry))
+        else:
+            missing.append(component)
+    if missing and len(missing) == len(components) and len(components) > 1:
+        middle = len(components) // 2
+        return (describe_component_batch(components[:middle], repo_url, context)
+                + describe_component_batch(components[middle:], repo_url, context))
+    if missing:
+        results.extend(describe_component_batch(missing, repo_url, context) if len(missing) < len(components)
+                       else [(component, component_error(component["component_type"], component["component_name"],
+                                                         "No description returned"))
+                             for component in missing])
+    return results
 
 
 print("[WALKTHROUGH] llm_handler.py: Finished loading.")
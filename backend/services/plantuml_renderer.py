@@ -0,0 +1,238 @@
+# services/plantuml_renderer.py
+import os
+import sys
+import time
+import queue
+import selectors
+import threading
+import subprocess
+from typing import Dict, Any, List, Optional
+
+import requests
+from plantuml import deflate_and_encode
+
+from config.config import settings
+
+print("[WALKTHROUGH] plantuml_renderer.py: Loading...")
+sys.stdout.flush()
+
+FORMATS = ("png", "svg")
+
+
+class PlantUMLRenderError(RuntimeError):
+    pass
+
+
+class PlantUMLRenderer:
+    """ Turns PlantUML source into image bytes. """
+
+    def render(self, uml_code: str, fmt: str = "png") -> bytes:
+        raise NotImplementedError
+
+    def render_many(self, uml_codes: List[str], fmt: str = "png") -> List[bytes]:
+        return [self.render(uml_code, fmt) for uml_code in uml_codes]
+
+    def close(self) -> None:
+        pass
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {}
+
+
+def _check_format(fmt: str) -> None:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported PlantUML format: {fmt}")
+
+
+class ServerRenderer(PlantUMLRenderer):
+    """
+    Renders through a PlantUML server's GET /{format}/{encoded} API, over a keep-alive
+    session. Point it at a local container (docker run -p 8080:8080 plantuml/plantuml-server:jetty)
+    to avoid the public server.
+    """
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._session = requests.Session()
+        self.renders = 0
+
+    def render(self, uml_code: str, fmt: str = "png") -> bytes:
+        _check_format(fmt)
+        response = self._session.get(
+            f"{self.url}/{fmt}/{deflate_and_encode(uml_code)}", timeout=self.timeout)
+        # The server answers 400 with an error image for diagrams that do not parse
+        if response.status_code != 200:
+            raise PlantUMLRenderError(
+                f"PlantUML server returned {response.status_code}: {response.headers.get('X-PlantUML-Diagram-Error', '')}")
+        self.renders += 1
+        return response.content
+
+    def close(self) -> None:
+        self._session.close()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {"backend": "server", "url": self.url, "renders": self.renders}
+
+
+class _PipeProcess:
+    """ One long-lived `plantuml -pipe` JVM rendering diagram after diagram for one format. """
+
+    DELIMITER = b"___CODELORE_PLANTUML_END___"
+
+    def __init__(self, command: List[str], fmt: str):
+        self.process = subprocess.Popen(
+            command + [f"-t{fmt}", "-pipe", "-pipedelimitor", self.DELIMITER.decode("ascii")],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self._buffer = b""
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def render(self, uml_code: str, timeout: float) -> bytes:
+        if not uml_code.endswith("\n"):
+            uml_code += "\n"
+        self.process.stdin.write(uml_code.encode("utf-8"))
+        self.process.stdin.flush()
+        deadline = time.monotonic() + timeout
+        fd = self.process.stdout.fileno()
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while self.DELIMITER not in self._buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not selector.select(remaining):
+                    raise PlantUMLRenderError(f"PlantUML did not answer within {timeout}s")
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    raise PlantUMLRenderError("PlantUML process exited")
+                self._buffer += chunk
+        image, _, self._buffer = self._buffer.partition(self.DELIMITER)
+        # The delimiter is followed by a line break; images never start with one
+        self._buffer = self._buffer.lstrip(b"\r\n")
+        return image
+
+    def close(self) -> None:
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+
+
+class PipeRenderer(PlantUMLRenderer):
+    """
+    Renders with a pool of long-lived local `java -jar plantuml.jar -pipe` processes, so
+    each JVM starts once and then renders many diagrams, with source and image passed
+    through stdin/stdout rather than temp files. Processes are started lazily, one pool
+    per format, and replaced if they die or time out.
+    """
+
+    def __init__(self, jar_path: str, java: str = "java", processes: int = 2, timeout: float = 30.0):
+        if not os.path.isfile(jar_path):
+            raise FileNotFoundError(f"PlantUML jar not found: {jar_path}")
+        self.command = [java, "-Djava.awt.headless=true", "-jar", jar_path]
+        self.processes = max(1, processes)
+        self.timeout = timeout
+        self._idle: Dict[str, "queue.LifoQueue[Optional[_PipeProcess]]"] = {}
+        self._all: List[_PipeProcess] = []
+        self._lock = threading.Lock()
+        self.started = 0
+        self.restarts = 0
+        self.renders = 0
+
+    def _pool(self, fmt: str) -> "queue.LifoQueue[Optional[_PipeProcess]]":
+        with self._lock:
+            pool = self._idle.get(fmt)
+            if pool is None:
+                # Slots start empty (None) and get a process on first use
+                pool = self._idle[fmt] = queue.LifoQueue()
+                for _ in range(self.processes):
+                    pool.put(None)
+            return pool
+
+    def _start(self, fmt: str) -> _PipeProcess:
+        process = _PipeProcess(self.command, fmt)
+        with self._lock:
+            self._all.append(process)
+            self.started += 1
+        return process
+
+    def _discard(self, process: _PipeProcess) -> None:
+        process.process.kill()
+        with self._lock:
+            if process in self._all:
+                self._all.remove(process)
+            self.restarts += 1
+
+    def render(self, uml_code: str, fmt: str = "png") -> bytes:
+        _check_format(fmt)
+        pool = self._pool(fmt)
+        process = pool.get()
+        try:
+            if process is None or not process.alive():
+                process = self._start(fmt)
+            image = process.render(uml_code, self.timeout)
+            with self._lock:
+                self.renders += 1
+            return image
+        except Exception:
+            if process is not None:
+                self._discard(process)
+                process = None
+            raise
+        finally:
+            pool.put(process)
+
+    def close(self) -> None:
+        with self._lock:
+            processes, self._all, self._idle = self._all, [], {}
+        for process in processes:
+            process.close()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": "pipe", "processes": len(self._all), "started": self.started,
+                    "restarts": self.restarts, "renders": self.renders}
+
+
+_renderer: Optional[PlantUMLRenderer] = None
+_renderer_lock = threading.Lock()
+
+
+def create_renderer(kind: str) -> PlantUMLRenderer:
+    """ Builds a renderer by name: "server" (PLANTUML_SERVER_URL) or "pipe" (PLANTUML_JAR_PATH). """
+    kind = (kind or "server").lower()
+    if kind == "pipe":
+        return PipeRenderer(settings.PLANTUML_JAR_PATH, settings.PLANTUML_JAVA,
+                            settings.PLANTUML_PIPE_PROCESSES, settings.PLANTUML_TIMEOUT_SECONDS)
+    if kind != "server":
+        print(f"[WALKTHROUGH] plantuml_renderer.py: Unknown renderer '{kind}', using the PlantUML server.")
+        sys.stdout.flush()
+    return ServerRenderer(settings.PLANTUML_SERVER_URL, settings.PLANTUML_TIMEOUT_SECONDS)
+
+
+def get_renderer() -> PlantUMLRenderer:
+    """ Returns the process-wide renderer configured in settings. """
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            try:
+                _renderer = create_renderer(settings.PLANTUML_RENDERER)
+            except Exception as e:
+                print(f"[WALKTHROUGH] plantuml_renderer.py: ERROR creating '{settings.PLANTUML_RENDERER}' renderer, using the PlantUML server: {e}")
+                sys.stdout.flush()
+                _renderer = create_renderer("server")
+        return _renderer
+
+
+def set_renderer(renderer: Optional[PlantUMLRenderer]) -> None:
+    """ Replaces the process-wide renderer (None recreates it from settings on next use). """
+    global _renderer
+    with _renderer_lock:
+        previous, _renderer = _renderer, renderer
+    if previous is not None and previous is not renderer:
+        previous.close()
+
+
+print("[WALKTHROUGH] plantuml_renderer.py: Finished loading.")
+sys.stdout.flush()
@@ -0,0 +1,180 @@
+# services/prompt_builder.py
+import sys
+import math
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+print("[WALKTHROUGH] prompt_builder.py: Loading...")
+sys.stdout.flush()
+
+# Identifier lists tokenize worse than prose (~3 chars/token for snake_case and CamelCase
+# names vs ~4 for English), so estimates use the lower figure and err on the high side
+CHARS_PER_TOKEN = 3.0
+
+# Share of the symbol budget each section gets first; tokens a section leaves unused go
+# to the next sections, in this order
+SECTION_SHARES = (("classes", 0.35), ("functions", 0.40), ("imports", 0.25))
+
+
+def estimate_tokens(text: str) -> int:
+    """ Conservative token estimate for Gemini prompts (no tokenizer call). """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _is_public(name: str) -> bool:
+    return not name.startswith("_")
+
+
+def _is_test(name: str) -> bool:
+    lowered = name.lower()
+    return lowered.startswith("test") or lowered.endswith("test") or lowered.endswith("tests")
+
+
+def class_references(class_models: List[Dict[str, Any]]) -> Counter:
+    """ How often each class name is extended, composed or referenced by another class. """
+    references: Counter = Counter()
+    for model in class_models or []:
+        for name in set(model.get("bases", []) + model.get("composes", []) + model.get("uses", [])):
+            short = name.split(".")[-1]
+            if short != model.get("name"):
+                references[short] += 1
+    return references
+
+
+def rank_symbols(names: List[str], counts: Optional[Dict[str, int]] = None,
+                 references: Optional[Dict[str, int]] = None) -> List[str]:
+    """
+    Orders names by salience: references from other classes weigh most, then the number
+    of files defining (or importing) the name, then public over private names. Dunder
+    names are dropped and test helpers go last; ties are broken alphabetically.
+    """
+    counts = counts or {}
+    references = references or {}
+
+    def score(name: str) -> float:
+        value = 2.0 * references.get(name, 0) + counts.get(name, 1)
+        if _is_public(name):
+            value += 1.0
+        if _is_test(name):
+            value -= 100.0
+        return value
+
+    ranked = [name for name in names if not (name.startswith("__") and name.endswith("__"))]
+    return sorted(ranked, key=lambda name: (-score(name), name))
+
+
+def _fill(names: List[str], budget: int, start: int = 0) -> Tuple[int, int]:
+    """ Returns (end index, tokens used) of the longest run of names from `start` that fits `budget`. """
+    used = 0
+    end = start
+    while end < len(names):
+        cost = estimate_tokens(names[end] + ", ")
+        if used + cost > budget:
+            break
+        used += cost
+        end += 1
+    return end, used
+
+
+def allocate(sections: Dict[str, List[str]], budget: int) -> Dict[str, List[str]]:
+    """
+    Picks the top-ranked names of each section within `budget` tokens: each section
+    first gets its SECTION_SHARES share, then unused tokens are handed on.
+    """
+    taken = {name: 0 for name in sections}
+    spent = 0
+    for name, share in SECTION_SHARES:
+        if name in sections:
+            taken[name], used = _fill(sections[name], int(budget * share))
+            spent += used
+    for name, _ in SECTION_SHARES:
+        if name in sections:
+            taken[name], used = _fill(sections[name], budget - spent, taken[name])
+            spent += used
+    return {name: sections[name][:taken[name]] for name in sections}
+
+
+def _listing(names: List[str], total: int) -> str:
+    if not names:
+        return "None detected"
+    more = f" (+{total - len(names)} more)" if total > len(names) else ""
+    return ", ".join(names) + more
+
+
+def build_narrative_prompt(analysis_data: Dict[str, Any], repo_url: str,
+                           token_budget: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    Builds the narrative prompt with the most salient functions, classes and imports that
+    fit `token_budget` estimated tokens, each listed once. Returns the prompt and a
+    report: {"budget", "prompt_tokens", "template_tokens", "<section>": {"included", "total"}}.
+    """
+    latest_commit = analysis_data.get('latest_commit', {})
+    code_analysis = analysis_data.get('code_analysis', {})
+    owner = analysis_data.get('owner', 'N/A')
+    repo_name = analysis_data.get('repo_name', 'N/A')
+    detected_frameworks = analysis_data.get('detected_frameworks', [])
+    # Per-name file counts from the worker (see _CodeAnalysisCollector.symbol_counts)
+    symbol_counts = analysis_data.get('symbol_counts') or {}
+    # Only the subject line of the commit message; bodies can be arbitrarily long
+    commit_lines = (latest_commit.get('message') or 'N/A').strip().splitlines()
+    commit_subject = commit_lines[0][:200] if commit_lines else 'N/A'
+
+    # Frameworks are already named in the prompt; their imports add nothing
+    frameworks = {framework.lower() for framework in detected_frameworks}
+    sections = {
+        "classes": rank_symbols(code_analysis.get('unique_classes', []), symbol_counts.get('classes'),
+                                class_references(code_analysis.get('class_models'))),
+        "functions": rank_symbols(code_analysis.get('unique_functions', []), symbol_counts.get('functions')),
+        "imports": rank_symbols([name for name in code_analysis.get('unique_imports', [])
+                                 if name.lower() not in frameworks], symbol_counts.get('imports')),
+    }
+
+    def render(chosen: Dict[str, List[str]]) -> str:
+        return f"""
+    You are 'CodeLore', a digital storyteller crafting an engaging narrative about a GitHub repository based on API data. Your output MUST be a single block of text containing embedded HTML `<span>` tags with Tailwind CSS classes for styling specific keywords.
+
+    **The Subject:** The repository '{repo_name}' by '{owner}' ({repo_url}).
+
+    **The Clues (API Snapshot):**
+    *   Latest Dispatch: Commit by '{latest_commit.get('author', 'N/A')}' on {latest_commit.get('date', 'N/A')} ("{commit_subject}")
+    *   Tech Toolkit Hints: Frameworks/Libraries detected include: {', '.join(detected_frameworks) if detected_frameworks else 'None detected'}.
+    *   Code Blueprint (most significant names first):
+        - Analyzed {code_analysis.get('files_analyzed_count', 0)} files (~{code_analysis.get('lines_analyzed_count', 0)} lines).
+        - Key Functions: {_listing(chosen['functions'], len(sections['functions']))}
+        - Key Classes: {_listing(chosen['classes'], len(sections['classes']))}
+        - Notable Imports: {_listing(chosen['imports'], len(sections['imports']))}
+
+    **Your Storytelling & Styling Task:**
+    Based *only* on these clues:
+    1.  **Infer Purpose:** Start with the project's likely mission.
+    2.  **Describe Tech:** Discuss the technical landscape suggested by imports/frameworks.
+    3.  **Reveal Logic:** Hint at the core logic using function/class names.
+    4.  **Show Status:** Mention the latest commit activity.
+    5.  **Weave Narrative:** Create a smooth, engaging story flow (150-250 words).
+
+    **Styling Rules (Apply within the narrative text):**
+    *   Wrap detected **frameworks/libraries** (from 'Tech Toolkit Hints') in: `<span class="font-semibold text-blue-600 dark:text-blue-400">FrameworkName</span>`
+    *   Wrap key **function names** (from 'Key Functions') mentioned in the narrative in: `<span class="font-mono text-sm text-purple-700 dark:text-purple-300 bg-purple-100 dark:bg-purple-900 px-1 rounded">function_name()</span>` (add parentheses if appropriate)
+    *   Wrap key **class names** (from 'Key Classes') mentioned in the narrative in: `<span class="font-medium text-teal-700 dark:text-teal-300">ClassName</span>`
+    *   Wrap the inferred **project purpose/domain** (first sentence or key phrase) in: `<span class="font-bold text-gray-800 dark:text-gray-200">Purpose Phrase</span>`
+    *   Wrap the **latest commit message snippet** if mentioned in: `<span class="italic text-gray-600 dark:text-gray-400">"Commit message..."</span>`
+
+    **Output Format:** A single block of narrative text containing the embedded HTML `<span>` tags as specified. Do NOT output markdown formatting like backticks or asterisks. Ensure HTML is valid.
+    """
+
+    template_tokens = estimate_tokens(render({name: [] for name in sections}))
+    # A few tokens per section for the "(+N more)" suffix
+    chosen = allocate(sections, max(0, token_budget - template_tokens - 5 * len(sections)))
+    prompt = render(chosen)
+    report: Dict[str, Any] = {
+        "budget": token_budget,
+        "prompt_tokens": estimate_tokens(prompt),
+        "template_tokens": template_tokens,
+    }
+    for name, names in sections.items():
+        report[name] = {"included": len(chosen[name]), "total": len(names)}
+    return prompt, report
+
+
+print("[WALKTHROUGH] prompt_builder.py: Finished loading.")
+sys.stdout.flush()
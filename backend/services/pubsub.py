@@ -0,0 +1,280 @@
+# services/pubsub.py
+import sys
+import json
+import time
+import uuid
+import queue
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from config.config import settings
+
+print("[WALKTHROUGH] pubsub.py: Loading...")
+sys.stdout.flush()
+
+
+def progress_channel(task_id: str) -> str:
+    """ Channel carrying progress events for one analysis task. """
+    return f"analysis.{task_id}"
+
+
+class Subscription:
+    """ Receives the messages published to one channel after it was opened. """
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """ Returns the next message, or None if none arrived within `timeout` seconds. """
+        raise NotImplementedError
+
+    async def get_async(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """ get() for the event loop: waits without holding a thread. """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Broker:
+    """ Fire-and-forget publish/subscribe of JSON messages on named channels. """
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def subscribe(self, channel: str) -> Subscription:
+        raise NotImplementedError
+
+
+class _MemorySubscription(Subscription):
+    def __init__(self, broker: "InMemoryBroker", channel: str):
+        self._broker = broker
+        self.channel = channel
+        self.messages: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._waiter: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = None
+        self._lock = threading.Lock()
+
+    def deliver(self, message: Dict[str, Any]) -> None:
+        """ Queues a message and wakes a pending get_async(); safe from any thread. """
+        self.messages.put(message)
+        with self._lock:
+            waiter = self._waiter
+        if waiter is not None:
+            loop, event = waiter
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # The waiting loop has closed
+
+    def _take(self) -> Optional[Dict[str, Any]]:
+        try:
+            return self.messages.get_nowait()
+        except queue.Empty:
+            return None
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def get_async(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        message = self._take()
+        if message is not None:
+            return message
+        event = asyncio.Event()
+        with self._lock:
+            self._waiter = (asyncio.get_running_loop(), event)
+        try:
+            # A message may have arrived before the waiter was registered
+            message = self._take()
+            if message is not None:
+                return message
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            return self._take()
+        finally:
+            with self._lock:
+                self._waiter = None
+
+    def close(self) -> None:
+        self._broker._unsubscribe(self)
+
+
+class InMemoryBroker(Broker):
+    """
+    Delivers messages to subscribers in the same process. Used when the API and the
+    worker share a process (eager Celery, tests) or when no broker is configured.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[str, List[_MemorySubscription]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, []))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    def subscribe(self, channel: str) -> Subscription:
+        subscription = _MemorySubscription(self, channel)
+        with self._lock:
+            self._subscriptions.setdefault(channel, []).append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: _MemorySubscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.channel, None)
+
+
+class KombuBroker(Broker):
+    """
+    Publishes through the Celery message broker (RabbitMQ, Redis, ...) on a topic
+    exchange, so API processes receive events published by worker processes.
+
+    Subscribing is local: on first use, the process opens a single consumer connection
+    with one exclusive queue, and one thread hands each message to the subscriptions of
+    its channel. The queue is bound per topic (the channel up to the first "."), e.g.
+    "analysis.#" once anything subscribes to an analysis channel, within a second of the
+    first subscription to it. No connection or thread is held per subscriber.
+    """
+
+    def __init__(self, url: str, exchange_name: str = "codelore.events"):
+        from kombu import Connection, Exchange
+
+        self.url = url
+        self.exchange = Exchange(exchange_name, type="topic", durable=False, auto_delete=False)
+        self._connection = Connection(url)
+        self._lock = threading.Lock()
+        self._local = InMemoryBroker()  # Fans messages out to this process's subscribers
+        self._topics: Set[str] = set()  # Guarded by _lock; bound by the consumer thread
+        self._consumer_thread: Optional[threading.Thread] = None
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        from kombu.pools import producers
+
+        with self._lock:
+            with producers[self._connection].acquire(block=True, timeout=5) as producer:
+                producer.publish(
+                    message, exchange=self.exchange, routing_key=channel, serializer="json",
+                    declare=[self.exchange], retry=True,
+                    retry_policy={"max_retries": 2, "interval_start": 0, "interval_step": 0.5})
+
+    def subscribe(self, channel: str) -> Subscription:
+        with self._lock:
+            self._topics.add(channel.split(".", 1)[0])
+            if self._consumer_thread is None:
+                self._consumer_thread = threading.Thread(
+                    target=self._consume, name="pubsub-consumer", daemon=True)
+                self._consumer_thread.start()
+        return self._local.subscribe(channel)
+
+    def _on_message(self, body, message) -> None:
+        message.ack()
+        self._local.publish(message.delivery_info.get("routing_key", ""), body)
+
+    def _consume(self) -> None:
+        from kombu import Connection, Consumer, Queue
+
+        while True:
+            try:
+                with Connection(self.url) as connection:
+                    # Exclusive, auto-deleted queue: it only lives as long as this process's connection
+                    events_queue = Queue(f"{self.exchange.name}.{uuid.uuid4().hex}",
+                                         exclusive=True, auto_delete=True)
+                    bound_topics: Set[str] = set()
+                    with Consumer(connection.channel(), queues=[events_queue],
+                                  callbacks=[self._on_message], accept=["json"]) as consumer:
+                        self.exchange(consumer.channel).declare()
+                        while True:
+                            with self._lock:
+                                new_topics = self._topics - bound_topics
+                            for topic in new_topics:
+                                consumer.queues[0].bind_to(exchange=self.exchange, routing_key=f"{topic}.#")
+                                bound_topics.add(topic)
+                            try:
+                                connection.drain_events(timeout=1.0)
+                            except TimeoutError:
+                                pass
+            except Exception as e:
+                print(f"[WALKTHROUGH] pubsub.py: WARNING: Event consumer connection failed, reconnecting: {e}")
+                sys.stdout.flush()
+                time.sleep(1.0)
+
+
+_broker: Optional[Broker] = None
+_broker_initialized = False
+_broker_lock = threading.Lock()
+
+
+def create_broker(kind: str) -> Optional[Broker]:
+    """ Builds a broker by name: "broker" (the Celery broker URL), "memory" or "none". """
+    kind = (kind or "none").lower()
+    if kind == "broker":
+        if settings.CELERY_BROKER_URL:
+            return KombuBroker(settings.CELERY_BROKER_URL)
+        print("[WALKTHROUGH] pubsub.py: No CELERY_BROKER_URL set, using in-memory pub/sub.")
+        sys.stdout.flush()
+        return InMemoryBroker()
+    if kind == "memory":
+        return InMemoryBroker()
+    if kind != "none":
+        print(f"[WALKTHROUGH] pubsub.py: Unknown pub/sub backend '{kind}', pub/sub disabled.")
+        sys.stdout.flush()
+    return None
+
+
+def get_broker() -> Optional[Broker]:
+    """ Returns the process-wide broker configured in settings, or None if disabled. """
+    global _broker, _broker_initialized
+    with _broker_lock:
+        if not _broker_initialized:
+            _broker_initialized = True
+            try:
+                _broker = create_broker(settings.PUBSUB_BACKEND)
+            except Exception as e:
+                print(f"[WALKTHROUGH] pubsub.py: ERROR initializing pub/sub, disabled: {e}")
+                sys.stdout.flush()
+                _broker = None
+        return _broker
+
+
+def set_broker(broker: Optional[Broker]) -> None:
+    """ Replaces the process-wide broker (e.g. with an InMemoryBroker in tests). """
+    global _broker, _broker_initialized
+    with _broker_lock:
+        _broker = broker
+        _broker_initialized = True
+
+
+def publish(channel: str, message: Dict[str, Any]) -> None:
+    """ Publishes to the process-wide broker. Never raises: events are best effort. """
+    broker = get_broker()
+    if broker is None:
+        return
+    try:
+        broker.publish(channel, message)
+    except Exception as e:
+        print(f"[WALKTHROUGH] pubsub.py: WARNING: Could not publish to {channel}: {e}")
+        sys.stdout.flush()
+
+
+def format_sse(message: Dict[str, Any], event: Optional[str] = None) -> str:
+    """ Serializes a message as one Server-Sent Events frame. """
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(message)}\n\n"
+
+
+print("[WALKTHROUGH] pubsub.py: Finished loading.")
+sys.stdout.flush()
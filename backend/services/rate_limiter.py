@@ -0,0 +1,227 @@
+# services/rate_limiter.py
+import sys
+import time
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+import requests
+from config.config import settings
+
+print("[WALKTHROUGH] rate_limiter.py: Loading...")
+sys.stdout.flush()
+
+
+class RateLimitWaitTimeout(requests.exceptions.RequestException):
+    """ Raised when a request waited longer than GITHUB_MAX_QUEUE_WAIT_SECONDS for budget. """
+
+
+class TokenBucket:
+    """ Classic token bucket: `rate` tokens per second, holding at most `capacity` tokens. """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """ Takes `tokens` if available and returns 0, otherwise returns the seconds to wait. """
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (tokens - self.tokens) / self.rate
+
+    def set_rate(self, rate: float) -> None:
+        self._refill()
+        self.rate = rate
+
+
+class _TokenState:
+    """ Scheduler state for one GitHub token. """
+
+    def __init__(self):
+        self.bucket = TokenBucket(settings.GITHUB_MAX_REQUESTS_PER_SECOND,
+                                  settings.GITHUB_BURST_REQUESTS)
+        self.condition = threading.Condition()
+        self.remaining: Optional[int] = None
+        self.limit: Optional[int] = None
+        self.reset_at: Optional[float] = None  # Epoch seconds from X-RateLimit-Reset
+        self.observed_at: Optional[float] = None  # Epoch seconds of the last rate-limit headers
+        self.blocked_until = 0.0  # Monotonic time before which nothing may be sent
+        self.backoff_seconds = 0.0  # Grows on repeated secondary rate limits
+        self.waiting: Dict[str, int] = {}
+        self.last_grant: Dict[str, int] = {}
+        self.grant_seq = 0
+        self.throttled_count = 0
+
+
+class GitHubRateLimiter:
+    """
+    Scheduler that sits in front of every GitHub request.
+
+    - A token bucket per GitHub token caps the request rate. When the remaining budget
+      (per the rate-limit headers) nears the reserve plus the queued requests, the rate is
+      lowered so what is left lasts until the reset.
+    - X-RateLimit-Remaining/Reset, Retry-After and secondary rate limit responses block
+      the token until it is safe to send again.
+    - Waiting requests are granted round-robin across fairness keys (the Celery task id),
+      so one large repository cannot starve other tasks sharing the same token.
+
+    State is per process; prefork workers coordinate only through the headers GitHub returns.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, _TokenState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, token_key: str) -> _TokenState:
+        with self._lock:
+            state = self._states.get(token_key)
+            if state is None:
+                state = self._states[token_key] = _TokenState()
+            return state
+
+    def acquire(self, token_key: str, fair_key: str) -> None:
+        """
+        Blocks until a request may be sent with this token on behalf of `fair_key`.
+        Raises RateLimitWaitTimeout if that takes longer than the configured queue wait.
+        """
+        state = self._state(token_key)
+        deadline = time.monotonic() + settings.GITHUB_MAX_QUEUE_WAIT_SECONDS
+        with state.condition:
+            state.waiting[fair_key] = state.waiting.get(fair_key, 0) + 1
+            try:
+                while True:
+                    if state.reset_at is not None and time.time() >= state.reset_at:
+                        # The window rolled over; run at full rate until new headers arrive
+                        state.reset_at = None
+                        state.remaining = None
+                        state.bucket.set_rate(settings.GITHUB_MAX_REQUESTS_PER_SECOND)
+                    if time.monotonic() >= deadline:
+                        raise RateLimitWaitTimeout(
+                            f"Waited over {settings.GITHUB_MAX_QUEUE_WAIT_SECONDS}s for GitHub rate limit budget.")
+                    delay = state.blocked_until - time.monotonic()
+                    if delay <= 0:
+                        # The waiting key served least recently goes next
+                        turn = min(state.waiting, key=lambda key: state.last_grant.get(key, -1))
+                        if turn == fair_key:
+                            delay = state.bucket.try_acquire()
+                            if delay == 0:
+                                state.grant_seq += 1
+                                state.last_grant[fair_key] = state.grant_seq
+                                return
+                        else:
+                            delay = None  # Wait for the other key to take its turn
+                    state.condition.wait(timeout=min(delay, 1.0) if delay is not None else 1.0)
+            finally:
+                state.waiting[fair_key] -= 1
+                if state.waiting[fair_key] <= 0:
+                    del state.waiting[fair_key]
+                state.condition.notify_all()
+
+    def observe(self, token_key: str, response) -> Optional[float]:
+        """
+        Updates the token's budget from a response's headers. Returns the seconds to wait
+        before retrying if the response was rejected by a rate limit, otherwise None.
+        """
+        state = self._state(token_key)
+        headers = response.headers
+        retry_delay: Optional[float] = None
+        with state.condition:
+            remaining = headers.get("X-RateLimit-Remaining")
+            limit = headers.get("X-RateLimit-Limit")
+            reset = headers.get("X-RateLimit-Reset")
+            if remaining is not None and remaining.isdigit():
+                state.remaining = int(remaining)
+            if limit is not None and limit.isdigit():
+                state.limit = int(limit)
+            if reset is not None and reset.isdigit():
+                state.reset_at = float(reset)
+            if remaining is not None or reset is not None:
+                state.observed_at = time.time()
+
+            seconds_to_reset = max((state.reset_at or time.time()) - time.time(), 1.0)
+            if state.remaining is not None:
+                # Full rate while the budget above the reserve covers the queued requests plus a
+                # burst; only then spread what is left over the time to reset
+                spendable = max(state.remaining - settings.GITHUB_RATE_LIMIT_RESERVE, 0)
+                demand = sum(state.waiting.values()) + settings.GITHUB_BURST_REQUESTS
+                rate = settings.GITHUB_MAX_REQUESTS_PER_SECOND
+                if spendable < demand:
+                    rate = min(rate, spendable / seconds_to_reset)
+                state.bucket.set_rate(rate)
+
+            if response.status_code in (403, 429):
+                retry_after = headers.get("Retry-After")
+                if retry_after is not None and retry_after.isdigit():
+                    retry_delay = float(retry_after)
+                elif state.remaining == 0:
+                    retry_delay = seconds_to_reset
+                elif response.status_code == 429 or _is_secondary_limit(response):
+                    # GitHub asks for at least a minute, doubling on repeated hits
+                    state.backoff_seconds = min(max(state.backoff_seconds * 2, 60.0), 900.0)
+                    retry_delay = state.backoff_seconds
+
+            if retry_delay is not None:
+                state.throttled_count += 1
+                state.blocked_until = max(state.blocked_until, time.monotonic() + retry_delay)
+                print(
+                    f"[WALKTHROUGH] rate_limiter.py: GitHub rate limit hit (status {response.status_code}), pausing token for {retry_delay:.0f}s.")
+                sys.stdout.flush()
+            elif response.status_code < 400:
+                state.backoff_seconds = 0.0
+            state.condition.notify_all()
+        return retry_delay
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """ Snapshot of the remaining budget and scheduler queue per token. """
+        metrics = {}
+        with self._lock:
+            states = dict(self._states)
+        for token_key, state in states.items():
+            with state.condition:
+                metrics[token_key] = {
+                    "remaining": state.remaining,
+                    "limit": state.limit,
+                    "reset_at": state.reset_at,
+                    "observed_at": state.observed_at,
+                    "reset_in_seconds": round(max(state.reset_at - time.time(), 0), 1) if state.reset_at else None,
+                    "blocked_for_seconds": round(max(state.blocked_until - time.monotonic(), 0), 1),
+                    "current_rate_per_second": round(state.bucket.rate, 3),
+                    "waiting_requests": sum(state.waiting.values()),
+                    "waiting_tasks": len(state.waiting),
+                    "throttled_responses": state.throttled_count,
+                }
+        return metrics
+
+
+def _is_secondary_limit(response) -> bool:
+    try:
+        return "secondary rate limit" in response.text.lower()
+    except Exception:
+        return False
+
+
+def token_key_for(headers: Dict[str, str]) -> str:
+    """ Stable, non-reversible id for the token in a set of request headers. """
+    authorization = headers.get("Authorization")
+    if not authorization:
+        return "anonymous"
+    return "token-" + hashlib.sha256(authorization.encode("utf-8")).hexdigest()[:12]
+
+
+# Shared by every GitHubClient in this process
+github_rate_limiter = GitHubRateLimiter()
+
+
+print("[WALKTHROUGH] rate_limiter.py: Finished loading.")
+sys.stdout.flush()
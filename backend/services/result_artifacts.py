@@ -0,0 +1,236 @@
+# services/result_artifacts.py
+import sys
+import json
+import zlib
+import base64
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+import supabase_client
+from config.config import settings
+
+print("[WALKTHROUGH] result_artifacts.py: Loading...")
+sys.stdout.flush()
+
+# Heavy parts of an analysis result, stored out of line as compressed artifacts.
+# Maps artifact name -> path of the value inside the result.
+ARTIFACT_PATHS: Dict[str, Tuple[str, ...]] = {
+    "repo_tree": ("repo_tree",),
+    "repo_info": ("repo_info",),
+    "code_analysis": ("analysis_details", "code_analysis"),
+    "file_results": ("file_results",),
+}
+
+# Fields kept inline so the main row stays useful on its own (the repository header,
+# the stat cards and the dedup/incremental lookups read these without any artifact).
+REPO_INFO_SUMMARY_FIELDS = (
+    "name", "full_name", "description", "html_url", "default_branch", "language",
+    "topics", "stargazers_count", "forks_count", "open_issues_count",
+)
+CODE_ANALYSIS_SUMMARY_FIELDS = ("files_analyzed_count", "lines_analyzed_count")
+
+ARTIFACT_ENCODING = "zlib+base64"
+
+
+def encode_artifact(value: Any) -> str:
+    return encode_artifact_bytes(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_artifact(data: str, encoding: str = ARTIFACT_ENCODING) -> Any:
+    return json.loads(decode_artifact_bytes(data, encoding))
+
+
+def encode_artifact_bytes(raw: bytes) -> str:
+    return base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+
+
+def decode_artifact_bytes(data: str, encoding: str = ARTIFACT_ENCODING) -> bytes:
+    if encoding != ARTIFACT_ENCODING:
+        raise ValueError(f"Unsupported artifact encoding: {encoding}")
+    return zlib.decompress(base64.b64decode(data))
+
+
+def _get_path(result: Dict[str, Any], path: Tuple[str, ...]) -> Any:
+    value = result
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def _set_path(result: Dict[str, Any], path: Tuple[str, ...], value: Any) -> None:
+    for key in path[:-1]:
+        result = result.setdefault(key, {})
+    result[path[-1]] = value
+
+
+def _summary(name: str, value: Any) -> Any:
+    """ The small inline stand-in left in the result for an artifact. """
+    if name == "repo_info" and isinstance(value, dict):
+        summary = {field: value.get(field) for field in REPO_INFO_SUMMARY_FIELDS if field in value}
+        owner = value.get("owner") or {}
+        summary["owner"] = {"login": owner.get("login"), "avatar_url": owner.get("avatar_url")}
+        return summary
+    if name == "code_analysis" and isinstance(value, dict):
+        return {field: value.get(field) for field in CODE_ANALYSIS_SUMMARY_FIELDS}
+    return None
+
+
+def store_result_artifacts(task_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Writes the heavy parts of `result` to the artifacts table and returns a slim copy
+    of the result that references them under result["artifacts"]. Returns the result
+    unchanged when artifacts are disabled.
+    """
+    if not settings.RESULT_ARTIFACTS_ENABLED:
+        return result
+    slim = json.loads(json.dumps(result))  # Deep copy; the result is plain JSON
+    rows = []
+    references = {}
+    for name, path in ARTIFACT_PATHS.items():
+        value = _get_path(slim, path)
+        if value is None:
+            continue
+        data = encode_artifact(value)
+        rows.append({"task_id": task_id, "name": name,
+                     "encoding": ARTIFACT_ENCODING, "data": data, "size": len(data)})
+        references[name] = {"task_id": task_id, "size": len(data)}
+        summary = _summary(name, value)
+        if summary is None:
+            # Drop the key entirely rather than leaving a misleading empty value
+            parent = _get_path(slim, path[:-1]) if len(path) > 1 else slim
+            parent.pop(path[-1], None)
+        else:
+            _set_path(slim, path, summary)
+    if rows:
+        supabase_client.save_artifacts(rows)
+    slim["artifacts"] = references
+    return slim
+
+
+def load_result_artifacts(result: Optional[Dict[str, Any]], names: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Returns a copy of a stored result with the referenced artifacts put back in place.
+    `names` limits which artifacts are loaded (all by default). Results written before
+    artifacts existed are returned as they are.
+    """
+    if not isinstance(result, dict) or not result.get("artifacts"):
+        return result
+    references = result["artifacts"]
+    wanted = [name for name in (names if names is not None else references)
+              if name in references and name in ARTIFACT_PATHS]
+    hydrated = dict(result)
+    if "analysis_details" in hydrated:
+        hydrated["analysis_details"] = dict(hydrated["analysis_details"] or {})
+
+    # References may point at another task's artifacts (reused results), so group by owner
+    names_by_task: Dict[str, list] = {}
+    for name in wanted:
+        owner_task_id = references[name]["task_id"]
+        cached = _cached_artifact(owner_task_id, name)
+        if cached is not _MISSING:
+            _set_path(hydrated, ARTIFACT_PATHS[name], cached)
+        else:
+            names_by_task.setdefault(owner_task_id, []).append(name)
+    for owner_task_id, artifact_names in names_by_task.items():
+        for row in supabase_client.get_artifacts(owner_task_id, artifact_names):
+            value = decode_artifact(row["data"], row.get("encoding") or ARTIFACT_ENCODING)
+            _cache_artifact(owner_task_id, row["name"], value)
+            _set_path(hydrated, ARTIFACT_PATHS[row["name"]], value)
+    return hydrated
+
+
+# Artifacts never change once written, so decoded values can be kept per process.
+# Callers must treat returned values as read-only.
+_MISSING = object()
+_decoded_artifacts: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+_decoded_artifacts_lock = threading.Lock()
+
+
+def _cached_artifact(task_id: str, name: str) -> Any:
+    with _decoded_artifacts_lock:
+        value = _decoded_artifacts.get((task_id, name), _MISSING)
+        if value is not _MISSING:
+            _decoded_artifacts.move_to_end((task_id, name))
+        return value
+
+
+def _cache_artifact(task_id: str, name: str, value: Any) -> None:
+    if settings.ARTIFACT_CACHE_ENTRIES <= 0:
+        return
+    with _decoded_artifacts_lock:
+        _decoded_artifacts[(task_id, name)] = value
+        while len(_decoded_artifacts) > settings.ARTIFACT_CACHE_ENTRIES:
+            _decoded_artifacts.popitem(last=False)
+
+
+def save_artifact_bytes(owner: str, name: str, raw: bytes) -> None:
+    """ Stores one artifact whose value is already-serialized JSON. """
+    data = encode_artifact_bytes(raw)
+    supabase_client.save_artifacts([{"task_id": owner, "name": name,
+                                     "encoding": ARTIFACT_ENCODING, "data": data, "size": len(data)}])
+    _cache_artifact(owner, name, raw)
+
+
+def load_artifact_bytes(owner: str, name: str) -> Optional[bytes]:
+    """ Returns the serialized JSON of one artifact stored with save_artifact_bytes(), or None. """
+    cached = _cached_artifact(owner, name)
+    if cached is not _MISSING:
+        return cached
+    rows = supabase_client.get_artifacts(owner, [name])
+    if not rows:
+        return None
+    raw = decode_artifact_bytes(rows[0]["data"], rows[0].get("encoding") or ARTIFACT_ENCODING)
+    _cache_artifact(owner, name, raw)
+    return raw
+
+
+def _overlaps(path: Tuple[str, ...], other: Tuple[str, ...]) -> bool:
+    shortest = min(len(path), len(other))
+    return path[:shortest] == other[:shortest]
+
+
+def load_result_fields(task_id: str, columns: List[str], result_paths: List[Tuple[str, ...]]) -> Optional[Dict[str, Any]]:
+    """
+    Reads only the requested row columns and result sub-fields of an analysis, pushing
+    the projection into the Supabase select (result->a->b). Artifacts are loaded only
+    when a requested path overlaps them. Returns {column: value, "result": {...}} or None.
+    """
+    select = list(dict.fromkeys(["task_id", *columns]))
+    aliases = {}
+    for index, path in enumerate(result_paths):
+        alias = f"result_{index}"
+        aliases[alias] = path
+        select.append(f"{alias}:result->" + "->".join(path))
+    needs_artifacts = any(_overlaps(path, artifact_path)
+                          for path in result_paths for artifact_path in ARTIFACT_PATHS.values())
+    if needs_artifacts:
+        select.append("result_artifacts:result->artifacts")
+
+    row = supabase_client.get_analysis_columns(task_id, ",".join(select))
+    if row is None:
+        return None
+
+    response = {column: row.get(column) for column in select if column in row and not column.startswith("result_")}
+    if not result_paths:
+        return response
+    partial: Dict[str, Any] = {}
+    for alias, path in aliases.items():
+        if row.get(alias) is not None:
+            _set_path(partial, path, row[alias])
+    if needs_artifacts and row.get("result_artifacts"):
+        partial["artifacts"] = row["result_artifacts"]
+        names = [name for name, artifact_path in ARTIFACT_PATHS.items()
+                 if any(_overlaps(path, artifact_path) for path in result_paths)]
+        partial = load_result_artifacts(partial, names)
+    projected: Dict[str, Any] = {}
+    for path in result_paths:
+        _set_path(projected, path, _get_path(partial, path))
+    response["result"] = projected
+    return response
+
+
+print("[WALKTHROUGH] result_artifacts.py: Finished loading.")
+sys.stdout.flush()
@@ -0,0 +1,267 @@
+# services/uml_class_diagram.py
+import re
+import sys
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+print("[WALKTHROUGH] uml_class_diagram.py: Loading...")
+sys.stdout.flush()
+
+# Members shown per class; the rest is summarized as "..."
+MAX_MEMBERS_SHOWN = 12
+# Bases that only restate the class kind
+_IMPLICIT_BASES = {"Enum", "IntEnum", "StrEnum", "Flag", "IntFlag", "Protocol", "Object", "object"}
+_CLASS_KEYWORDS = {"class": "class", "abstract": "abstract class", "interface": "interface", "enum": "enum"}
+# Relationship arrows by strength; one edge per pair, the strongest wins
+_INHERITANCE, _COMPOSITION, _ASSOCIATION = "<|--", "*--", "-->"
+_EDGE_PRIORITY = {_INHERITANCE: 0, _COMPOSITION: 1, _ASSOCIATION: 2}
+
+
+def _alias(package: str, name: str) -> str:
+    return "c_" + re.sub(r"\W", "_", f"{package}.{name}" if package else name)
+
+
+def _clean(text: Optional[str]) -> str:
+    # Braces and line breaks would end the class body early
+    return re.sub(r"[{}\n\r]", "", text or "").strip()
+
+
+class ClassIndex:
+    """
+    All class models of a repository, keyed by alias, with name lookup for resolving
+    the bases and attribute types each model references.
+    """
+
+    def __init__(self, class_models: List[Dict[str, Any]]):
+        self.models: Dict[str, Dict[str, Any]] = {}
+        self._by_name: Dict[str, List[str]] = defaultdict(list)
+        for model in sorted(class_models, key=lambda m: (m.get("package") or "", m["name"], m.get("file") or "")):
+            alias = _alias(model.get("package") or "", model["name"])
+            if alias in self.models:
+                continue  # Same class declared twice (e.g. a duplicated file); keep the first
+            self.models[alias] = model
+            self._by_name[model["name"]].append(alias)
+
+    def resolve(self, name: str, package: str) -> Optional[str]:
+        """ Alias of the class a reference names: same package first, else a unique match. """
+        candidates = self._by_name.get(name.split(".")[-1], [])
+        same_package = [alias for alias in candidates if (self.models[alias].get("package") or "") == package]
+        if same_package:
+            return same_package[0]
+        return candidates[0] if len(candidates) == 1 else None
+
+    def relationships(self, alias: str) -> Dict[str, str]:
+        """ {target alias: arrow} for the resolvable references of one class. """
+        model = self.models[alias]
+        package = model.get("package") or ""
+        edges: Dict[str, str] = {}
+        references = ([(base, _INHERITANCE) for base in model.get("bases", [])]
+                      + [(name, _COMPOSITION) for name in model.get("composes", [])]
+                      + [(name, _ASSOCIATION) for name in model.get("uses", [])])
+        for name, arrow in references:
+            target = self.resolve(name, package)
+            if target is None or target == alias:
+                continue
+            if target not in edges or _EDGE_PRIORITY[arrow] < _EDGE_PRIORITY[edges[target]]:
+                edges[target] = arrow
+        return edges
+
+    def external_bases(self, alias: str) -> List[str]:
+        model = self.models[alias]
+        package = model.get("package") or ""
+        return [base.split(".")[-1] for base in model.get("bases", [])
+                if base.split(".")[-1] not in _IMPLICIT_BASES and self.resolve(base, package) is None]
+
+
+def cluster_packages(class_counts: Dict[str, int], max_classes: int) -> List[List[str]]:
+    """
+    Groups packages into clusters of at most `max_classes` classes, following the
+    package hierarchy: a subtree that fits stays together, larger subtrees are split
+    by their next name segment, and small neighbouring clusters are packed back
+    together. A single package larger than the limit forms its own cluster.
+    """
+    def split(packages: List[str], depth: int) -> List[List[str]]:
+        if sum(class_counts[package] for package in packages) <= max_classes:
+            return [packages]
+        direct, children = [], defaultdict(list)
+        for package in packages:
+            parts = package.split(".") if package else []
+            if len(parts) <= depth:
+                direct.append(package)
+            else:
+                children[".".join(parts[:depth + 1])].append(package)
+        clusters = [direct] if direct else []
+        for prefix in sorted(children):
+            clusters.extend(split(children[prefix], depth + 1))
+        return clusters
+
+    packed: List[List[str]] = []
+    size = 0
+    if not class_counts:
+        return packed
+    for cluster in split(sorted(class_counts), 0):
+        cluster_size = sum(class_counts[package] for package in cluster)
+        if packed and size + cluster_size <= max_classes:
+            packed[-1].extend(cluster)
+            size += cluster_size
+        else:
+            packed.append(list(cluster))
+            size = cluster_size
+    return packed
+
+
+def _cluster_title(packages: List[str]) -> str:
+    if len(packages) == 1:
+        return packages[0] or "(default package)"
+    split_packages = [package.split(".") for package in packages]
+    common = []
+    for parts in zip(*split_packages):
+        if len(set(parts)) != 1:
+            break
+        common.append(parts[0])
+    if common:
+        return ".".join(common) + ".*"
+    return f"{packages[0] or '(default package)'} +{len(packages) - 1} more"
+
+
+def _class_block(alias: str, model: Dict[str, Any], indent: str, external_bases: List[str]) -> List[str]:
+    keyword = _CLASS_KEYWORDS.get(model.get("kind"), "class")
+    stereotype = f" <<{', '.join(external_bases)}>>" if external_bases else ""
+    lines = [f'{indent}{keyword} "{_clean(model["name"])}" as {alias}{stereotype} {{']
+    attributes = model.get("attributes", [])
+    for attribute in attributes[:MAX_MEMBERS_SHOWN]:
+        if model.get("kind") == "enum":
+            lines.append(f"{indent}  {_clean(attribute['name'])}")
+            continue
+        type_suffix = f" : {_clean(attribute['type'])}" if attribute.get("type") else ""
+        lines.append(f"{indent}  {attribute.get('visibility', '+')} {_clean(attribute['name'])}{type_suffix}")
+    if len(attributes) > MAX_MEMBERS_SHOWN:
+        lines.append(f"{indent}  .. {len(attributes) - MAX_MEMBERS_SHOWN} more ..")
+    methods = model.get("methods", [])
+    if methods:
+        lines.append(f"{indent}  --")
+    for method in methods[:MAX_MEMBERS_SHOWN]:
+        static = "{static} " if method.get("static") else ""
+        lines.append(f"{indent}  {static}{method.get('visibility', '+')} {_clean(method['name'])}()")
+    if len(methods) > MAX_MEMBERS_SHOWN:
+        lines.append(f"{indent}  .. {len(methods) - MAX_MEMBERS_SHOWN} more ..")
+    lines.append(f"{indent}}}")
+    return lines
+
+
+def _header(title: str) -> List[str]:
+    return ["@startuml", "set namespaceSeparator none", "hide empty members",
+            "skinparam classAttributeIconSize 0", f"title {_clean(title)}"]
+
+
+def render_cluster(index: ClassIndex, aliases: List[str], title: str) -> str:
+    """
+    PlantUML for one group of classes, grouped by package. Classes elsewhere in the
+    repository that they extend or reference are drawn as member-less stubs.
+    """
+    shown = set(aliases)
+    edges: List[Tuple[str, str, str]] = []
+    stubs = set()
+    for alias in aliases:
+        for target, arrow in sorted(index.relationships(alias).items()):
+            edges.append((alias, target, arrow))
+            if target not in shown:
+                stubs.add(target)
+
+    by_package: Dict[str, List[str]] = defaultdict(list)
+    for alias in sorted(shown | stubs, key=lambda a: (index.models[a].get("package") or "", index.models[a]["name"])):
+        by_package[index.models[alias].get("package") or ""].append(alias)
+
+    lines = _header(title)
+    for package, package_aliases in by_package.items():
+        indent = "  " if package else ""
+        if package:
+            lines.append(f'package "{_clean(package)}" {{')
+        for alias in package_aliases:
+            model = index.models[alias]
+            if alias in shown:
+                lines.extend(_class_block(alias, model, indent, index.external_bases(alias)))
+            else:
+                keyword = _CLASS_KEYWORDS.get(model.get("kind"), "class")
+                lines.append(f'{indent}{keyword} "{_clean(model["name"])}" as {alias}')
+        if package:
+            lines.append("}")
+    for source, target, arrow in edges:
+        # Arrows point from the referenced class, so "Base <|-- Child", "Whole *-- Part" read naturally
+        if arrow == _INHERITANCE:
+            lines.append(f"{target} <|-- {source}")
+        elif arrow == _COMPOSITION:
+            lines.append(f"{source} *-- {target}")
+        else:
+            lines.append(f"{source} --> {target}")
+    lines.append("@enduml")
+    return "\n".join(lines)
+
+
+def render_overview(index: ClassIndex, clusters: List[Tuple[str, List[str]]]) -> str:
+    """ One node per cluster, with an arrow per cluster pair labelled by its relationship count. """
+    cluster_of = {alias: position for position, (_, aliases) in enumerate(clusters) for alias in aliases}
+    counts: Dict[Tuple[int, int], int] = defaultdict(int)
+    for alias, source in cluster_of.items():
+        for target_alias in index.relationships(alias):
+            target = cluster_of.get(target_alias)
+            if target is not None and target != source:
+                counts[(source, target)] += 1
+    lines = _header("Package overview")
+    for position, (title, aliases) in enumerate(clusters):
+        lines.append(f'package "{_clean(title)} ({len(aliases)} classes)" as p{position} {{')
+        lines.append("}")
+    for (source, target), count in sorted(counts.items()):
+        lines.append(f"p{source} --> p{target} : {count}")
+    lines.append("@enduml")
+    return "\n".join(lines)
+
+
+def build_class_diagrams(class_models: List[Dict[str, Any]], max_classes: int = 40,
+                         max_diagrams: int = 12) -> Dict[str, Any]:
+    """
+    Deterministic class diagrams straight from parsed class models (no LLM):
+    {"uml_code": main diagram, "diagrams": [{"title", "packages", "class_count", "uml_code"}],
+     "class_count": int, "truncated": bool}.
+    Small repositories get a single diagram. Larger ones are split into package
+    clusters of at most `max_classes` classes; the main diagram is then an overview of
+    the clusters and the `max_diagrams` largest clusters get their own diagram.
+    """
+    index = ClassIndex(class_models)
+    class_counts: Dict[str, int] = defaultdict(int)
+    aliases_by_package: Dict[str, List[str]] = defaultdict(list)
+    for alias, model in index.models.items():
+        class_counts[model.get("package") or ""] += 1
+        aliases_by_package[model.get("package") or ""].append(alias)
+
+    clusters: List[Tuple[str, List[str], List[str]]] = []
+    for packages in cluster_packages(class_counts, max_classes):
+        aliases = [alias for package in packages for alias in aliases_by_package[package]]
+        title = _cluster_title(packages)
+        if len(aliases) <= max_classes:
+            clusters.append((title, packages, aliases))
+            continue
+        # One package larger than the limit: split its classes alphabetically
+        for part, start in enumerate(range(0, len(aliases), max_classes)):
+            clusters.append((f"{title} ({part + 1})", packages, aliases[start:start + max_classes]))
+
+    if len(clusters) <= 1:
+        title, packages, aliases = clusters[0] if clusters else ("Classes", [], [])
+        uml_code = render_cluster(index, aliases, title)
+        diagrams = [{"title": title, "packages": packages, "class_count": len(aliases), "uml_code": uml_code}]
+        return {"uml_code": uml_code, "diagrams": diagrams, "class_count": len(index.models), "truncated": False}
+
+    largest = sorted(clusters, key=lambda cluster: (-len(cluster[2]), cluster[0]))[:max_diagrams]
+    diagrams = [{"title": title, "packages": packages, "class_count": len(aliases),
+                 "uml_code": render_cluster(index, aliases, title)}
+                for title, packages, aliases in largest]
+    return {
+        "uml_code": render_overview(index, [(title, aliases) for title, _, aliases in clusters]),
+        "diagrams": diagrams,
+        "class_count": len(index.models),
+        "truncated": len(clusters) > len(largest),
+    }
+
+
+print("[WALKTHROUGH] uml_class_diagram.py: Finished loading.")
+sys.stdout.flush()
@@ -1,49 +1,57 @@
 # services/uml_generator.py
 import sys
-import os
-from typing import Dict, Any, List
-import google.generativeai as genai
+import time
+from typing import Dict, Any, List, Callable, Iterator, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 import base64
 from io import BytesIO
-import plantuml
-import tempfile
+import re
+from config.config import settings
+from services import llm_backend, llm_cache, llm_gateway, plantuml_renderer, prompt_builder, uml_class_diagram
 
 print("[WALKTHROUGH] uml_generator.py: Loading...")
 sys.stdout.flush()
 
-# Configure Gemini API - reuse the same configuration as llm_handler
-gemini_model = None
-try:
-    print("[WALKTHROUGH] uml_generator.py: Configuring Gemini API...")
-    sys.stdout.flush()
-    # os.getenv("GEMINI_API_KEY")
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found in environment variables.")
-    genai.configure(api_key=api_key)
-    gemini_model = genai.GenerativeModel('gemini-1.5-flash-latest')
-    print("[WALKTHROUGH] uml_generator.py: Gemini API configured successfully.")
-    sys.stdout.flush()
-except Exception as e:
-    print(
-        f"[WALKTHROUGH] uml_generator.py: ERROR - Failed to configure Gemini API: {e}")
-    sys.stdout.flush()
+# LLM diagrams use the same backend as llm_handler (LLM_BACKEND, see services/llm_backend.py)
+
+# Diagrams are rendered by the renderer configured in settings (PLANTUML_RENDERER),
+# either a PlantUML server or local plantuml.jar processes
+
+_SAFETY_SETTINGS = [
+    {"category": c, "threshold": "BLOCK_MEDIUM_AND_ABOVE"}
+    for c in ["HARM_CATEGORY_HARASSMENT", "HARM_CATEGORY_HATE_SPEECH",
+              "HARM_CATEGORY_SEXUALLY_EXPLICIT", "HARM_CATEGORY_DANGEROUS_CONTENT"]
+]
+
+
+def _generate_text(prompt: str, generation: Dict[str, Any], safety: bool = True) -> str:
+    """
+    Text of a Gemini answer, served from the LLM cache when the same prompt and
+    generation config were answered before (see services/llm_cache.py). Calls go
+    through the LLM gateway at background priority.
+    """
+    safety_settings = _SAFETY_SETTINGS if safety else None
+    backend = llm_backend.get_backend()
 
-# Create a PlantUML instance using the default public server
-# If you have a local PlantUML server, you can specify its URL here
-plantuml_instance = plantuml.PlantUML(
-    url='http://www.plantuml.com/plantuml/png/')
+    def generate() -> str:
+        return llm_gateway.call(
+            lambda: backend.generate(prompt, generation, safety_settings),
+            prompt_builder.estimate_tokens(prompt) + generation["max_output_tokens"], llm_gateway.BACKGROUND)
+
+    return llm_cache.cached_generate(
+        backend.model_name, prompt, {"generation": generation, "safety": safety_settings}, generate)
 
 
 def generate_uml_class_diagram(classes_data: List[str], functions_data: List[str], imports_data: List[str], file_type_distribution: Dict[str, int]) -> Dict[str, Any]:
     """
-    Generate a UML class diagram description using Gemini LLM.
+    Generate a UML class diagram description using Gemini LLM, for analyses without
+    class models (see generate_uml_class_diagram_from_models).
     Returns the PlantUML diagram code.
     """
     print("[WALKTHROUGH] uml_generator.py: Generating UML class diagram...")
     sys.stdout.flush()
 
-    if not gemini_model:
+    if not llm_backend.get_backend().available():
         print("[WALKTHROUGH] uml_generator.py: ERROR - Gemini model not configured.")
         sys.stdout.flush()
         raise RuntimeError(
@@ -84,28 +92,7 @@ def generate_uml_class_diagram(classes_data: List[str], functions_data: List[str
     """
 
     try:
-        generation_config = genai.types.GenerationConfig(
-            max_output_tokens=1024,
-            temperature=0.2
-        )
-
-        safety_settings = [
-            {"category": c, "threshold": "BLOCK_MEDIUM_AND_ABOVE"}
-            for c in ["HARM_CATEGORY_HARASSMENT", "HARM_CATEGORY_HATE_SPEECH",
-                      "HARM_CATEGORY_SEXUALLY_EXPLICIT", "HARM_CATEGORY_DANGEROUS_CONTENT"]
-        ]
-
-        response = gemini_model.generate_content(
-            prompt,
-            generation_config=generation_config,
-            safety_settings=safety_settings
-        )
-
-        if not response.candidates:
-            raise ValueError(
-                f"Gemini response was empty or blocked. Feedback: {getattr(response, 'prompt_feedback', 'N/A')}")
-
-        uml_code = response.candidates[0].content.parts[0].text.strip()
+        uml_code = _generate_text(prompt, {"max_output_tokens": 1024, "temperature": 0.2}).strip()
 
         # Ensure the code starts and ends correctly
         if not uml_code.startswith('@startuml'):
@@ -119,7 +106,7 @@ def generate_uml_class_diagram(classes_data: List[str], functions_data: List[str
         return {
             "uml_code": uml_code,
             "image": diagram_image,
-            "format": "png",
+            "format": settings.PLANTUML_FORMAT,
             "encoding": "base64"
         }
 
@@ -133,6 +120,84 @@ def generate_uml_class_diagram(classes_data: List[str], functions_data: List[str
         }
 
 
+def _enrich_class_diagram(uml_code: str) -> str:
+    """
+    Optional LLM layer over a generated class diagram: asks Gemini to add short notes on
+    the main classes. Returns the original diagram if Gemini is unavailable, fails, or
+    drops any class of the original.
+    """
+    if not llm_backend.get_backend().available():
+        return uml_code
+    prompt = f"""
+    You are a software engineering expert. Below is a PlantUML class diagram generated from a
+    repository's source code. Add a few short `note` elements explaining the responsibility of the
+    most important classes. Do not remove, rename or re-alias any class, member or relationship.
+
+    {uml_code}
+
+    Return ONLY the PlantUML code without any other explanations. The code must begin with @startuml and end with @enduml.
+    """
+    try:
+        enriched = _generate_text(prompt, {"max_output_tokens": 4096, "temperature": 0.2}, safety=False).strip()
+        enriched = re.sub(r"^```\w*\s*|\s*```$", "", enriched)
+        aliases = set(re.findall(r" as (c_\w+)", uml_code))
+        if (enriched.startswith("@startuml") and enriched.endswith("@enduml")
+                and aliases <= set(re.findall(r" as (c_\w+)", enriched))):
+            return enriched
+        print("[WALKTHROUGH] uml_generator.py: Enriched class diagram dropped classes, keeping the generated one.")
+        sys.stdout.flush()
+    except Exception as e:
+        print(f"[WALKTHROUGH] uml_generator.py: WARNING: Class diagram enrichment failed: {e}")
+        sys.stdout.flush()
+    return uml_code
+
+
+def generate_uml_class_diagram_from_models(class_models: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build the UML class diagram straight from the parsed class models (no LLM call unless
+    UML_CLASS_DIAGRAM_LLM_ENRICH is set). Large repositories get a package overview as the
+    main diagram plus one diagram per package cluster under "diagrams".
+    """
+    print(
+        f"[WALKTHROUGH] uml_generator.py: Building UML class diagram from {len(class_models)} class models...")
+    sys.stdout.flush()
+
+    try:
+        built = uml_class_diagram.build_class_diagrams(
+            class_models, settings.UML_CLASS_DIAGRAM_MAX_CLASSES, settings.UML_CLASS_DIAGRAM_MAX_DIAGRAMS)
+        uml_code = built["uml_code"]
+        source = "ast"
+        if settings.UML_CLASS_DIAGRAM_LLM_ENRICH:
+            enriched = _enrich_class_diagram(uml_code)
+            source = "ast+llm" if enriched != uml_code else source
+            uml_code = enriched
+        # A single cluster is the main diagram itself
+        clusters = built["diagrams"] if len(built["diagrams"]) > 1 else []
+        codes = [uml_code] + [cluster["uml_code"] for cluster in clusters]
+        with ThreadPoolExecutor(max_workers=min(4, len(codes)), thread_name_prefix="uml-render") as executor:
+            images = list(executor.map(generate_plantuml_image, codes))
+
+        return {
+            "uml_code": uml_code,
+            "image": images[0],
+            "format": settings.PLANTUML_FORMAT,
+            "encoding": "base64",
+            "source": source,
+            "class_count": built["class_count"],
+            "truncated": built["truncated"],
+            "diagrams": [
+                dict(cluster, image=image, format=settings.PLANTUML_FORMAT, encoding="base64")
+                for cluster, image in zip(clusters, images[1:])
+            ],
+        }
+
+    except Exception as e:
+        print(
+            f"[WALKTHROUGH] uml_generator.py: ERROR building UML class diagram: {e}")
+        sys.stdout.flush()
+        return _error_diagram(str(e))
+
+
 def generate_uml_sequence_diagram(classes_data: List[str], functions_data: List[str]) -> Dict[str, Any]:
     """
     Generate a UML sequence diagram description using Gemini LLM.
@@ -141,7 +206,7 @@ def generate_uml_sequence_diagram(classes_data: List[str], functions_data: List[
     print("[WALKTHROUGH] uml_generator.py: Generating UML sequence diagram...")
     sys.stdout.flush()
 
-    if not gemini_model:
+    if not llm_backend.get_backend().available():
         print("[WALKTHROUGH] uml_generator.py: ERROR - Gemini model not configured.")
         sys.stdout.flush()
         raise RuntimeError(
@@ -174,28 +239,7 @@ def generate_uml_sequence_diagram(classes_data: List[str], functions_data: List[
     """
 
     try:
-        generation_config = genai.types.GenerationConfig(
-            max_output_tokens=1024,
-            temperature=0.2
-        )
-
-        safety_settings = [
-            {"category": c, "threshold": "BLOCK_MEDIUM_AND_ABOVE"}
-            for c in ["HARM_CATEGORY_HARASSMENT", "HARM_CATEGORY_HATE_SPEECH",
-                      "HARM_CATEGORY_SEXUALLY_EXPLICIT", "HARM_CATEGORY_DANGEROUS_CONTENT"]
-        ]
-
-        response = gemini_model.generate_content(
-            prompt,
-            generation_config=generation_config,
-            safety_settings=safety_settings
-        )
-
-        if not response.candidates:
-            raise ValueError(
-                f"Gemini response was empty or blocked. Feedback: {getattr(response, 'prompt_feedback', 'N/A')}")
-
-        uml_code = response.candidates[0].content.parts[0].text.strip()
+        uml_code = _generate_text(prompt, {"max_output_tokens": 1024, "temperature": 0.2}).strip()
 
         # Ensure the code starts and ends correctly
         if not uml_code.startswith('@startuml'):
@@ -209,7 +253,7 @@ def generate_uml_sequence_diagram(classes_data: List[str], functions_data: List[
         return {
             "uml_code": uml_code,
             "image": diagram_image,
-            "format": "png",
+            "format": settings.PLANTUML_FORMAT,
             "encoding": "base64"
         }
 
@@ -231,7 +275,7 @@ def generate_uml_activity_diagram(functions_data: List[str]) -> Dict[str, Any]:
     print("[WALKTHROUGH] uml_generator.py: Generating UML activity diagram...")
     sys.stdout.flush()
 
-    if not gemini_model:
+    if not llm_backend.get_backend().available():
         print("[WALKTHROUGH] uml_generator.py: ERROR - Gemini model not configured.")
         sys.stdout.flush()
         raise RuntimeError(
@@ -260,28 +304,7 @@ def generate_uml_activity_diagram(functions_data: List[str]) -> Dict[str, Any]:
     """
 
     try:
-        generation_config = genai.types.GenerationConfig(
-            max_output_tokens=1024,
-            temperature=0.2
-        )
-
-        safety_settings = [
-            {"category": c, "threshold": "BLOCK_MEDIUM_AND_ABOVE"}
-            for c in ["HARM_CATEGORY_HARASSMENT", "HARM_CATEGORY_HATE_SPEECH",
-                      "HARM_CATEGORY_SEXUALLY_EXPLICIT", "HARM_CATEGORY_DANGEROUS_CONTENT"]
-        ]
-
-        response = gemini_model.generate_content(
-            prompt,
-            generation_config=generation_config,
-            safety_settings=safety_settings
-        )
-
-        if not response.candidates:
-            raise ValueError(
-                f"Gemini response was empty or blocked. Feedback: {getattr(response, 'prompt_feedback', 'N/A')}")
-
-        uml_code = response.candidates[0].content.parts[0].text.strip()
+        uml_code = _generate_text(prompt, {"max_output_tokens": 1024, "temperature": 0.2}).strip()
 
         # Ensure the code starts and ends correctly
         if not uml_code.startswith('@startuml'):
@@ -296,7 +319,7 @@ def generate_uml_activity_diagram(functions_data: List[str]) -> Dict[str, Any]:
         return {
             "uml_code": uml_code,
             "image": diagram_image,
-            "format": "png",
+            "format": settings.PLANTUML_FORMAT,
             "encoding": "base64"
         }
 
@@ -310,48 +333,18 @@ def generate_uml_activity_diagram(functions_data: List[str]) -> Dict[str, Any]:
         }
 
 
-def generate_plantuml_image(uml_code: str) -> str:
+def generate_plantuml_image(uml_code: str, fmt: str = None) -> str:
     """
-    Generate a PNG image from PlantUML code using the plantuml package.
+    Render PlantUML code to an image (PLANTUML_FORMAT, png or svg, by default).
     Returns the image as a base64 encoded string.
     """
     try:
         print("[WALKTHROUGH] uml_generator.py: Generating PlantUML image...")
         sys.stdout.flush()
 
-        # Create a temporary file for the PlantUML source code
-        with tempfile.NamedTemporaryFile(suffix='.puml', mode='w', delete=False) as source_file:
-            source_file.write(uml_code)
-            source_filename = source_file.name
-
-        # Create a temporary filename for the output image
-        output_filename = tempfile.mktemp(suffix='.png')
-
-        # Generate the image using plantuml
-        # Note: We use the plantuml_instance that was created at module level
-        success = plantuml_instance.processes_file(
-            source_filename, outfile=output_filename)
-
-        if not success:
-            print("[WALKTHROUGH] uml_generator.py: Failed to generate PlantUML image")
-            sys.stdout.flush()
-            return ""
-
-        # Read the generated image and encode to base64
-        with open(output_filename, 'rb') as image_file:
-            encoded_string = base64.b64encode(
-                image_file.read()).decode('utf-8')
-
-        # Clean up temporary files
-        try:
-            os.unlink(source_filename)
-            os.unlink(output_filename)
-        except Exception as e:
-            print(
-                f"[WALKTHROUGH] uml_generator.py: Warning - Could not delete temporary files: {e}")
-            sys.stdout.flush()
-
-        return encoded_string
+        image = plantuml_renderer.get_renderer().render(
+            uml_code, fmt or settings.PLANTUML_FORMAT)
+        return base64.b64encode(image).decode('utf-8')
 
     except Exception as e:
         print(
@@ -362,6 +355,69 @@ def generate_plantuml_image(uml_code: str) -> str:
         return ""
 
 
+UML_DIAGRAM_NAMES = ("class_diagram", "sequence_diagram", "activity_diagram")
+
+
+def _error_diagram(error: str) -> Dict[str, Any]:
+    return {
+        "error": error,
+        "uml_code": "@startuml\nnote \"Error generating diagram\" as N1\n@enduml"
+    }
+
+
+def _diagram_jobs(repo_data: Dict[str, Any]) -> Dict[str, Callable[[], Dict[str, Any]]]:
+    imports = repo_data["analysis_details"]["code_analysis"]["unique_imports"]
+    classes = repo_data["analysis_details"]["code_analysis"]["unique_classes"]
+    functions = repo_data["analysis_details"]["code_analysis"]["unique_functions"]
+    file_type_distribution = repo_data.get("file_type_distribution", {})
+    # Results parsed before class models existed fall back to asking Gemini
+    class_models = repo_data["analysis_details"]["code_analysis"].get("class_models")
+    return {
+        "class_diagram": (lambda: generate_uml_class_diagram_from_models(class_models)) if class_models is not None
+        else (lambda: generate_uml_class_diagram(classes, functions, imports, file_type_distribution)),
+        "sequence_diagram": lambda: generate_uml_sequence_diagram(classes, functions),
+        "activity_diagram": lambda: generate_uml_activity_diagram(functions),
+    }
+
+
+def iter_uml_diagrams(repo_data: Dict[str, Any], timeout: float = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Generate the UML diagrams concurrently (each is a Gemini call plus a render) and
+    yield (name, diagram) pairs in completion order. All diagrams share one `timeout`
+    budget (UML_GENERATION_TIMEOUT_SECONDS by default); those still running when it
+    runs out are yielded as error diagrams and their results discarded.
+    """
+    jobs = _diagram_jobs(repo_data)
+    timeout = settings.UML_GENERATION_TIMEOUT_SECONDS if timeout is None else timeout
+    started_at = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="uml")
+    futures = {executor.submit(job): name for name, job in jobs.items()}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            pending.discard(future)
+            try:
+                diagram = future.result()
+            except Exception as e:
+                print(
+                    f"[WALKTHROUGH] uml_generator.py: ERROR generating {futures[future]}: {e}")
+                sys.stdout.flush()
+                diagram = _error_diagram(str(e))
+            print(
+                f"[WALKTHROUGH] uml_generator.py: {futures[future]} ready after {time.monotonic() - started_at:.1f}s.")
+            sys.stdout.flush()
+            yield futures[future], diagram
+    except FuturesTimeoutError:
+        for future in pending:
+            print(
+                f"[WALKTHROUGH] uml_generator.py: {futures[future]} not ready within {timeout}s, giving up on it.")
+            sys.stdout.flush()
+            yield futures[future], _error_diagram(f"Diagram generation timed out after {timeout}s")
+    finally:
+        # Do not wait for stragglers; their threads end once the remote calls return
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
 def generate_all_uml_diagrams(repo_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Generate all UML diagrams for a repository.
@@ -372,19 +428,9 @@ def generate_all_uml_diagrams(repo_data: Dict[str, Any]) -> Dict[str, Any]:
 
     result = {}
 
-    # Extract required data from repo_data
     try:
-        imports = repo_data["analysis_details"]["code_analysis"]["unique_imports"]
-        classes = repo_data["analysis_details"]["code_analysis"]["unique_classes"]
-        functions = repo_data["analysis_details"]["code_analysis"]["unique_functions"]
-        file_type_distribution = repo_data.get("file_type_distribution", {})
-
-        # Generate diagrams
-        result["class_diagram"] = generate_uml_class_diagram(
-            classes, functions, imports, file_type_distribution)
-        result["sequence_diagram"] = generate_uml_sequence_diagram(
-            classes, functions)
-        result["activity_diagram"] = generate_uml_activity_diagram(functions)
+        diagrams = dict(iter_uml_diagrams(repo_data))
+        result = {name: diagrams[name] for name in UML_DIAGRAM_NAMES}
 
         print("[WALKTHROUGH] uml_generator.py: Successfully generated all UML diagrams.")
         sys.stdout.flush()
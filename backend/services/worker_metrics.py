@@ -0,0 +1,155 @@
+# services/worker_metrics.py
+import os
+import sys
+import time
+import socket
+import threading
+from typing import Dict, Any, List, Optional
+
+from config.config import settings
+from services import pubsub, rate_limiter, http_cache
+
+print("[WALKTHROUGH] worker_metrics.py: Loading...")
+sys.stdout.flush()
+
+# Worker processes publish snapshots here; the API keeps the latest one per process
+METRICS_CHANNEL = "metrics.worker"
+
+
+def snapshot() -> Dict[str, Any]:
+    """ This process's GitHub metrics, as published on METRICS_CHANNEL. """
+    github_http_cache = http_cache.get_http_cache()
+    return {
+        "source": f"{socket.gethostname()}:{os.getpid()}",
+        "published_at": time.time(),
+        "github_rate_limit": rate_limiter.github_rate_limiter.get_metrics(),
+        "github_http_cache": github_http_cache.get_metrics() if github_http_cache else None,
+    }
+
+
+class MetricsPublisher:
+    """
+    Publishes snapshot() every `interval` seconds from a background thread, so processes
+    that send the GitHub requests (Celery workers) report their budget and conditional
+    request cache counts to GET /metrics on the API.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """ Starts publishing; does nothing if this process already does. """
+        with self._lock:
+            # A prefork child inherits the object but not the thread
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="metrics-publisher", daemon=True)
+            self._thread.start()
+
+    def publish_now(self) -> None:
+        pubsub.publish(METRICS_CHANNEL, snapshot())
+
+    def _run(self) -> None:
+        while True:
+            self.publish_now()
+            time.sleep(self.interval)
+
+
+class MetricsCollector:
+    """
+    Keeps the latest snapshot of every publishing process and merges them for
+    GET /metrics. Processes not heard from for three publish intervals are dropped.
+    """
+
+    def __init__(self, interval: float):
+        self.expire_after = 3 * interval
+        self._snapshots: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """ Subscribes to METRICS_CHANNEL; does nothing if pub/sub is disabled or already running. """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            broker = pubsub.get_broker()
+            if broker is None:
+                return
+            subscription = broker.subscribe(METRICS_CHANNEL)
+            self._thread = threading.Thread(
+                target=self._run, args=(subscription,), name="metrics-collector", daemon=True)
+            self._thread.start()
+
+    def _run(self, subscription: pubsub.Subscription) -> None:
+        while True:
+            message = subscription.get(timeout=1.0)
+            if message and message.get("source"):
+                with self._lock:
+                    self._snapshots[message["source"]] = message
+
+    def _live_snapshots(self) -> List[Dict[str, Any]]:
+        expired_before = time.time() - self.expire_after
+        with self._lock:
+            for source in [source for source, message in self._snapshots.items()
+                           if message.get("published_at", 0) < expired_before]:
+                del self._snapshots[source]
+            return list(self._snapshots.values())
+
+    def get_metrics(self) -> Dict[str, Any]:
+        snapshots = self._live_snapshots()
+        return {
+            "reporting_processes": len(snapshots),
+            "github_rate_limit": _merge_rate_limits(snapshots),
+            "github_http_cache": _merge_http_caches(snapshots),
+        }
+
+
+def _merge_rate_limits(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Per token: the budget from the most recently seen rate-limit headers, and the queue,
+    rate and throttling counts summed over processes.
+    """
+    now = time.time()
+    merged: Dict[str, Dict[str, Any]] = {}
+    for message in snapshots:
+        elapsed = now - message.get("published_at", now)
+        for token_key, state in (message.get("github_rate_limit") or {}).items():
+            token = merged.setdefault(token_key, {
+                "remaining": None, "limit": None, "reset_at": None, "observed_at": None,
+                "blocked_for_seconds": 0.0, "current_rate_per_second": 0.0,
+                "waiting_requests": 0, "waiting_tasks": 0, "throttled_responses": 0})
+            if state.get("observed_at") and state["observed_at"] > (token["observed_at"] or 0):
+                for field in ("remaining", "limit", "reset_at", "observed_at"):
+                    token[field] = state.get(field)
+            token["blocked_for_seconds"] = max(token["blocked_for_seconds"],
+                                               round(max(state.get("blocked_for_seconds", 0) - elapsed, 0), 1))
+            token["current_rate_per_second"] = round(
+                token["current_rate_per_second"] + state.get("current_rate_per_second", 0), 3)
+            for field in ("waiting_requests", "waiting_tasks", "throttled_responses"):
+                token[field] += state.get(field, 0)
+    for token in merged.values():
+        token["reset_in_seconds"] = round(max(token["reset_at"] - now, 0), 1) if token["reset_at"] else None
+    return merged
+
+
+def _merge_http_caches(snapshots: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """ Conditional request cache counts summed over processes (None if none has a cache). """
+    caches = [message["github_http_cache"] for message in snapshots if message.get("github_http_cache")]
+    if not caches:
+        return None
+    merged = {field: sum(cache.get(field, 0) for cache in caches)
+              for field in ("not_modified_hits", "full_responses", "error_responses")}
+    lookups = merged["not_modified_hits"] + merged["full_responses"]
+    merged["hit_rate"] = round(merged["not_modified_hits"] / lookups, 3) if lookups else None
+    return merged
+
+
+# Started by worker tasks and by the API on startup
+metrics_publisher = MetricsPublisher(settings.WORKER_METRICS_PUBLISH_SECONDS)
+metrics_collector = MetricsCollector(settings.WORKER_METRICS_PUBLISH_SECONDS)
+
+
+print("[WALKTHROUGH] worker_metrics.py: Finished loading.")
+sys.stdout.flush()
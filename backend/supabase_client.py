@@ -53,6 +53,64 @@ def get_analysis_from_supabase(task_id: str):
     return response
 
 
+def get_analysis_columns(task_id: str, columns: str):
+    """
+    Selects only `columns` (a PostgREST select list, e.g. "status,progress,title:result->title")
+    for a task. Returns the row or None.
+    """
+    rows = supabase.table(settings.SUPABASE_ANALYSIS_TABLE).select(
+        columns).eq("task_id", task_id).limit(1).execute().data
+    return rows[0] if rows else None
+
+
+def find_analysis_by_commit(commit_key: str, statuses: list, exclude_task_id: str = None,
+                            columns: str = "task_id,status,progress,state,result", heartbeat_after: str = None):
+    """
+    Finds one analysis row for a commit key ("owner/repo@sha") in any of the given statuses.
+    The key is stored as result.commit_key. With `heartbeat_after` (a
+    progress.heartbeat_timestamp), only rows whose result.heartbeat_at is later match.
+    Returns the row (only `columns`) or None.
+    """
+    query = supabase.table(settings.SUPABASE_ANALYSIS_TABLE).select(
+        columns).eq("result->>commit_key", commit_key).in_("status", statuses)
+    if exclude_task_id:
+        query = query.neq("task_id", exclude_task_id)
+    if heartbeat_after:
+        query = query.gt("result->>heartbeat_at", heartbeat_after)
+    rows = query.limit(1).execute().data
+    return rows[0] if rows else None
+
+
+def _escape_like(value: str) -> str:
+    """ Escapes LIKE wildcards (and the escape character) so `value` matches literally. """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def find_latest_analysis_for_repo(repo_key: str, exclude_task_id: str = None):
+    """
+    Finds the most recent successful analysis of a repository ("owner/repo"), matched on
+    the result.commit_key prefix and ordered by result.analyzed_at. Returns the row or None.
+    """
+    query = supabase.table(settings.SUPABASE_ANALYSIS_TABLE).select(
+        "task_id,result").eq("status", "SUCCESS").like("result->>commit_key", f"{_escape_like(repo_key)}@%")
+    if exclude_task_id:
+        query = query.neq("task_id", exclude_task_id)
+    rows = query.order("result->analyzed_at", desc=True).limit(1).execute().data
+    return rows[0] if rows else None
+
+
+def save_artifacts(rows: list):
+    """ Upserts artifact rows ({task_id, name, encoding, data, size}) into the artifacts table. """
+    return supabase.table(settings.SUPABASE_ARTIFACTS_TABLE).upsert(
+        rows, on_conflict="task_id,name").execute()
+
+
+def get_artifacts(task_id: str, names: list):
+    """ Returns the artifact rows (name, encoding, data) of a task, limited to `names`. """
+    return supabase.table(settings.SUPABASE_ARTIFACTS_TABLE).select(
+        "name,encoding,data").eq("task_id", task_id).in_("name", names).execute().data
+
+
 def update_analysis_status(task_id: str, status: str, error: str = None):
     response = supabase.table(settings.SUPABASE_ANALYSIS_TABLE).update(
         {"status": status, "error": error}).eq("task_id", task_id).execute()
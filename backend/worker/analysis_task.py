@@ -1,14 +1,22 @@
 # worker/analysis_task.py
 # Use shared_task as celery instance might not be available here directly
 from celery import shared_task
+from celery.exceptions import Retry
 # Import helpers from services
-from services import github_api, llm_handler, code_parser
+from services import github_api, llm_handler, code_parser, blob_cache, rate_limiter, result_artifacts, worker_metrics
+from services.blob_cache import BlobCache
 import supabase_client
 import sys
-from typing import Dict, Any, List, Set
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Deque, List, Set, Optional
+from collections import Counter, deque
 import logging
 
 from worker.celery_app import celery
+from worker.progress import ProgressReporter, heartbeat_timestamp
+from worker.artifact_task import schedule_analysis_artifacts
+from config.config import settings
 from celery import shared_task
 import requests
 
@@ -29,6 +37,274 @@ IMPORTANT_FILES = [
     "Dockerfile"
 ]  # For framework detection
 
+
+# --- Helpers ---
+def _code_language(path: str) -> Optional[str]:
+    """ Returns the parser language for a path, or None if it is not a code file we analyze. """
+    if path.endswith('.py'):
+        return 'python'
+    if path.endswith('.java'):
+        return 'java'
+    return None
+
+
+class _CodeAnalysisCollector:
+    """
+    Keeps one compact parse record per analyzed file plus multiset aggregates over them,
+    so files can be added, replaced or removed without re-aggregating the whole repo.
+    Records can be seeded from a previous analysis of the same repository.
+    """
+
+    def __init__(self, blob_cache: Optional[BlobCache] = None):
+        self.blob_cache = blob_cache
+        self.cache_hits = 0
+        self.reused_files = 0
+        self.file_results: Dict[str, Dict[str, Any]] = {}
+        self.functions: Counter = Counter()
+        self.classes: Counter = Counter()
+        self.imports: Counter = Counter()
+        self.java_frameworks: Counter = Counter()
+        self.lines = Counter()
+        self.language_files = Counter()
+        # Content of important files, used for framework detection
+        self.framework_files: Dict[str, str] = {}
+        # Code files waiting to be parsed as one batch: {path: (language, content, sha)}
+        self._pending: Dict[str, tuple] = {}
+        self._pending_new = 0
+        # Batches being parsed on the pool, oldest first: (files, ParseBatch, new file count)
+        self._parsing: Deque[tuple] = deque()
+
+    @property
+    def parsed_files_count(self) -> int:
+        return len(self.file_results)
+
+    @property
+    def python_files_count(self) -> int:
+        return self.language_files['python']
+
+    @property
+    def java_files_count(self) -> int:
+        return self.language_files['java']
+
+    @property
+    def is_full(self) -> bool:
+        parsing_new = sum(new_count for _, _, new_count in self._parsing)
+        return self.parsed_files_count + self._pending_new + parsing_new >= MAX_FILES_TO_PARSE
+
+    def has_file(self, file_path: str, sha: Optional[str] = None) -> bool:
+        record = self.file_results.get(file_path)
+        return record is not None and (sha is None or record.get("sha") == sha)
+
+    def seed(self, file_results: Dict[str, Dict[str, Any]], shas_by_path: Optional[Dict[str, str]] = None) -> None:
+        """
+        Starts from a previous analysis' per-file records. With shas_by_path, records for
+        files that were removed or whose blob changed are dropped, so only the diff needs
+        fetching and parsing.
+        """
+        for file_path, record in file_results.items():
+            if shas_by_path is not None and (not record.get("sha") or shas_by_path.get(file_path) != record["sha"]):
+                continue
+            self._add(file_path, record)
+            self.reused_files += 1
+
+    def remove_file(self, file_path: str) -> None:
+        record = self.file_results.pop(file_path, None)
+        if record is None:
+            return
+        self.functions.subtract(record["functions"])
+        self.classes.subtract(record["classes"])
+        self.imports.subtract(record["imports"])
+        self.java_frameworks.subtract(record.get("frameworks", []))
+        self.lines[record["language"]] -= record["line_count"]
+        self.language_files[record["language"]] -= 1
+
+    def _add(self, file_path: str, record: Dict[str, Any]) -> None:
+        self.remove_file(file_path)
+        self.file_results[file_path] = record
+        self.functions.update(record["functions"])
+        self.classes.update(record["classes"])
+        self.imports.update(record["imports"])
+        self.java_frameworks.update(record.get("frameworks", []))
+        self.lines[record["language"]] += record["line_count"]
+        self.language_files[record["language"]] += 1
+
+    def add_cached_file(self, file_path: str, language: str, sha: Optional[str]) -> bool:
+        """
+        Records a file straight from the blob cache, skipping both download and parse.
+        Returns False on a cache miss, in which case the file must be fetched.
+        """
+        if not self.blob_cache or not sha:
+            return False
+        record = self.blob_cache.get_parse_result(
+            sha, language, code_parser.PARSER_VERSION)
+        if record is None:
+            return False
+        record["imports"] = sorted(record["imports"])
+        self._add(file_path, record)
+        self.cache_hits += 1
+        return True
+
+    def add_code_file(self, file_path: str, language: str, content: str, sha: Optional[str] = None) -> None:
+        """
+        Queues one code file for parsing. Every PARSE_BATCH_SIZE files are handed to the
+        parse pool as one batch (see code_parser.submit_files_batch) without waiting, so
+        fetching goes on while it parses; results of finished batches are merged on later
+        calls. At most PARSE_MAX_PENDING_BATCHES batches are in flight; beyond that the
+        oldest is waited for. Call flush() once all files are added.
+        """
+        if sha and self.add_cached_file(file_path, language, sha):
+            return
+        if file_path not in self._pending and file_path not in self.file_results:
+            self._pending_new += 1
+        self._pending[file_path] = (language, content, sha)
+        if len(self._pending) >= settings.PARSE_BATCH_SIZE:
+            self._submit_pending()
+        self._merge_parsed(wait=False)
+
+    def flush(self) -> None:
+        """ Parses all queued files and waits for every batch. Files that fail to parse are left out of the results. """
+        self._submit_pending()
+        self._merge_parsed(wait=True)
+
+    def _submit_pending(self) -> None:
+        if not self._pending:
+            return
+        while len(self._parsing) >= max(1, settings.PARSE_MAX_PENDING_BATCHES):
+            self._merge_oldest()
+        pending, self._pending = self._pending, {}
+        batch = code_parser.submit_files_batch(
+            [(file_path, language, content) for file_path, (language, content, _) in pending.items()])
+        self._parsing.append((pending, batch, self._pending_new))
+        self._pending_new = 0
+
+    def _merge_parsed(self, wait: bool) -> None:
+        """ Merges finished batches in submission order; with `wait`, all of them. """
+        while self._parsing and (wait or self._parsing[0][1].done()):
+            self._merge_oldest()
+
+    def _merge_oldest(self) -> None:
+        pending, batch, _ = self._parsing[0]
+        try:
+            records = batch.result()
+        finally:
+            self._parsing.popleft()
+        for file_path, (language, _, sha) in pending.items():
+            record = records.get(file_path)
+            if record is None:
+                self.remove_file(file_path)
+                continue
+            record["sha"] = sha
+            if self.blob_cache and sha:
+                self.blob_cache.set_parse_result(
+                    sha, language, code_parser.PARSER_VERSION, record)
+            self._add(file_path, record)
+
+    def add_important_file(self, file_path: str, content: str, sha: Optional[str] = None) -> None:
+        self.framework_files[file_path] = content
+        if self.blob_cache and sha:
+            self.blob_cache.set_content(sha, content)
+
+    def add_cached_important_file(self, file_path: str, sha: Optional[str]) -> bool:
+        """ Records an important file from the blob cache. Returns False on a cache miss. """
+        if not self.blob_cache or not sha:
+            return False
+        content = self.blob_cache.get_content(sha)
+        if content is None:
+            return False
+        self.framework_files[file_path] = content
+        self.cache_hits += 1
+        return True
+
+    def detected_frameworks(self) -> List[str]:
+        frameworks = set(code_parser.detect_frameworks_from_files(self.framework_files))
+        frameworks.update(name for name, count in self.java_frameworks.items() if count > 0)
+        return sorted(frameworks)
+
+    def symbol_counts(self) -> Dict[str, Dict[str, int]]:
+        """ Number of files defining each function/class and importing each module. """
+        return {
+            "functions": {name: count for name, count in self.functions.items() if count > 0},
+            "classes": {name: count for name, count in self.classes.items() if count > 0},
+            "imports": {name: count for name, count in self.imports.items() if count > 0},
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "files_analyzed_count": self.parsed_files_count,
+            "lines_analyzed_count": self.lines['python'] + self.lines['java'],
+            "unique_classes": sorted(name for name, count in self.classes.items() if count > 0),
+            "unique_functions": sorted(name for name, count in self.functions.items() if count > 0),
+            "unique_imports": sorted(name for name, count in self.imports.items() if count > 0),
+            # Members, bases and relationship hints of every class, for UML class diagrams
+            "class_models": [
+                dict(model, package=self.file_results[file_path].get("package"), file=file_path)
+                for file_path in sorted(self.file_results)
+                for model in self.file_results[file_path].get("class_models", [])
+            ],
+            "analyzed_files_list": list(self.file_results)
+        }
+
+
+def _find_previous_file_results(task_id: str, owner: str, repo_name: str, commit_key: Optional[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Returns the per-file parse records of the most recent successful analysis of this
+    repository at another commit, if they were produced by the current parser version.
+    """
+    repo_key = f"{owner}/{repo_name}".lower()
+    try:
+        previous = supabase_client.find_latest_analysis_for_repo(
+            repo_key, exclude_task_id=task_id)
+    except Exception as e:
+        print(
+            f"[WALKTHROUGH][TASK {task_id}] WARNING: Could not look up previous analyses: {e}")
+        sys.stdout.flush()
+        return None
+    result = (previous or {}).get("result") or {}
+    if not (result.get("commit_key") or "").startswith(f"{repo_key}@"):
+        return None  # Never seed from another repository
+    if result.get("commit_key") == commit_key or result.get("parser_version") != code_parser.PARSER_VERSION:
+        return None
+    try:
+        result = result_artifacts.load_result_artifacts(result, ["file_results"])
+    except Exception as e:
+        print(
+            f"[WALKTHROUGH][TASK {task_id}] WARNING: Could not load previous file results: {e}")
+        sys.stdout.flush()
+        return None
+    return result.get("file_results") or None
+
+
+def _find_reusable_result(task_id: str, commit_key: str) -> Optional[Dict[str, Any]]:
+    """ Returns a copy of the result of a finished analysis of the same commit, if any. """
+    try:
+        existing = supabase_client.find_analysis_by_commit(
+            commit_key, ["SUCCESS"], exclude_task_id=task_id)
+    except Exception as e:
+        # Deduplication is an optimisation; never fail the task because of it
+        print(
+            f"[WALKTHROUGH][TASK {task_id}] WARNING: Could not look up existing analyses: {e}")
+        sys.stdout.flush()
+        return None
+    return dict(existing["result"]) if existing and existing.get("result") else None
+
+
+def _find_running_analysis(task_id: str, commit_key: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the row (task_id, progress, state) of another task still analysing the same
+    commit, ignoring tasks whose heartbeat is older than ANALYSIS_DEDUP_STALE_SECONDS
+    (their worker presumably died).
+    """
+    try:
+        return supabase_client.find_analysis_by_commit(
+            commit_key, ["PENDING"], exclude_task_id=task_id, columns="task_id,progress,state",
+            heartbeat_after=heartbeat_timestamp(time.time() - settings.ANALYSIS_DEDUP_STALE_SECONDS))
+    except Exception as e:
+        print(
+            f"[WALKTHROUGH][TASK {task_id}] WARNING: Could not look up running analyses: {e}")
+        sys.stdout.flush()
+        return None
+
+
 # --- Celery Task Definition ---
 print("[WALKTHROUGH] worker/analysis_task.py: Defining Celery task 'run_codelore_analysis'...")
 sys.stdout.flush()
@@ -37,7 +313,8 @@ sys.stdout.flush()
 
 
 @shared_task(bind=True)
-def run_codelore_analysis(self, repo_url: str, user_token: str = None) -> Dict[str, Any]:
+def run_codelore_analysis(self, repo_url: str, user_token: str = None,
+                          dedup_waiting_since: Optional[float] = None) -> Dict[str, Any]:
     """
     Celery task to analyze a Git repository *via GitHub API* and generate a narrative.
     Orchestrates API calls, parsing, LLM interaction, and saves results to Supabase.
@@ -45,6 +322,9 @@ def run_codelore_analysis(self, repo_url: str, user_token: str = None) -> Dict[s
     Args:
         repo_url: URL of the GitHub repository to analyze
         user_token: Optional GitHub user token for authenticated API calls
+        dedup_waiting_since: Set on retries while another task analyses the same commit
+            (epoch seconds of the first check); the task requeues itself instead of
+            holding a worker slot while it waits
     """
     task_id = self.request.id  # Get the REAL task ID from Celery
     if not task_id:
@@ -60,29 +340,34 @@ def run_codelore_analysis(self, repo_url: str, user_token: str = None) -> Dict[s
         f"[WALKTHROUGH][TASK {task_id}] Using {'user-provided' if user_token else 'default'} GitHub token")
     sys.stdout.flush()
 
+    # This process's GitHub budget is reported to GET /metrics on the API
+    worker_metrics.metrics_publisher.start()
+
     # --- Initial Status Update ---
-    supabase_client.update_table_data(
-        task_id,
-        {
-            "repo_url": repo_url,
-            "status": "PENDING",  # Or "STARTED" if task_track_started=True
-            "state": "Initializing analysis task",
-            "result": None,       # Clear previous result if any
-            "progress": 10,
-            "error": None,        # No error at this point
-            "user_id": None,  # Optional user ID if needed
-        }
-    )
-    print(f"[WALKTHROUGH][TASK {task_id}] Initial status saved to Supabase.")
-    sys.stdout.flush()
+    # Progress is buffered and written in the background; see worker/progress.py
+    progress = ProgressReporter(task_id)
+    if dedup_waiting_since is None:  # A retry keeps mirroring the other task's progress
+        progress.flush(
+            {
+                "repo_url": repo_url,
+                "status": "PENDING",  # Or "STARTED" if task_track_started=True
+                "state": "Initializing analysis task",
+                "result": None,       # Clear previous result if any
+                "progress": 10,
+                "error": None,        # No error at this point
+                "user_id": None,  # Optional user ID if needed
+            }
+        )
+        print(f"[WALKTHROUGH][TASK {task_id}] Initial status saved to Supabase.")
+        sys.stdout.flush()
 
     # --- Pre-checks ---
-    if not llm_handler.gemini_model:
+    if not llm_handler.llm_available():
         error_msg = "Gemini API key not configured or model init failed."
         print(
             f"[WALKTHROUGH][TASK {task_id}] ERROR: {error_msg} Failing task.")
         sys.stdout.flush()
-        supabase_client.update_analysis_status(task_id, 'FAILURE', error_msg)
+        progress.fail(error_msg)
         raise RuntimeError(error_msg)  # Re-raise to fail Celery task
 
     owner_repo = github_api.get_owner_repo(repo_url)
@@ -90,205 +375,266 @@ def run_codelore_analysis(self, repo_url: str, user_token: str = None) -> Dict[s
         error_msg = f"Invalid GitHub URL format: {repo_url}"
         print(f"[WALKTHROUGH][TASK {task_id}] ERROR: {error_msg}")
         sys.stdout.flush()
-        supabase_client.update_analysis_status(task_id, 'FAILURE', error_msg)
+        progress.fail(error_msg)
         raise ValueError(error_msg)  # Re-raise
     owner, repo_name = owner_repo
+    # One client per task: pooled connections plus in-task reuse of repeated metadata calls
+    github = github_api.GitHubClient(user_token, fair_key=task_id)
 
     try:
-        supabase_client.update_table_data(
-            task_id,
-            {
-                "repo_url": repo_url,
-                "status": "PENDING",
-                "state": "Pre-checks complete, starting default branch fetch",
-                "result": None,
-                "progress": 15,
-                "error": None,
-            }
-        )
+        if dedup_waiting_since is None:
+            progress.update(
+                {
+                    "status": "PENDING",
+                    "state": "Pre-checks complete, starting default branch fetch",
+                    "progress": 15,
+                }
+            )
         # --- 1. Get Default Branch ---
         print(
             f"[WALKTHROUGH][TASK {task_id}] Step 1: Getting default branch...")
         sys.stdout.flush()
-        default_branch = github_api.get_default_branch(
-            owner, repo_name, user_token)
-
-        supabase_client.update_table_data(
-            task_id,
+        default_branch = github.get_default_branch(
+            owner, repo_name)
+
+        # --- 1b. Reuse an identical analysis of the same commit ---
+        # The latest-commit response is memoized by the client, so step 4 reuses it.
+        head_sha = github.get_latest_commit_info(
+            owner, repo_name, default_branch).get("sha")
+        commit_key = f"{owner}/{repo_name}@{head_sha}".lower() if head_sha else None
+        if commit_key and settings.ANALYSIS_DEDUP_ENABLED:
+            reused_result = _find_reusable_result(task_id, commit_key)
+            if reused_result is not None:
+                reused_result["task_id"] = task_id
+                progress.finish(
+                    {
+                        "status": "SUCCESS",
+                        "state": f"Reused existing analysis of commit {head_sha[:7]}",
+                        "result": reused_result,
+                        "progress": 100,
+                        "error": None,
+                    }
+                )
+                print(
+                    f"[WALKTHROUGH][TASK {task_id}] Reused stored result for {commit_key}.")
+                sys.stdout.flush()
+                # Same inputs, so this normally finds the outputs stored for the original run
+                schedule_analysis_artifacts(task_id)
+                return {"status": "SUCCESS", "task_id": task_id, "message": "Analysis reused from an identical commit. Result stored."}
+            running = _find_running_analysis(task_id, commit_key)
+            if running:
+                waiting_since = dedup_waiting_since or time.time()
+                if time.time() - waiting_since < settings.ANALYSIS_DEDUP_WAIT_SECONDS:
+                    # Check again later from the queue rather than sleeping in a worker slot
+                    progress.finish(
+                        {
+                            "status": "PENDING",
+                            "state": f"Waiting for identical analysis: {running.get('state') or 'in progress'}",
+                            "progress": running.get("progress") or 0,
+                        }
+                    )
+                    print(
+                        f"[WALKTHROUGH][TASK {task_id}] Commit {commit_key} is being analysed by task {running['task_id']}, checking again in {settings.ANALYSIS_DEDUP_POLL_SECONDS:.0f}s.")
+                    sys.stdout.flush()
+                    raise self.retry(countdown=settings.ANALYSIS_DEDUP_POLL_SECONDS, max_retries=None,
+                                     kwargs={"dedup_waiting_since": waiting_since})
+                print(
+                    f"[WALKTHROUGH][TASK {task_id}] Timed out waiting for task {running['task_id']}, running analysis.")
+                sys.stdout.flush()
+            # Advertise this task as the one analysing the commit so identical submissions wait for it
+            progress.advertise({"commit_key": commit_key}, settings.ANALYSIS_DEDUP_HEARTBEAT_SECONDS)
+
+        progress.update(
             {
-                "repo_url": repo_url,
                 "status": "PENDING",
                 "state": "Fetched default branch, fetching repository file tree",
-                "result": None,
                 "progress": 25,
-                "error": None,
             }
         )
 
-        # --- 2. Get File Tree ---
-        print(
-            f"[WALKTHROUGH][TASK {task_id}] Step 2: Getting repository file tree...")
-        sys.stdout.flush()
-        repo_tree = github_api.get_repo_tree(
-            owner, repo_name, default_branch, user_token)
-        # No need to fail if tree is empty, analysis will just be sparse
-
-        supabase_client.update_table_data(
-            task_id,
-            {
-                "repo_url": repo_url,
-                "status": "PENDING",
-                "state": "Repository file tree fetched, preparing for code analysis",
-                "result": None,
-                "progress": 35,
-                "error": None,
-            }
-        )
+        collector = _CodeAnalysisCollector(blob_cache.get_blob_cache())
+        # Per-file results of the last analysis of this repo; only the diff is re-processed
+        previous_file_results = _find_previous_file_results(
+            task_id, owner, repo_name, commit_key)
+        fetched_count = 0
+        fetch_started_at = time.monotonic()
 
-        # --- 3. Analyze Code In Memory ---
-        print(
-            f"[WALKTHROUGH][TASK {task_id}] Step 3: Analyzing Python files (max {MAX_FILES_TO_PARSE})...")
-        sys.stdout.flush()
-        all_functions: List[str] = []
-        all_classes: List[str] = []
-        all_imports: Set[str] = set()
-        analyzed_files_paths: List[str] = []
-        total_py_lines: int = 0
-        total_java_lines: int = 0
-        parsed_files_count: int = 0
-        # Store content of important files
-        file_contents_for_framework_detection: Dict[str, str] = {}
-
-        supabase_client.update_table_data(
-            task_id,
-            {
-                "repo_url": repo_url,
-                "status": "PENDING",
-                "state": "Analyzing Python and Java files in repository",
-                "result": None,
-                "progress": 55,
-                "error": None,
-            }
-        )
-
-        python_files_in_tree = [item for item in repo_tree if item.get(
-            'type') == 'blob' and item.get('path', '').endswith('.py')]
-        java_files_in_tree = [item for item in repo_tree if item.get(
-            'type') == 'blob' and item.get('path', '').endswith('.java')]
-        other_important_files = [item for item in repo_tree if item.get(
-            'type') == 'blob' and item.get('path', '') in IMPORTANT_FILES]
+        if settings.INGESTION_MODE == "archive":
+            # --- 2+3. Stream the repository archive once: tree, code and important files ---
+            print(
+                f"[WALKTHROUGH][TASK {task_id}] Step 2: Streaming repository archive (max {MAX_FILES_TO_PARSE} code files)...")
+            sys.stdout.flush()
+            repo_tree: List[Dict[str, Any]] = []
+            # The archive carries no blob SHAs up front: start from every previous record,
+            # re-parse files whose content changed and drop files missing from the archive.
+            if previous_file_results:
+                collector.seed(previous_file_results)
+            seen_code_paths: Set[str] = set()
+
+            def wanted(path: str) -> bool:
+                if path in IMPORTANT_FILES or collector.has_file(path):
+                    return True
+                return _code_language(path) is not None and not collector.is_full
+
+            for tree_item, content in github.iter_repo_archive(
+                    owner, repo_name, default_branch, wanted=wanted):
+                repo_tree.append(tree_item)
+                if content is None:
+                    continue
+                fetched_count += 1
+                file_path = tree_item["path"]
+                language = _code_language(file_path)
+                if language and collector.has_file(file_path, tree_item.get("sha")):
+                    seen_code_paths.add(file_path)
+                elif language and (collector.has_file(file_path) or not collector.is_full):
+                    seen_code_paths.add(file_path)
+                    collector.add_code_file(
+                        file_path, language, content, sha=tree_item.get("sha"))
+                if file_path in IMPORTANT_FILES:
+                    collector.add_important_file(file_path, content)
+
+                # Cheap to call per file: the reporter coalesces writes
+                rate = fetched_count / max(time.monotonic() - fetch_started_at, 1e-6)
+                progress.update(
+                    {
+                        "status": "PENDING",
+                        "state": f"Streaming repository archive: {fetched_count} files read ({rate:.1f} files/s)",
+                        "progress": 55,
+                    }
+                )
+            collector.flush()
+            for file_path in set(collector.file_results) - seen_code_paths:
+                collector.remove_file(file_path)
+        else:
+            # --- 2. Get File Tree ---
+            print(
+                f"[WALKTHROUGH][TASK {task_id}] Step 2: Getting repository file tree...")
+            sys.stdout.flush()
+            repo_tree = github.get_repo_tree(
+                owner, repo_name, default_branch)
+            # No need to fail if tree is empty, analysis will just be sparse
+
+            progress.update(
+                {
+                    "status": "PENDING",
+                    "state": "Repository file tree fetched, preparing for code analysis",
+                    "progress": 35,
+                }
+            )
+
+            # --- 3. Analyze Code In Memory ---
+            print(
+                f"[WALKTHROUGH][TASK {task_id}] Step 3: Analyzing Python and Java files (max {MAX_FILES_TO_PARSE})...")
+            sys.stdout.flush()
+
+            python_files_in_tree = [item for item in repo_tree if item.get(
+                'type') == 'blob' and item.get('path', '').endswith('.py')]
+            java_files_in_tree = [item for item in repo_tree if item.get(
+                'type') == 'blob' and item.get('path', '').endswith('.java')]
+            other_important_files = [item for item in repo_tree if item.get(
+                'type') == 'blob' and item.get('path', '') in IMPORTANT_FILES]
+
+            print(f"[WALKTHROUGH][TASK {task_id}] Found {len(python_files_in_tree)} Python files, {len(java_files_in_tree)} Java files, and {len(other_important_files)} other important files.")
+            sys.stdout.flush()
+
+            progress.update(
+                {
+                    "status": "PENDING",
+                    "state": "Code file list prepared, starting file content analysis",
+                    "progress": 55,
+                }
+            )
+
+            # Fetch Python then Java files concurrently and parse them in batches as they arrive.
+            # Paths are handed to the fetcher lazily, so stopping at the cap leaves
+            # the remaining files unfetched. Blobs already in the cache are recorded
+            # without any request.
+            code_files = [(item.get('path'), 'python') for item in python_files_in_tree if item.get('path')] + \
+                [(item.get('path'), 'java') for item in java_files_in_tree if item.get('path')]
+            languages_by_path = dict(code_files)
+            shas_by_path = {item.get('path'): item.get('sha') for item in repo_tree}
+            # Tree diff against the previous analysis by blob SHA: unchanged files keep
+            # their records, removed and modified ones are dropped and fetched again.
+            if previous_file_results:
+                collector.seed(previous_file_results, shas_by_path)
+                print(f"[WALKTHROUGH][TASK {task_id}] Reusing {collector.reused_files} unchanged files from the previous analysis.")
+                sys.stdout.flush()
+
+            def paths_to_fetch():
+                for file_path, language in code_files:
+                    if collector.is_full:
+                        return
+                    if collector.has_file(file_path):
+                        continue
+                    if not collector.add_cached_file(file_path, language, shas_by_path.get(file_path)):
+                        yield file_path
+
+            file_stream = github.iter_file_contents(
+                owner, repo_name, paths_to_fetch(), default_branch,
+                max_workers=settings.FETCH_CONCURRENCY)
+            try:
+                for file_path, content in file_stream:
+                    if collector.is_full:
+                        break
+                    fetched_count += 1
+                    if content:
+                        collector.add_code_file(
+                            file_path, languages_by_path[file_path], content, sha=shas_by_path.get(file_path))
+
+                    # Cheap to call per file: the reporter coalesces writes
+                    rate = fetched_count / max(time.monotonic() - fetch_started_at, 1e-6)
+                    progress.update(
+                        {
+                            "status": "PENDING",
+                            "state": f"Fetching file contents: {fetched_count}/{len(code_files)} files ({rate:.1f} files/s)",
+                            "progress": 65,
+                        }
+                    )
+            finally:
+                file_stream.close()
+            collector.flush()
+
+            # Fetch content for other important files (if not already fetched)
+            important_paths = [item.get('path') for item in other_important_files if item.get(
+                'path') and item.get('path') not in collector.framework_files]
+            important_paths = [path for path in important_paths
+                               if not collector.add_cached_important_file(path, shas_by_path.get(path))]
+            for file_path, content in github.iter_file_contents(
+                    owner, repo_name, important_paths, default_branch,
+                    max_workers=settings.FETCH_CONCURRENCY):
+                if content:
+                    collector.add_important_file(
+                        file_path, content, sha=shas_by_path.get(file_path))
 
-        print(f"[WALKTHROUGH][TASK {task_id}] Found {len(python_files_in_tree)} Python files, {len(java_files_in_tree)} Java files, and {len(other_important_files)} other important files.")
+        fetch_elapsed = max(time.monotonic() - fetch_started_at, 1e-6)
+        fetch_rate = fetched_count / fetch_elapsed
+        print(f"[WALKTHROUGH][TASK {task_id}] Fetched {fetched_count} files in {fetch_elapsed:.1f}s ({fetch_rate:.1f} files/s, mode {settings.INGESTION_MODE}), {collector.cache_hits} blob cache hits, {collector.reused_files} files reused from the previous analysis.")
         sys.stdout.flush()
 
-        supabase_client.update_table_data(
-            task_id,
-            {
-                "repo_url": repo_url,
-                "status": "PENDING",
-                "state": "Code file list prepared, starting file content analysis",
-                "result": None,
-                "progress": 65,
-                "error": None,
-            }
-        )
-
-        # Analyze Python files
-        for file_item in python_files_in_tree:
-            if parsed_files_count >= MAX_FILES_TO_PARSE:
-                break
-            file_path = file_item.get('path')
-            if not file_path:
-                continue
-            content = github_api.get_file_content(
-                owner, repo_name, file_path, default_branch, user_token)
-            if content:
-                analysis_result = code_parser.analyze_python_content(
-                    content, filename=file_path)
-                if analysis_result:
-                    analyzed_files_paths.append(file_path)
-                    all_functions.extend(analysis_result["functions"])
-                    all_classes.extend(analysis_result["classes"])
-                    all_imports.update(analysis_result["imports"])
-                    total_py_lines += analysis_result["line_count"]
-                    parsed_files_count += 1
-                    # Store content if it's also an important file type
-                    if file_path in IMPORTANT_FILES:
-                        file_contents_for_framework_detection[file_path] = content
-
-        # Analyze Java files
-        for file_item in java_files_in_tree:
-            if parsed_files_count >= MAX_FILES_TO_PARSE:
-                break
-            file_path = file_item.get('path')
-            if not file_path:
-                continue
-            content = github_api.get_file_content(
-                owner, repo_name, file_path, default_branch, user_token)
-            if content:
-                analysis_result = code_parser.analyze_java_content(
-                    content, filename=file_path)
-                if analysis_result:
-                    analyzed_files_paths.append(file_path)
-                    all_functions.extend(analysis_result["functions"])
-                    all_classes.extend(analysis_result["classes"])
-                    all_imports.update(analysis_result["imports"])
-                    total_java_lines += analysis_result["line_count"]
-                    parsed_files_count += 1
-                    # Store Java files for framework detection
-                    file_contents_for_framework_detection[file_path] = content
-
-        # Fetch content for other important files (if not already fetched)
-        for file_item in other_important_files:
-            file_path = file_item.get('path')
-            if file_path and file_path not in file_contents_for_framework_detection:
-                content = github_api.get_file_content(
-                    owner, repo_name, file_path, default_branch, user_token)
-                if content:
-                    file_contents_for_framework_detection[file_path] = content
-
-        supabase_client.update_table_data(
-            task_id,
+        progress.update(
             {
-                "repo_url": repo_url,
                 "status": "PENDING",
-                "state": "Code analysis complete, aggregating results",
-                "result": None,
+                "state": f"Code analysis complete ({fetch_rate:.1f} files/s fetched), aggregating results",
                 "progress": 75,
-                "error": None,
             }
         )
 
         # Aggregate code analysis results
-        code_analysis_results = {
-            "files_analyzed_count": parsed_files_count,
-            "lines_analyzed_count": total_py_lines + total_java_lines,
-            "unique_classes": sorted(list(set(all_classes))),
-            "unique_functions": sorted(list(set(all_functions))),
-            "unique_imports": sorted(list(all_imports)),
-            "analyzed_files_list": analyzed_files_paths
-        }
-        print(f"[WALKTHROUGH][TASK {task_id}] In-memory code analysis complete. Parsed {parsed_files_count} files ({len(python_files_in_tree)} Python, {len(java_files_in_tree)} Java).")
+        code_analysis_results = collector.summary()
+        print(f"[WALKTHROUGH][TASK {task_id}] In-memory code analysis complete. Parsed {collector.parsed_files_count} files ({collector.python_files_count} Python, {collector.java_files_count} Java).")
         sys.stdout.flush()
 
         # --- 3b. Detect Frameworks ---
         print(
             f"[WALKTHROUGH][TASK {task_id}] Step 3b: Detecting frameworks...")
         sys.stdout.flush()
-        detected_frameworks = code_parser.detect_frameworks_from_files(
-            file_contents_for_framework_detection,
-            # imports=all_imports # Pass Python imports for better detection
-        )
+        detected_frameworks = collector.detected_frameworks()
 
-        supabase_client.update_table_data(
-            task_id,
+        progress.update(
             {
-                "repo_url": repo_url,
                 "status": "PENDING",
                 "state": "Framework detection complete, preparing commit info fetch",
-                "result": None,
                 "progress": 80,
-                "error": None,
             }
         )
 
@@ -296,18 +642,14 @@ def run_codelore_analysis(self, repo_url: str, user_token: str = None) -> Dict[s
         print(
             f"[WALKTHROUGH][TASK {task_id}] Step 4: Getting latest commit info...")
         sys.stdout.flush()
-        latest_commit_info = github_api.get_latest_commit_info(
-            owner, repo_name, default_branch, user_token)
+        latest_commit_info = github.get_latest_commit_info(
+            owner, repo_name, default_branch)
 
-        supabase_client.update_table_data(
-            task_id,
+        progress.update(
             {
-                "repo_url": repo_url,
                 "status": "PENDING",
                 "state": "Latest commit info fetched, preparing repo info fetch",
-                "result": None,
                 "progress": 85,
-                "error": None,
             }
         )
 
@@ -315,18 +657,14 @@ def run_codelore_analysis(self, repo_url: str, user_token: str = None) -> Dict[s
         print(
             f"[WALKTHROUGH][TASK {task_id}] Step 5: Getting general repo info...")
         sys.stdout.flush()
-        repo_info = github_api.get_repo_info(owner, repo_name, user_token)
+        repo_info = github.get_repo_info(owner, repo_name)
         title = repo_info.get("name", repo_name)  # Use repo name as title
 
-        supabase_client.update_table_data(
-            task_id,
+        progress.update(
             {
-                "repo_url": repo_url,
                 "status": "PENDING",
                 "state": "Repository info fetched, calculating file type distribution",
-                "result": None,
                 "progress": 90,
-                "error": None,
             }
         )
 
@@ -352,21 +690,26 @@ def run_codelore_analysis(self, repo_url: str, user_token: str = None) -> Dict[s
             'owner': owner,
             'repo_name': repo_name,
             'detected_frameworks': detected_frameworks,
+            'symbol_counts': collector.symbol_counts(),
         }
+        progress.update(
+            {
+                "status": "PENDING",
+                "state": "Generating narrative",
+                "progress": 92,
+            }
+        )
         narrative = llm_handler.generate_narrative(
-            narrative_input_data, repo_url)
+            narrative_input_data, repo_url,
+            on_chunk=progress.publish_narrative if settings.NARRATIVE_STREAMING_ENABLED else None)
         print(f"[WALKTHROUGH][TASK {task_id}] Narrative generation complete.")
         sys.stdout.flush()
 
-        supabase_client.update_table_data(
-            task_id,
+        progress.update(
             {
-                "repo_url": repo_url,
                 "status": "PENDING",
                 "state": "Narrative generated, preparing to save final result",
-                "result": None,
                 "progress": 95,
-                "error": None,
             }
         )
 
@@ -380,25 +723,33 @@ def run_codelore_analysis(self, repo_url: str, user_token: str = None) -> Dict[s
                 "code_analysis": code_analysis_results,
             },
             "task_id": task_id,
+            "commit_key": commit_key,
             "repo_tree": repo_tree,
             "file_type_distribution": file_type_distribution,
             "title": title,
             "repo_info": repo_info,
             "detected_frameworks": detected_frameworks,
-
+            # Per-file parse records, used to re-analyze only the diff on the next run
+            "file_results": collector.file_results,
+            "parser_version": code_parser.PARSER_VERSION,
+            "analyzed_at": datetime.now(timezone.utc).isoformat(),
         }
 
         print(
-            f"[WALKTHROUGH][TASK {task_id}] Analysis completed successfully. Saving final result to Supabase.")
+            f"[WALKTHROUGH][TASK {task_id}] Analysis completed successfully. Saving final result to Supabase ({progress.writes} progress writes for {progress.updates} updates).")
+        print(
+            f"[WALKTHROUGH][TASK {task_id}] GitHub rate limit budget: {rate_limiter.github_rate_limiter.get_metrics().get(github.token_key)}")
         sys.stdout.flush()
+        worker_metrics.metrics_publisher.publish_now()
+        # Heavy parts go to the artifacts table first, so they exist once SUCCESS is visible
+        stored_result = result_artifacts.store_result_artifacts(
+            task_id, final_result_payload)
         # Save all data in a single call with the final SUCCESS state
-        save_response = supabase_client.update_table_data(
-            task_id,
+        save_response = progress.finish(
             {
-                "repo_url": repo_url,
                 "status": "SUCCESS",
                 "state": "Analysis finished, all steps complete",
-                "result": final_result_payload,
+                "result": stored_result,
                 "progress": 100,
                 "error": None,
             }
@@ -409,10 +760,14 @@ def run_codelore_analysis(self, repo_url: str, user_token: str = None) -> Dict[s
                 f"[WALKTHROUGH][TASK {task_id}] WARNING: Failed to save final result to Supabase.")
             logger.warning(
                 f"Task {task_id} completed but failed to save final result to Supabase.")
+        else:
+            schedule_analysis_artifacts(task_id)
 
         return {"status": "SUCCESS", "task_id": task_id, "message": "Analysis complete. Result stored."}
 
     # --- Centralized Error Handling ---
+    except Retry:
+        raise  # Requeued while an identical analysis runs; not a failure
     except (requests.exceptions.RequestException, ValueError, RuntimeError) as e:
         error_type_name = type(e).__name__
         error_message = str(e)
@@ -421,8 +776,7 @@ def run_codelore_analysis(self, repo_url: str, user_token: str = None) -> Dict[s
         sys.stdout.flush()
         logger.error(
             f"[{task_id}] Task failed for URL {repo_url} with expected error: {e}", exc_info=True)
-        supabase_client.update_analysis_status(
-            task_id, 'FAILURE', error_message)
+        progress.fail(error_message)
         raise e  # Re-raise for Celery
     except Exception as e:
         error_type_name = type(e).__name__
@@ -432,8 +786,7 @@ def run_codelore_analysis(self, repo_url: str, user_token: str = None) -> Dict[s
         sys.stdout.flush()
         logger.error(
             f"[{task_id}] Task failed unexpectedly for URL {repo_url}: {e}", exc_info=True)
-        supabase_client.update_analysis_status(
-            task_id, 'FAILURE', 'An unexpected server error occurred during analysis.')
+        progress.fail('An unexpected server error occurred during analysis.')
         raise e  # Re-raise for Celery
 
 
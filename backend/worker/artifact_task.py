@@ -0,0 +1,59 @@
+# worker/artifact_task.py
+import sys
+import logging
+from typing import Dict, Any, List, Optional
+
+from celery import shared_task
+
+import supabase_client
+from config.config import settings
+from services import derived_artifacts, result_artifacts
+
+logger = logging.getLogger(__name__)
+
+print("[WALKTHROUGH] worker/artifact_task.py: Loading...")
+sys.stdout.flush()
+
+
+@shared_task(bind=True, ignore_result=True)
+def generate_analysis_artifacts(self, task_id: str, kinds: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Post-analysis stage: renders the graphs and UML diagrams of a finished analysis once
+    and stores them (see services/derived_artifacts.py), so the API only serves bytes.
+    Failures are logged, never retried; the API generates on demand as a fallback.
+    """
+    kinds = kinds or settings.PRECOMPUTE_ARTIFACTS
+    print(f"[WALKTHROUGH][ARTIFACTS {task_id}] Rendering {', '.join(kinds)}...")
+    sys.stdout.flush()
+    try:
+        response = supabase_client.get_analysis_data(task_id)
+        if not response or not response.data or response.data[0].get("status") != "SUCCESS":
+            print(f"[WALKTHROUGH][ARTIFACTS {task_id}] No successful analysis found, skipping.")
+            sys.stdout.flush()
+            return {"status": "SKIPPED", "task_id": task_id}
+        analysis_data = result_artifacts.load_result_artifacts(
+            response.data[0].get("result") or {}, derived_artifacts.REQUIRED_RESULT_ARTIFACTS)
+        outcome = derived_artifacts.precompute(analysis_data, kinds)
+    except Exception as e:
+        print(f"[WALKTHROUGH][ARTIFACTS {task_id}] ERROR rendering artifacts: {e}")
+        sys.stdout.flush()
+        logger.error(f"[{task_id}] Artifact rendering failed: {e}", exc_info=True)
+        return {"status": "FAILURE", "task_id": task_id, "error": str(e)}
+    print(f"[WALKTHROUGH][ARTIFACTS {task_id}] Done: {outcome}")
+    sys.stdout.flush()
+    return {"status": "SUCCESS", "task_id": task_id, "stored": outcome}
+
+
+def schedule_analysis_artifacts(task_id: str) -> None:
+    """ Queues the post-analysis stage if enabled. Never raises: the API can render on demand. """
+    if not settings.PRECOMPUTE_ARTIFACTS or not settings.DERIVED_ARTIFACTS_ENABLED:
+        return
+    try:
+        generate_analysis_artifacts.apply_async(args=[task_id, settings.PRECOMPUTE_ARTIFACTS])
+    except Exception as e:
+        print(f"[WALKTHROUGH][TASK {task_id}] WARNING: Could not queue artifact rendering: {e}")
+        sys.stdout.flush()
+
+
+print("[WALKTHROUGH] worker/artifact_task.py: Finished loading.")
+sys.stdout.flush()
@@ -15,7 +15,7 @@ celery = Celery(
     'codelore',
     broker=settings.CELERY_BROKER_URL, # Read from settings
     backend=settings.CELERY_RESULT_BACKEND, # Read from settings
-    include=['worker.analysis_task']
+    include=['worker.analysis_task', 'worker.artifact_task']
 )
 # ----------------------------------------------------
 
@@ -0,0 +1,241 @@
+# worker/progress.py
+import sys
+import time
+import threading
+from typing import Dict, Any, Callable, List, Optional
+
+import supabase_client
+from config.config import settings
+from services import pubsub
+
+print("[WALKTHROUGH] worker/progress.py: Loading...")
+sys.stdout.flush()
+
+_MISSING = object()
+# Columns mirrored into the live progress events (see services/pubsub.py)
+EVENT_COLUMNS = ("status", "state", "progress", "error")
+TERMINAL_STATUSES = ("SUCCESS", "FAILURE")
+
+
+def heartbeat_timestamp(seconds: Optional[float] = None) -> str:
+    """ UTC time as a fixed-width ISO string, so stored heartbeats compare correctly as text. """
+    seconds = time.time() if seconds is None else seconds
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + f".{int(seconds % 1 * 1000):03d}Z"
+
+
+class ProgressReporter:
+    """
+    Buffers progress updates for one analysis row and writes them to Supabase from a
+    background thread, so the fetch/parse stages never wait on a round trip.
+
+    - update() only records the columns whose value differs from what was last written.
+    - Pending changes are coalesced into at most one write per `interval` seconds.
+    - Status/state/progress changes are also published on the task's pub/sub channel,
+      at most once per `publish_interval` seconds, for clients streaming progress.
+      publish_narrative() sends the narrative text there as it is generated.
+    - flush() writes synchronously; use it for values other tasks rely on and for
+      terminal states (finish() and fail() also stop the background thread first).
+    - advertise() stores a result stub that is rewritten with a fresh "heartbeat_at"
+      while the reporter runs, so other tasks can tell a live run from a dead worker's.
+    """
+
+    def __init__(self, task_id: str, interval: Optional[float] = None,
+                 writer: Optional[Callable[[str, Dict[str, Any]], Any]] = None,
+                 publish_interval: Optional[float] = None):
+        self.task_id = task_id
+        self.interval = settings.PROGRESS_WRITE_INTERVAL_SECONDS if interval is None else interval
+        self.publish_interval = settings.PROGRESS_PUBLISH_INTERVAL_SECONDS if publish_interval is None else publish_interval
+        self._writer = writer or supabase_client.update_table_data
+        self._channel = pubsub.progress_channel(task_id)
+        self._written: Dict[str, Any] = {}
+        self._pending: Dict[str, Any] = {}
+        self._event: Dict[str, Any] = {}
+        self._published_event: Dict[str, Any] = {}
+        self._lock = threading.Lock()  # Guards everything above
+        self._write_lock = threading.Lock()  # Keeps writes in order
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._last_write_at = 0.0
+        self._last_publish_at = 0.0
+        self.updates = 0
+        self.writes = 0
+        self.events = 0
+        self._narrative: List[str] = []
+        self._advertised: Optional[Dict[str, Any]] = None
+        self._heartbeat_interval = 0.0
+        self._last_heartbeat_at = 0.0
+
+    def update(self, columns: Dict[str, Any]) -> None:
+        """ Records new column values; returns immediately. """
+        with self._lock:
+            if self._closed:
+                return
+            self.updates += 1
+            for column, value in columns.items():
+                if self._written.get(column, _MISSING) == value:
+                    self._pending.pop(column, None)
+                else:
+                    self._pending[column] = value
+                if column in EVENT_COLUMNS:
+                    self._event[column] = value
+            if not self._pending and self._event == self._published_event:
+                return
+            self._start_thread()
+        self._wakeup.set()
+
+    def _start_thread(self) -> None:
+        # Caller holds _lock
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name=f"progress-{self.task_id}", daemon=True)
+            self._thread.start()
+
+    def advertise(self, result: Dict[str, Any], heartbeat_interval: float):
+        """
+        Writes `result` with a "heartbeat_at" timestamp now, then rewrites it every
+        `heartbeat_interval` seconds until the reporter stops. Returns the Supabase response.
+        """
+        response = self.flush({"result": dict(result, heartbeat_at=heartbeat_timestamp())})
+        with self._lock:
+            self._advertised = dict(result)
+            self._heartbeat_interval = heartbeat_interval
+            self._last_heartbeat_at = time.monotonic()
+            if not self._closed:
+                self._start_thread()
+        self._wakeup.set()
+        return response
+
+    def flush(self, columns: Optional[Dict[str, Any]] = None):
+        """
+        Writes pending changes (plus `columns`) now and returns the Supabase response,
+        or None if nothing changed. Errors are raised to the caller.
+        """
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                pending.update(columns or {})
+                self._event.update({column: value for column, value in pending.items()
+                                    if column in EVENT_COLUMNS})
+            response = self._write(pending)
+        self._publish()
+        return response
+
+    def publish_narrative(self, delta: str) -> None:
+        """
+        Publishes a piece of the narrative being generated on the task's channel, for clients
+        streaming progress. Events carry the new text and the whole text so far, so clients
+        that join late or miss an event still show everything. Nothing is written to Supabase:
+        the narrative is only stored with the final result.
+        """
+        with self._lock:
+            self._narrative.append(delta)
+            event = {"type": "narrative", "task_id": self.task_id, "seq": len(self._narrative),
+                     "delta": delta, "text": "".join(self._narrative)}
+        pubsub.publish(self._channel, event)
+
+    def finish(self, columns: Dict[str, Any]):
+        """ Stops background writes and writes the terminal state synchronously. """
+        self._stop()
+        return self.flush(columns)
+
+    def fail(self, error: str):
+        """ Discards pending progress and records the task as failed. """
+        self.close(flush=False)
+        response = supabase_client.update_analysis_status(self.task_id, 'FAILURE', error)
+        with self._lock:
+            self._event.update({"status": "FAILURE", "error": error})
+        self._publish()
+        return response
+
+    def close(self, flush: bool = True) -> None:
+        """ Stops background writes, writing or discarding whatever is still pending. """
+        self._stop()
+        if flush:
+            self.flush()
+        else:
+            with self._lock:
+                self._pending = {}
+
+    def _stop(self) -> None:
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        self._wakeup.set()
+        if thread is not None:
+            thread.join()
+
+    def _write(self, columns: Dict[str, Any]):
+        # Caller holds _write_lock
+        columns = {column: value for column, value in columns.items()
+                   if self._written.get(column, _MISSING) != value}
+        if not columns:
+            return None
+        response = self._writer(self.task_id, columns)
+        with self._lock:
+            self._written.update(columns)
+            self._last_write_at = time.monotonic()
+            self.writes += 1
+        return response
+
+    def _publish(self) -> None:
+        with self._lock:
+            if self._event == self._published_event:
+                return
+            self._published_event = dict(self._event)
+            self._last_publish_at = time.monotonic()
+            self.events += 1
+            event = dict(self._event, task_id=self.task_id)
+        event["done"] = event.get("status") in TERMINAL_STATUSES
+        pubsub.publish(self._channel, event)
+
+    def _next_timeout(self) -> Optional[float]:
+        # Caller holds _lock. Seconds until something is due, or None to wait for update()
+        now = time.monotonic()
+        deadlines = []
+        if self._pending:
+            deadlines.append(self._last_write_at + self.interval)
+        if self._event != self._published_event:
+            deadlines.append(self._last_publish_at + self.publish_interval)
+        if self._advertised is not None:
+            deadlines.append(self._last_heartbeat_at + self._heartbeat_interval)
+        return max(min(deadlines) - now, 0.0) if deadlines else None
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                timeout = self._next_timeout()
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            with self._lock:
+                if self._closed:
+                    return  # close()/finish()/fail() decide what happens to pending changes
+                now = time.monotonic()
+                if self._advertised is not None and now >= self._last_heartbeat_at + self._heartbeat_interval:
+                    self._pending["result"] = dict(self._advertised, heartbeat_at=heartbeat_timestamp())
+                    self._last_heartbeat_at = now
+                publish_due = now >= self._last_publish_at + self.publish_interval
+                write_due = bool(self._pending) and now >= self._last_write_at + self.interval
+            if publish_due:
+                self._publish()
+            if not write_due:
+                continue
+            with self._write_lock:
+                with self._lock:
+                    if self._closed:
+                        return
+                    pending, self._pending = self._pending, {}
+                try:
+                    self._write(pending)
+                except Exception as e:
+                    # Progress is best effort; keep the changes for the next attempt
+                    print(
+                        f"[WALKTHROUGH][TASK {self.task_id}] WARNING: Progress update failed: {e}")
+                    sys.stdout.flush()
+                    with self._lock:
+                        self._pending = {**pending, **self._pending}
+                        self._last_write_at = time.monotonic()
+
+
+print("[WALKTHROUGH] worker/progress.py: Finished loading.")
+sys.stdout.flush()
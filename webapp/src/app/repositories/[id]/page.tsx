@@ -42,9 +42,12 @@ export default function RepositoryPage() {
   const id = params.id as string;
 
   const [repository, setRepository] = useState<Repository | null>(null);
+  const [fullResult, setFullResult] = useState<any>(null);
   const [error, setError] = useState<string | null>(null);
   const [copied, setCopied] = useState(false);
   const [showTooltip, setShowTooltip] = useState(false);
+  // Narrative text streamed by the worker while it is being generated
+  const [narrativePreview, setNarrativePreview] = useState<string>('');
 
   useEffect(() => {
     if (id) {
@@ -92,6 +95,41 @@ export default function RepositoryPage() {
     }
   }, [id]);
 
+  // Large parts of the result (file tree, code lists) are stored as separate artifacts;
+  // the API puts them back together once the analysis has finished.
+  const isComplete = !!repository?.result && repository.status.toLocaleLowerCase() === 'success' && repository.progress === 100;
+  useEffect(() => {
+    if (!isComplete || !repository?.result?.artifacts) {
+      setFullResult(null);
+      return;
+    }
+    const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
+    fetch(`${apiUrl}/result/${id}`)
+      .then((response) => {
+        if (!response.ok) throw new Error(`Failed to load analysis result (${response.status})`);
+        return response.json();
+      })
+      .then((data) => setFullResult(data.result))
+      .catch((err: any) => setError(err.message));
+  }, [id, isComplete, repository?.result?.artifacts]);
+
+  // While the analysis runs, the API relays the narrative as Gemini writes it
+  const isRunning = !!repository && !['success', 'failure'].includes(repository.status.toLowerCase());
+  useEffect(() => {
+    if (!id || !isRunning) return;
+    const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
+    const source = new EventSource(`${apiUrl}/result/${id}/stream`);
+    source.addEventListener('narrative', (event) => {
+      // Each event carries the whole text so far
+      setNarrativePreview(JSON.parse((event as MessageEvent).data).text || '');
+    });
+    source.addEventListener('progress', (event) => {
+      if (JSON.parse((event as MessageEvent).data).done) source.close();
+    });
+    source.onerror = () => source.close();
+    return () => source.close();
+  }, [id, isRunning]);
+
   // Copy to clipboard handler
   const handleCopy = (text: string) => {
     navigator.clipboard.writeText(text);
@@ -107,9 +145,9 @@ export default function RepositoryPage() {
 
   console.log(repository)
   // Main render logic
-  if (repository?.result && repository.status.toLocaleLowerCase() === 'success' && repository.progress === 100) {
+  if (isComplete && (!repository?.result?.artifacts || fullResult)) {
     return (
-      <EnhancedRepositoryDetail data={repository?.result} />
+      <EnhancedRepositoryDetail data={fullResult || repository?.result} />
     );
   }
 
@@ -273,6 +311,23 @@ export default function RepositoryPage() {
           </div>
         </div>
 
+        {narrativePreview && (
+          <motion.div
+            initial={{ opacity: 0, y: 10 }}
+            animate={{ opacity: 1, y: 0 }}
+            className="bg-white rounded-2xl shadow-md p-8"
+          >
+            <h2 className="text-lg font-semibold text-gray-800 mb-3 flex items-center">
+              <FileText className="w-5 h-5 mr-2 text-indigo-500" />
+              Writing the story...
+            </h2>
+            {/* Drop a tag cut off mid-stream until the rest of it arrives */}
+            <div
+              className="prose max-w-none text-gray-700 leading-relaxed"
+              dangerouslySetInnerHTML={{ __html: narrativePreview.replace(/<[^>]*$/, '') }}
+            />
+          </motion.div>
+        )}
       </motion.div>
     </div>
   );
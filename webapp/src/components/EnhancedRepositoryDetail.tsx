@@ -3,7 +3,6 @@
 import React, { useState } from 'react';
 import Image from 'next/image';
 import Link from 'next/link';
-import axios from 'axios';
 
 // Import tab components
 import OverviewTab from './tabs/OverviewTab';
@@ -48,75 +47,77 @@ const EnhancedRepositoryDetail: React.FC<EnhancedRepositoryDetailProps> = ({ dat
     });
   };
 
-  // Function to fetch component details from the API
-  const fetchComponentDetails = async (name: string, type: 'class' | 'function') => {
-    // Create a state updater based on the component type
-    const updateState = type === 'class'
-      ? (updater: (prev: Record<string, ComponentDetails>) => Record<string, ComponentDetails>) => setClassDetails(updater)
-      : (updater: (prev: Record<string, ComponentDetails>) => Record<string, ComponentDetails>) => setFunctionDetails(updater);
+  // Components whose details are requested together with the one the user opens
+  const BATCH_PREFETCH = 10;
 
-    // Set loading state
-    updateState(prev => ({
-      ...prev,
-      [name]: {
-        description: '',
-        usages: [],
-        loading: true,
-        error: null
+  // Fetches several components in one request; descriptions stream back as Server-Sent
+  // Events as soon as each batch of Gemini output is ready
+  const fetchComponentDetailsBatch = async (names: string[], type: 'class' | 'function') => {
+    const updateState = type === 'class' ? setClassDetails : setFunctionDetails;
+    updateState(prev => {
+      const next = { ...prev };
+      for (const name of names) {
+        next[name] = { description: '', usages: [], loading: true, error: null };
       }
-    }));
-
-
-
-    console.log("process.env.NEXT_PUBLIC_API_URL : ",process.env.NEXT_PUBLIC_API_URL )
-    console.log("process.env.NEXT_PUBLIC_APP_URL : ",process.env.NEXT_PUBLIC_APP_URL )
+      return next;
+    });
 
+    const pending = new Set(names);
     try {
-      // Make API call to get component details
-      const response = await axios.post(`${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'}/component-details`,
-        {
-          component_name: name,
-          component_type: type,
+      const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'}/component-details/batch`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify({
           repo_url: data.analysis_details.repo_url,
+          components: names.map(name => ({ component_name: name, component_type: type })),
           context: {
             imports: data.analysis_details.code_analysis.unique_imports,
-            file_path: data.analysis_details.code_analysis.analyzed_files_list[0],
-            narrative: data.narrative,
-            topics: data.repo_info?.topics,
             detected_frameworks: data.detected_frameworks
           }
-        },
-        {
-          headers: {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-          },
-        }
-      );
-
-      console.log("API Response:", response.data);
-      
-      // Update state with the response data, preserving the full structure
-      updateState(prev => ({
-        ...prev,
-        [name]: {
-          ...response.data,  // This now includes all fields (description, usages, purpose, etc.)
-          loading: false,
-          error: null
+        }),
+      });
+      if (!response.ok || !response.body) {
+        throw new Error(`Component details request failed with status ${response.status}`);
+      }
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop() || '';
+        for (const frame of frames) {
+          const event = frame.match(/^event: (.*)$/m)?.[1];
+          const payload = frame.match(/^data: (.*)$/m)?.[1];
+          if (event !== 'component' || !payload) continue;
+          const message = JSON.parse(payload);
+          pending.delete(message.component_name);
+          updateState(prev => ({
+            ...prev,
+            [message.component_name]: { ...message.result, loading: false, error: null }
+          }));
         }
-      }));
+      }
+      if (pending.size > 0) throw new Error('Some component details were not returned');
     } catch (error) {
       console.error(`Error fetching ${type} details:`, error);
-      // Update state with error
-      updateState(prev => ({
-        ...prev,
-        [name]: {
-          description: '',
-          usages: [],
-          loading: false,
-          error: error instanceof Error ? error.message : 'Failed to fetch component details'
+      updateState(prev => {
+        const next = { ...prev };
+        for (const name of Array.from(pending)) {
+          next[name] = {
+            description: '',
+            usages: [],
+            loading: false,
+            error: error instanceof Error ? error.message : 'Failed to fetch component details'
+          };
         }
-      }));
+        return next;
+      });
     }
   };
 
@@ -129,7 +130,14 @@ const EnhancedRepositoryDetail: React.FC<EnhancedRepositoryDetailProps> = ({ dat
       const existingDetails = type === 'class' ? classDetails[name] : functionDetails[name];
 
       if (!existingDetails || (!existingDetails.loading && !existingDetails.description && !existingDetails.error)) {
-        fetchComponentDetails(name, type);
+        // Also fetch the next components of the same list, which the user is likely to open next
+        const loaded = type === 'class' ? classDetails : functionDetails;
+        const names = (type === 'class'
+          ? data.analysis_details.code_analysis.unique_classes
+          : data.analysis_details.code_analysis.unique_functions) || [];
+        const start = names.indexOf(name);
+        const batch = [name, ...names.slice(start + 1).filter(other => !loaded[other])].slice(0, BATCH_PREFETCH);
+        fetchComponentDetailsBatch(start >= 0 ? batch : [name], type);
       }
     }
   };
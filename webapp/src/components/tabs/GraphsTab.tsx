@@ -36,6 +36,16 @@ interface UmlData {
         format: string;
         encoding: string;
         uml_code: string;
+        class_count?: number;
+        truncated?: boolean;
+        // Per package cluster, for repositories too large for one diagram
+        diagrams?: {
+            title: string;
+            class_count: number;
+            image: string;
+            format: string;
+            uml_code: string;
+        }[];
     };
     sequence_diagram?: {
         image: string;
@@ -52,6 +62,10 @@ interface UmlData {
     error?: string;
 }
 
+// PlantUML diagrams may be rendered as SVG, whose MIME type is image/svg+xml
+const imageSrc = (image: { image: string; format: string }) =>
+    `data:image/${image.format === 'svg' ? 'svg+xml' : image.format};base64,${image.image}`;
+
 const GraphsTab: React.FC<GraphsTabProps> = ({ data }: any) => {
     const [graphData, setGraphData] = useState<GraphData | null>(null);
     const [umlData, setUmlData] = useState<UmlData | null>(null);
@@ -90,33 +104,65 @@ const GraphsTab: React.FC<GraphsTabProps> = ({ data }: any) => {
                 );
 
                 setGraphData(graphResponse.data);
+            } catch (err) {
+                console.error('Error fetching graph data:', err);
+                setError('Failed to load graph visualizations. Please try again later.');
+            } finally {
+                setIsLoading(false);
+            }
+        };
 
-                // Fetch UML diagrams
-                const umlResponse = await axios.post(
-                    `${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'}/repo-uml`,
-                    {
-                        repo_url: data.analysis_details.repo_url,
-                        task_id: data.task_id,
-                    },
+        // UML diagrams arrive one by one as Server-Sent Events, each shown as soon as it is ready
+        const streamUml = async () => {
+            try {
+                setUmlData({});
+                const response = await fetch(
+                    `${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'}/repo-uml/stream`,
                     {
+                        method: 'POST',
                         headers: {
                             'Content-Type': 'application/json',
-                            'Accept': 'application/json',
+                            'Accept': 'text/event-stream',
                         },
+                        body: JSON.stringify({
+                            repo_url: data.analysis_details.repo_url,
+                            task_id: data.task_id,
+                        }),
                     }
                 );
-
-                setUmlData(umlResponse.data);
+                if (!response.ok || !response.body) {
+                    throw new Error(`UML stream failed with status ${response.status}`);
+                }
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const frames = buffer.split('\n\n');
+                    buffer = frames.pop() || '';
+                    for (const frame of frames) {
+                        const event = frame.match(/^event: (.*)$/m)?.[1];
+                        const payload = frame.match(/^data: (.*)$/m)?.[1];
+                        if (!payload) continue;
+                        const message = JSON.parse(payload);
+                        if (event === 'diagram') {
+                            setUmlData(prev => ({ ...prev, [message.name]: message.diagram }));
+                        } else if (event === 'error') {
+                            setUmlData(prev => ({ ...prev, error: message.error }));
+                        }
+                    }
+                }
             } catch (err) {
-                console.error('Error fetching graph data:', err);
-                setError('Failed to load graph visualizations. Please try again later.');
-            } finally {
-                setIsLoading(false);
+                console.error('Error streaming UML diagrams:', err);
+                setUmlData(prev => ({ ...prev, error: 'Failed to load UML diagrams.' }));
             }
         };
 
         if (data.task_id) {
             fetchGraphs();
+            streamUml();
         }
     }, [data.task_id, data.analysis_details.repo_url]);
 
@@ -268,14 +314,32 @@ const GraphsTab: React.FC<GraphsTabProps> = ({ data }: any) => {
 
                                             <div className="bg-gray-50 rounded-lg p-4 flex flex-col items-center">
                                                 <img
-                                                    src={`data:image/${umlData.class_diagram.format};base64,${umlData.class_diagram.image}`}
+                                                    src={imageSrc(umlData.class_diagram)}
                                                     alt="UML Class Diagram"
                                                     className="max-w-full h-auto rounded-lg shadow-md"
                                                 />
                                                 <p className="mt-4 text-sm text-gray-600">
-                                                    This UML class diagram shows the classes and their relationships in the repository.
+                                                    {umlData.class_diagram.diagrams && umlData.class_diagram.diagrams.length > 0
+                                                        ? `This overview groups the repository's ${umlData.class_diagram.class_count} classes into packages; each group is shown in detail below.`
+                                                        : 'This UML class diagram shows the classes and their relationships in the repository.'}
                                                 </p>
 
+                                                {umlData.class_diagram.diagrams?.map((diagram) => (
+                                                    <div key={diagram.title} className="mt-6 w-full flex flex-col items-center">
+                                                        <h4 className="text-md font-semibold mb-2 text-gray-700">
+                                                            {diagram.title} ({diagram.class_count} classes)
+                                                        </h4>
+                                                        <img
+                                                            src={imageSrc(diagram)}
+                                                            alt={`UML Class Diagram: ${diagram.title}`}
+                                                            className="max-w-full h-auto rounded-lg shadow-md"
+                                                        />
+                                                    </div>
+                                                ))}
+                                                {umlData.class_diagram.truncated && (
+                                                    <p className="mt-4 text-sm text-gray-600">Only the largest package groups are shown in detail.</p>
+                                                )}
+
                                                 {/* PlantUML Code */}
                                                 {showCode.class_diagram && (
                                                     <div className="mt-4 w-full">
@@ -306,7 +370,7 @@ const GraphsTab: React.FC<GraphsTabProps> = ({ data }: any) => {
 
                                             <div className="bg-gray-50 rounded-lg p-4 flex flex-col items-center">
                                                 <img
-                                                    src={`data:image/${umlData.sequence_diagram.format};base64,${umlData.sequence_diagram.image}`}
+                                                    src={imageSrc(umlData.sequence_diagram)}
                                                     alt="UML Sequence Diagram"
                                                     className="max-w-full h-auto rounded-lg shadow-md"
                                                 />
@@ -344,7 +408,7 @@ const GraphsTab: React.FC<GraphsTabProps> = ({ data }: any) => {
 
                                             <div className="bg-gray-50 rounded-lg p-4 flex flex-col items-center">
                                                 <img
-                                                    src={`data:image/${umlData.activity_diagram.format};base64,${umlData.activity_diagram.image}`}
+                                                    src={imageSrc(umlData.activity_diagram)}
                                                     alt="UML Activity Diagram"
                                                     className="max-w-full h-auto rounded-lg shadow-md"
                                                 />